@@ -0,0 +1,117 @@
+# admission.py - Controle de admissão e descarte de carga do webhook
+#
+# As mensagens aceitas pelo webhook vão para um pool dedicado com no máximo
+# MAX_INFLIGHT_MESSAGES execuções simultâneas e MESSAGE_QUEUE_CAPACITY
+# aguardando. Acima disso a mensagem é recusada e o webhook descarta a carga
+# conforme SHED_MODE:
+#   retry  -> responde 503 com Retry-After; a Meta reentrega mais tarde (padrão)
+#   reply  -> responde 200 e avisa o usuário que estamos sobrecarregados
+#
+# Uma mensagem aceita já recebeu 200 e não será reentregue pela Meta. Por isso
+# a fila padrão só comporta o que dá para drenar em SHUTDOWN_DRAIN_TIMEOUT
+# (dentro do graceful_timeout do gunicorn), e a partir do início do
+# desligamento toda mensagem nova recebe 503 para ir a outro worker. O que
+# ainda assim não terminar a tempo é registrado no log e contado em
+# mensagens_perdidas_desligamento.
+
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+
+MAX_INFLIGHT_MESSAGES = int(os.getenv("MAX_INFLIGHT_MESSAGES", "8"))
+# Quanto tempo (s) o desligamento espera a fila esvaziar; menor que o graceful_timeout do gunicorn
+SHUTDOWN_DRAIN_TIMEOUT = float(os.getenv("SHUTDOWN_DRAIN_TIMEOUT", "25"))
+# Tempo típico (s) de uma mensagem (chamada à IA + Calendar + envio), usado no tamanho padrão da fila
+MESSAGE_EXPECTED_SECONDS = float(os.getenv("MESSAGE_EXPECTED_SECONDS", "8"))
+# Padrão: o que as MAX_INFLIGHT_MESSAGES execuções conseguem drenar dentro de SHUTDOWN_DRAIN_TIMEOUT
+MESSAGE_QUEUE_CAPACITY = int(os.getenv(
+    "MESSAGE_QUEUE_CAPACITY",
+    MAX_INFLIGHT_MESSAGES * max(0, int(SHUTDOWN_DRAIN_TIMEOUT // MESSAGE_EXPECTED_SECONDS) - 1),
+))
+SHED_MODE = os.getenv("SHED_MODE", "retry")
+SHED_RETRY_AFTER = int(os.getenv("SHED_RETRY_AFTER", "30"))
+MENSAGEM_SOBRECARGA = os.getenv(
+    "SHED_REPLY_MESSAGE",
+    "Estou sobrecarregada no momento 😅 Pode me mandar de novo em alguns minutos?",
+)
+
+
+class AdmissionController:
+    """Pool limitado de execução com fila de capacidade fixa."""
+
+    def __init__(self, max_inflight: int, queue_capacity: int):
+        self.max_inflight = max_inflight
+        self.queue_capacity = queue_capacity
+        self._executor = ThreadPoolExecutor(max_workers=max_inflight, thread_name_prefix="mensagem")
+        self._lock = threading.Lock()
+        self._ocioso = threading.Condition(self._lock)
+        self._aceitas = 0       # na fila + em execução
+        self._em_execucao = 0
+        self._descartadas = 0
+        self.encerrando = False
+
+    def submit(self, fn, *args) -> bool:
+        """Enfileira fn(*args); devolve False (sem enfileirar) se estiver saturado ou encerrando."""
+        with self._lock:
+            if self.encerrando or self._aceitas >= self.max_inflight + self.queue_capacity:
+                self._descartadas += 1
+                metrics.incr("mensagens_descartadas")
+                return False
+            self._aceitas += 1
+        self._executor.submit(self._run, fn, args, time.perf_counter())
+        return True
+
+    def _run(self, fn, args, enfileirada_em: float):
+        inicio = time.perf_counter()
+        metrics.observe("fila", inicio - enfileirada_em)
+        with self._lock:
+            self._em_execucao += 1
+        try:
+            fn(*args)
+        except Exception as e:
+            print(f"LOG (Admissão): Erro não tratado no processamento: {e}", flush=True)
+        finally:
+            metrics.observe("mensagem_total", time.perf_counter() - enfileirada_em)
+            with self._lock:
+                self._em_execucao -= 1
+                self._aceitas -= 1
+                if self._aceitas == 0:
+                    self._ocioso.notify_all()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "em_execucao": self._em_execucao,
+                "na_fila": self._aceitas - self._em_execucao,
+                "limite_execucao": self.max_inflight,
+                "capacidade_fila": self.queue_capacity,
+                "ocupacao": round(self._aceitas / (self.max_inflight + self.queue_capacity), 3),
+                "descartadas": self._descartadas,
+                "encerrando": self.encerrando,
+            }
+
+    def wait_idle(self, timeout: float = None) -> bool:
+        """Espera a fila esvaziar (usado no desligamento e nos benchmarks)."""
+        with self._lock:
+            return self._ocioso.wait_for(lambda: self._aceitas == 0, timeout)
+
+    def shutdown(self, timeout: float = None):
+        """Para de aceitar mensagens, espera a fila drenar e registra o que ficou para trás."""
+        with self._lock:
+            self.encerrando = True
+            pendentes = self._aceitas
+        print(f"LOG (Admissão): Encerrando; drenando {pendentes} mensagem(ns) aceita(s).", flush=True)
+        if not self.wait_idle(timeout):
+            with self._lock:
+                perdidas, em_execucao = self._aceitas, self._em_execucao
+            metrics.incr("mensagens_perdidas_desligamento", perdidas)
+            print(f"LOG (Admissão): {perdidas} mensagem(ns) já confirmada(s) à Meta não terminaram "
+                  f"em {timeout}s ({em_execucao} em execução) e serão perdidas.", flush=True)
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+controller = AdmissionController(MAX_INFLIGHT_MESSAGES, MESSAGE_QUEUE_CAPACITY)
+metrics.register_gauge("admissao", controller.stats)
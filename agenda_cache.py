@@ -0,0 +1,95 @@
+# agenda_cache.py - Cache read-through da agenda do dia
+#
+# O "consultar" de hoje/amanhã é a leitura mais frequente. As linhas da
+# agenda ficam em memória já renderizadas ("- ID 3: Reunião às 14:00"),
+# chaveadas por (usuário, dia), num LRU limitado a AGENDA_CACHE_MAX dias.
+#
+# database.create/update/delete_compromisso publicam no cache_bus (tópico
+# "agenda", chave = dia ISO) cada dia afetado, inclusive o dia antigo de um
+# reagendamento; o dia é descartado para todos os usuários deste e dos
+# demais workers. Chave None descarta tudo. Se um aviso se perder, a entrada
+# vence sozinha após cache_bus.CACHE_BUS_TTL segundos.
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, datetime
+
+import arquivamento
+import cache_bus
+import database
+import metrics
+
+AGENDA_CACHE_MAX = int(os.getenv("AGENDA_CACHE_MAX", "2048"))
+
+_cache = OrderedDict()  # (usuario, dia) -> (tuple[str], expira_em)
+_lock = threading.Lock()
+# Incrementada a cada invalidação: uma leitura iniciada antes dela não repovoa o cache
+_geracao = 0
+
+
+def linha(id_, titulo, data_hora: datetime) -> str:
+    """Linha de um compromisso na resposta do "consultar"."""
+    return f"- ID {id_}: {titulo} às {data_hora.strftime('%H:%M')}"
+
+
+def _invalidar(chave):
+    global _geracao
+    with _lock:
+        _geracao += 1
+        if chave is None:
+            _cache.clear()
+            return
+        dia = date.fromisoformat(chave)
+        for k in [k for k in _cache if k[1] == dia]:
+            del _cache[k]
+
+
+cache_bus.subscribe("agenda", _invalidar)
+
+
+def agenda_do_dia(db, dia: date, usuario: str = None) -> tuple:
+    """Linhas renderizadas da agenda do dia (usuario=None: todos), da memória ou do banco."""
+    chave = (usuario, dia)
+    with _lock:
+        entrada = _cache.get(chave)
+        if entrada is not None and entrada[1] > time.monotonic():
+            _cache.move_to_end(chave)
+            metrics.incr("agenda_cache_hits")
+            return entrada[0]
+        geracao = _geracao
+    metrics.incr("agenda_cache_misses")
+
+    # Dias antes do corte de retenção podem já ter ido para o arquivo
+    tabelas = [database.Compromisso]
+    if dia < arquivamento.corte():
+        tabelas.append(database.CompromissoArquivo)
+    inicio = datetime.combine(dia, datetime.min.time())
+    rows = []
+    for c in tabelas:
+        consulta = db.query(c.id, c.titulo, c.data_hora).filter(
+            c.data_hora >= inicio,
+            c.data_hora <= inicio.replace(hour=23, minute=59, second=59, microsecond=999999),
+        )
+        if usuario is not None:
+            consulta = consulta.filter(c.usuario == usuario)
+        rows.extend(consulta.order_by(c.data_hora))
+    if len(tabelas) > 1:
+        rows.sort(key=lambda row: row[2])
+    linhas = tuple(linha(*row) for row in rows)
+
+    with _lock:
+        if geracao == _geracao:
+            _cache[chave] = (linhas, time.monotonic() + cache_bus.CACHE_BUS_TTL)
+            while len(_cache) > AGENDA_CACHE_MAX:
+                _cache.popitem(last=False)
+    return linhas
+
+
+def stats() -> dict:
+    with _lock:
+        return {"dias": len(_cache), "limite": AGENDA_CACHE_MAX}
+
+
+metrics.register_gauge("agenda_cache", stats)
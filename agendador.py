@@ -0,0 +1,39 @@
+# agendador.py - Jobs diários dentro do processo do app
+#
+# Cada job roda numa thread daemon que dorme até o horário configurado
+# (horário de Brasília). Com vários workers/instâncias, o próprio job deve
+# pegar um lock exclusivo (database.advisory_lock) antes de trabalhar.
+
+import threading
+import time
+from datetime import datetime, timedelta
+
+from pytz import timezone
+
+TZ = timezone('America/Sao_Paulo')
+
+_threads = {}  # nome -> Thread
+
+
+def proxima_execucao(hora: str, agora: datetime) -> datetime:
+    """Próximo instante HH:MM a partir de agora (hoje, se ainda não passou; senão amanhã)."""
+    hh, mm = (int(x) for x in hora.split(":"))
+    alvo = agora.replace(hour=hh, minute=mm, second=0, microsecond=0)
+    return alvo if alvo > agora else alvo + timedelta(days=1)
+
+
+def _loop(nome: str, hora: str, fn):
+    while True:
+        agora = datetime.now(TZ)
+        time.sleep((proxima_execucao(hora, agora) - agora).total_seconds())
+        try:
+            fn()
+        except Exception as e:
+            print(f"LOG (Agendador): Falha no job {nome}: {e}", flush=True)
+
+
+def diario(nome: str, hora: str, fn):
+    """Agenda fn() para rodar todo dia às `hora` (HH:MM). Idempotente por nome."""
+    if nome not in _threads:
+        _threads[nome] = threading.Thread(target=_loop, args=(nome, hora, fn), name=nome, daemon=True)
+        _threads[nome].start()
@@ -1,77 +1,180 @@
 import os
 import json
+import threading
+import time
 from datetime import datetime
-from openai import OpenAI
 from pytz import timezone
+import metrics
+import nlp_processor
+from nlp_processor import AgendaAction
 
-# Configura o cliente OpenAI
-client = OpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
+# O cliente OpenAI (e o import do SDK, que é pesado) só é criado no primeiro uso
+_client = None
+_client_lock = threading.Lock()
 
-def get_ai_response(message_text: str):
-    """
-    Processa a mensagem do usuário usando GPT-4o-mini.
-    """
-    
-    # Contexto Temporal (Crucial para a IA saber o que é "amanhã")
-    tz = timezone('America/Sao_Paulo')
-    now = datetime.now(tz)
-    current_time_str = now.strftime("%Y-%m-%d %H:%M:%S")
-    weekday_str = now.strftime("%A") 
+MODEL = os.environ.get("OPENAI_MODEL", "gpt-4o-mini")
+
+# Preço em US$ por 1M de tokens (padrão: tabela do gpt-4o-mini)
+PRICE_INPUT_PER_1M = float(os.environ.get("OPENAI_PRICE_INPUT_PER_1M", "0.15"))
+PRICE_CACHED_INPUT_PER_1M = float(os.environ.get("OPENAI_PRICE_CACHED_INPUT_PER_1M", "0.075"))
+PRICE_OUTPUT_PER_1M = float(os.environ.get("OPENAI_PRICE_OUTPUT_PER_1M", "0.60"))
 
-    system_prompt = f"""
+DIAS_SEMANA = ["segunda-feira", "terça-feira", "quarta-feira", "quinta-feira", "sexta-feira", "sábado", "domingo"]
+
+# Prefixo estático do prompt: idêntico em todas as chamadas para aproveitar o
+# cache de prefixo do provedor. Tudo que muda por chamada (data/hora atual,
+# pedido pendente, histórico) vai DEPOIS dele, em mensagens separadas.
+# A OpenAI só cacheia prefixos a partir de 1.024 tokens: o esquema completo e
+# os exemplos abaixo mantêm o prefixo acima disso (~1.500 tokens). Ao enxugar
+# o prompt, confira se cached_tokens (cache_hit_ratio em /admin/metrics) não zerou.
+SYSTEM_PROMPT = """
     Você é a 'Secretária', uma assistente executiva da BlackHaus (imobiliária de alto padrão).
-    
-    CONTEXTO ATUAL:
-    - Hoje é: {weekday_str}, {current_time_str} (Horário de Brasília/Goiânia).
-    
+
     SUA PERSONALIDADE:
     - Seja eficiente, educada e direta.
     - Tenha um leve toque de humor ácido/irônico quando apropriado, mas nunca seja desrespeitosa.
     - Você resolve problemas, não cria novos.
-    
+
     SUA MISSÃO:
     Analise a mensagem do usuário e extraia a intenção em JSON estrito.
-    
+
     REGRAS DE EXTRAÇÃO:
-    1. action: "agendar", "reagendar", "cancelar", "consultar" ou "conversa" (para papo furado).
-    2. data_hora: Converta TUDO para ISO 8601 (YYYY-MM-DDTHH:MM:SS). Se o usuário disser "sexta", calcule a data baseada no dia de hoje ({weekday_str}).
+    1. action: "agendar", "reagendar", "cancelar", "consultar", "disponibilidade" (quando o usuário pergunta quando está livre) ou "conversa" (para papo furado).
+    2. data_hora: Converta TUDO para ISO 8601 (YYYY-MM-DDTHH:MM:SS). Se o usuário disser "sexta", calcule a data a partir do CONTEXTO ATUAL informado logo abaixo.
     3. titulo: Resuma o pedido em 2 ou 3 palavras profissionais (ex: "Reunião Vendas").
     4. duracao: Padrão 60 min se não informado.
     5. resposta_whatsapp: Escreva a mensagem que será enviada de volta ao usuário. Deve confirmar a ação ou pedir o dado que falta.
-    
+
     IMPORTANTE:
     - Se a action for "agendar" e faltar hora/data, mude action para "erro" e peça o dado faltante na 'resposta_whatsapp'.
+      Nesse caso inclua "acao_pendente" com a ação pretendida e preencha o que já souber (titulo, duracao,
+      "data" como YYYY-MM-DD e/ou "hora" como HH:MM).
+    - Se houver um PEDIDO PENDENTE, a mensagem do usuário provavelmente completa esse pedido.
     - Se for "consultar", a data_hora deve ser o dia que ele quer ver a agenda.
-    
-    EXEMPLO DE JSON DE RESPOSTA (Basta preencher os campos):
-    {{
-      "action": "agendar",
-      "titulo": "Almoço Executivo",
-      "data_hora": "2023-10-27T14:30:00",
-      "assunto": "Tratar de negócios",
-      "duracao": 60,
-      "id_compromisso": null,
-      "resposta_whatsapp": "Certo, marquei seu almoço. Tente não se atrasar."
-    }}
+    - Se for "disponibilidade", a data_hora deve ser o dia consultado e a duracao o tempo livre que ele procura.
+
+    FORMATO DA RESPOSTA (um único objeto JSON, sem texto fora dele):
+    - "action" (texto, obrigatório): uma das ações acima, ou "erro" quando faltar dado para executar.
+    - "titulo" (texto ou null): 2 ou 3 palavras; obrigatório em "agendar".
+    - "data_hora" (texto ISO 8601 ou null): início do compromisso; em "consultar" e "disponibilidade",
+      o dia em questão à meia-noite (YYYY-MM-DDT00:00:00).
+    - "assunto" (texto ou null): detalhes livres do pedido (pessoas, local, pauta).
+    - "duracao" (inteiro, minutos): 60 se não informado; "2 horas" = 120, "meia hora" = 30.
+    - "id_compromisso" (inteiro ou null): obrigatório em "reagendar" e "cancelar"; o usuário o vê
+      na resposta do "consultar" ("- ID 12: Reunião às 14:00"). Sem ID, use "erro" e peça o ID.
+    - "resposta_whatsapp" (texto, obrigatório): curta, em português, no tom da sua personalidade.
+    - "acao_pendente", "data" (YYYY-MM-DD) e "hora" (HH:MM): somente quando action for "erro".
+    Nunca invente ID, data ou horário que o usuário não informou nem que possa ser calculado.
+
+    EXEMPLOS (datas ilustrativas, supondo CONTEXTO ATUAL = segunda-feira, 2025-03-10 09:00:00;
+    nas respostas reais calcule sempre a partir do CONTEXTO ATUAL informado abaixo):
+
+    Usuário: "marca reunião com o time de vendas amanhã às 15h"
+    {"action": "agendar", "titulo": "Reunião Vendas", "data_hora": "2025-03-11T15:00:00", "assunto": "Reunião com o time de vendas", "duracao": 60, "id_compromisso": null, "resposta_whatsapp": "Marcado: Reunião Vendas amanhã, 11/03, às 15:00."}
+
+    Usuário: "agenda um café com o Marcos na quinta"
+    {"action": "erro", "acao_pendente": "agendar", "titulo": "Café Marcos", "data": "2025-03-13", "hora": null, "assunto": "Café com o Marcos", "duracao": 60, "id_compromisso": null, "resposta_whatsapp": "Quinta, 13/03, anotado. Que horas o café?"}
+
+    (Com PEDIDO PENDENTE do exemplo anterior) Usuário: "pode ser às 10h"
+    {"action": "agendar", "titulo": "Café Marcos", "data_hora": "2025-03-13T10:00:00", "assunto": "Café com o Marcos", "duracao": 60, "id_compromisso": null, "resposta_whatsapp": "Café com o Marcos na quinta, 13/03, às 10:00. Feito."}
+
+    Usuário: "passa o ID 12 para sexta às 11h"
+    {"action": "reagendar", "titulo": null, "data_hora": "2025-03-14T11:00:00", "assunto": null, "duracao": 60, "id_compromisso": 12, "resposta_whatsapp": "Compromisso 12 remarcado para sexta, 14/03, às 11:00."}
+
+    Usuário: "cancela minha reunião de amanhã"
+    {"action": "erro", "acao_pendente": "cancelar", "titulo": null, "data": "2025-03-11", "hora": null, "assunto": null, "duracao": 60, "id_compromisso": null, "resposta_whatsapp": "Qual o ID dela? Peça a agenda de amanhã se não souber."}
+
+    Usuário: "cancela o compromisso 7"
+    {"action": "cancelar", "titulo": null, "data_hora": null, "assunto": null, "duracao": 60, "id_compromisso": 7, "resposta_whatsapp": "Compromisso 7 cancelado. Menos uma reunião na sua vida."}
+
+    Usuário: "o que tenho amanhã?"
+    {"action": "consultar", "titulo": null, "data_hora": "2025-03-11T00:00:00", "assunto": null, "duracao": 60, "id_compromisso": null, "resposta_whatsapp": "Aqui está sua agenda de amanhã."}
+
+    Usuário: "quando estou livre na quarta para uma reunião de 2 horas?"
+    {"action": "disponibilidade", "titulo": null, "data_hora": "2025-03-12T00:00:00", "assunto": null, "duracao": 120, "id_compromisso": null, "resposta_whatsapp": "Vou ver suas janelas livres na quarta."}
+
+    Usuário: "bom dia, tudo certo?"
+    {"action": "conversa", "titulo": null, "data_hora": null, "assunto": null, "duracao": 60, "id_compromisso": null, "resposta_whatsapp": "Bom dia! Tudo em ordem por aqui. O que vamos resolver hoje?"}
+    """
+
+
+def get_client():
+    """Retorna o cliente OpenAI compartilhado, criando-o na primeira chamada."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                from openai import OpenAI
+                _client = OpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
+    return _client
+
+
+def build_messages(message_text: str, historico=None, pendente=None, now: datetime = None):
+    """Prefixo estático + sufixo dinâmico pequeno (contexto temporal, pendente, histórico)."""
+    # Contexto Temporal (Crucial para a IA saber o que é "amanhã")
+    now = now or datetime.now(timezone('America/Sao_Paulo'))
+    contexto = (f"CONTEXTO ATUAL: Hoje é {DIAS_SEMANA[now.weekday()]}, "
+                f"{now.strftime('%Y-%m-%d %H:%M:%S')} (Horário de Brasília/Goiânia).")
+
+    messages = [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "system", "content": contexto},
+    ]
+    if pendente:
+        messages.append({"role": "system", "content": f"PEDIDO PENDENTE: {json.dumps(pendente, ensure_ascii=False)}"})
+    for papel, texto in historico or ():
+        messages.append({"role": papel, "content": texto})
+    messages.append({"role": "user", "content": message_text})
+    return messages
+
+
+def record_usage(usage, action: str, latency: float):
+    """Contabiliza tokens (prompt/completion/cache) e custo estimado da chamada."""
+    if usage is None:
+        return
+    prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+    completion_tokens = getattr(usage, "completion_tokens", 0) or 0
+    details = getattr(usage, "prompt_tokens_details", None)
+    cached_tokens = (getattr(details, "cached_tokens", 0) or 0) if details else 0
+    cost = ((prompt_tokens - cached_tokens) * PRICE_INPUT_PER_1M
+            + cached_tokens * PRICE_CACHED_INPUT_PER_1M
+            + completion_tokens * PRICE_OUTPUT_PER_1M) / 1_000_000
+    metrics.record_llm_usage(action, prompt_tokens, completion_tokens, cached_tokens, cost, latency)
+
+
+def get_ai_response(message_text: str, historico=None, pendente=None) -> AgendaAction:
     """
+    Processa a mensagem do usuário usando GPT-4o-mini.
+    historico: turnos recentes [(papel, texto)] da conversa com o remetente.
+    pendente: pedido em andamento ao qual a mensagem provavelmente responde.
+    Devolve a ação já validada/consertada por nlp_processor.parse_action.
+    """
+    messages = build_messages(message_text, historico, pendente)
 
     try:
-        response = client.chat.completions.create(
-            model="gpt-4o-mini", # CORRETO: Modelo mais rápido e barato
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": message_text}
-            ],
-            response_format={"type": "json_object"}, # Garante que o Python não quebre
-            temperature=0.2 # Baixa criatividade para garantir precisão nos dados
-        )
+        start = time.perf_counter()
+        with metrics.timed("openai"):
+            response = get_client().chat.completions.create(
+                model=MODEL, # CORRETO: Modelo mais rápido e barato
+                messages=messages,
+                response_format={"type": "json_object"}, # Garante que o Python não quebre
+                temperature=0.2 # Baixa criatividade para garantir precisão nos dados
+            )
+        latency = time.perf_counter() - start
 
         content = response.choices[0].message.content
-        return json.loads(content)
+        usage = getattr(response, "usage", None)
+        try:
+            result = nlp_processor.parse_action(content)
+        except ValueError:
+            record_usage(usage, "json_invalido", latency)
+            raise
+        record_usage(usage, result.action, latency)
+        return result
 
     except Exception as e:
         print(f"Erro na IA: {e}")
-        return {
-            "action": "erro",
-            "resposta_whatsapp": "Ocorreu um erro técnico na minha conexão neural. Tente novamente em instantes."
-        }
+        return AgendaAction(
+            action="erro",
+            resposta_whatsapp="Ocorreu um erro técnico na minha conexão neural. Tente novamente em instantes."
+        )
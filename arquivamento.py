@@ -0,0 +1,99 @@
+# arquivamento.py - Retenção da tabela "compromissos" (tabela quente + arquivo)
+#
+# Todas as consultas do dia a dia filtram por data_hora e quase sempre olham
+# hoje/amanhã. Para que a tabela quente não cresça sem limite, compromissos
+# de mais de ARQUIVO_RETENCAO_DIAS dias atrás são movidos, em lotes
+# de ARQUIVO_LOTE, para "compromissos_arquivo" (mesmas colunas + arquivado_em).
+# Cada lote é um INSERT ... SELECT seguido de DELETE, na mesma transação.
+#
+# A tabela de arquivo é criada pelo create_all do migrate.py, então funciona
+# em instalações existentes, no Postgres e no SQLite. O "consultar" de um dia
+# anterior ao corte (agenda_cache) lê as duas tabelas.
+#
+# Uso:
+#   python arquivamento.py               # arquiva agora
+#   python arquivamento.py --dias 30     # retenção diferente só nesta execução
+# No app roda todo dia às ARQUIVO_HORA (ARQUIVO_AGENDADO=1, padrão).
+
+import argparse
+import os
+import sys
+from datetime import date, datetime, timedelta
+
+from pytz import timezone
+from sqlalchemy import delete, insert, literal, select
+
+import agendador
+import database
+import metrics
+
+ARQUIVO_RETENCAO_DIAS = int(os.getenv("ARQUIVO_RETENCAO_DIAS", "90"))
+ARQUIVO_LOTE = int(os.getenv("ARQUIVO_LOTE", "5000"))
+ARQUIVO_HORA = os.getenv("ARQUIVO_HORA", "03:30")
+ARQUIVO_AGENDADO = os.getenv("ARQUIVO_AGENDADO", "1") == "1"
+
+TZ = timezone('America/Sao_Paulo')
+_LOCK_ID = 0x616C6661  # "alfa"
+
+_QUENTE = database.Compromisso.__table__
+_ARQUIVO = database.CompromissoArquivo.__table__
+_COLUNAS = [c.name for c in _QUENTE.columns]
+
+
+def corte(dias: int = None) -> date:
+    """Primeiro dia mantido na tabela quente; dias anteriores estão (ou estarão) no arquivo."""
+    dias = ARQUIVO_RETENCAO_DIAS if dias is None else dias
+    return datetime.now(TZ).date() - timedelta(days=dias)
+
+
+def arquivar(dias: int = None, lote: int = ARQUIVO_LOTE) -> dict:
+    """Move para o arquivo os compromissos anteriores ao corte. Devolve {corte, arquivados}."""
+    limite = datetime.combine(corte(dias), datetime.min.time())
+    resultado = {"corte": limite.date().isoformat(), "arquivados": 0}
+
+    with metrics.timed("arquivamento"), database.advisory_lock(_LOCK_ID) as obtido, database.session_scope() as db:
+        if not obtido:
+            print("LOG (Arquivamento): Outro processo já está arquivando.", flush=True)
+            return resultado
+        agora = datetime.utcnow()
+        while True:
+            ids = db.execute(
+                select(_QUENTE.c.id).where(_QUENTE.c.data_hora < limite).order_by(_QUENTE.c.id).limit(lote)
+            ).scalars().all()
+            if not ids:
+                break
+            origem = select(*[_QUENTE.c[n] for n in _COLUNAS], literal(agora, _ARQUIVO.c.arquivado_em.type)) \
+                .where(_QUENTE.c.id.in_(ids))
+            db.execute(insert(_ARQUIVO).from_select(_COLUNAS + ["arquivado_em"], origem))
+            db.execute(delete(_QUENTE).where(_QUENTE.c.id.in_(ids)))
+            db.commit()
+            resultado["arquivados"] += len(ids)
+
+    metrics.incr("compromissos_arquivados", resultado["arquivados"])
+    print(f"LOG (Arquivamento): {resultado}", flush=True)
+    return resultado
+
+
+def status() -> dict:
+    return {"retencao_dias": ARQUIVO_RETENCAO_DIAS, "corte": corte().isoformat(), "agendado": ARQUIVO_AGENDADO}
+
+
+metrics.register_gauge("arquivamento", status)
+
+
+def start():
+    """Liga o arquivamento diário às ARQUIVO_HORA, se ARQUIVO_AGENDADO=1."""
+    if ARQUIVO_AGENDADO:
+        agendador.diario("arquivamento", ARQUIVO_HORA, arquivar)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Move compromissos antigos para compromissos_arquivo.")
+    parser.add_argument("--dias", type=int, help=f"Dias de retenção (padrão {ARQUIVO_RETENCAO_DIAS})")
+    parser.add_argument("--lote", type=int, default=ARQUIVO_LOTE)
+    args = parser.parse_args()
+    try:
+        arquivar(args.dias, args.lote)
+    except Exception as e:
+        print(f"Erro ao arquivar: {e}", flush=True)
+        sys.exit(1)
@@ -0,0 +1,211 @@
+# benchmarks/micro_benchmark.py - Micro-benchmarks dos caminhos quentes em Python puro
+#
+# Mede latência por chamada e alocações (tracemalloc) de:
+#   - simple_nlp_parser
+#   - formatar_agenda (resposta do "consultar")
+#   - get_compromissos_do_dia sobre uma tabela com 10k-1M compromissos
+#   - agenda_cache.agenda_do_dia com o dia já em cache
+# e imprime o plano de execução da consulta por dia, para pegar regressões
+# de índice/plano antes do deploy.
+#
+#     python benchmarks/micro_benchmark.py --rows 100000 --save micro.json
+#     DATABASE_URL=postgresql://localhost/alfred_bench python benchmarks/micro_benchmark.py --rows 1000000
+#
+# A tabela é semeada uma vez: se já tiver linhas suficientes, é reaproveitada.
+
+import argparse
+import json
+import os
+import re
+import statistics
+import sys
+import tempfile
+import time
+import timeit
+import tracemalloc
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+MENSAGENS_PARSER = [
+    "Reunião com cliente às 14h",
+    "Almoço executivo 12:30",
+    "visita ao imóvel amanhã às 9h30",
+    "Ligar para o contador",
+    "Call de alinhamento com o time de vendas às 17h sobre o lançamento do Jardins",
+]
+
+INICIO_SEMEADURA = datetime(2025, 1, 1, 8, 0)
+
+
+def seed(database, rows: int, per_day: int, chunk: int = 5000):
+    """Garante pelo menos `rows` compromissos, `per_day` por dia a partir de INICIO_SEMEADURA."""
+    from sqlalchemy import func, insert
+
+    db = database.SessionLocal()
+    try:
+        existing = db.query(func.count(database.Compromisso.id)).scalar()
+        if existing >= rows:
+            return existing
+        print(f"Semeando {rows - existing} compromissos...", flush=True)
+        start = time.perf_counter()
+        stmt = insert(database.Compromisso)
+        batch = []
+        for i in range(existing, rows):
+            day, slot = divmod(i, per_day)
+            batch.append({
+                "titulo": f"Compromisso {i}",
+                "data_hora": INICIO_SEMEADURA + timedelta(days=day, minutes=(slot * 600) // per_day),
+                "assunto": "semeado pelo micro-benchmark",
+                "duracao": 60,
+            })
+            if len(batch) >= chunk:
+                db.execute(stmt, batch)
+                db.commit()
+                batch = []
+        if batch:
+            db.execute(stmt, batch)
+            db.commit()
+        print(f"Semeadura concluída em {time.perf_counter() - start:.1f}s", flush=True)
+        return rows
+    finally:
+        db.close()
+
+
+def measure(fn, number: int, repeat: int):
+    """Tempo por chamada (µs) e alocações por chamada (tracemalloc, rodada separada)."""
+    timings = [t / number * 1e6 for t in timeit.repeat(fn, number=number, repeat=repeat)]
+
+    fn()  # Aquece caches (regex compiladas, statement cache do SQLAlchemy)
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    calls = max(1, number // 10)
+    for _ in range(calls):
+        fn()
+    after = tracemalloc.take_snapshot()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    stats = after.compare_to(before, "filename")
+    allocated = sum(max(s.size_diff, 0) for s in stats)
+    blocks = sum(max(s.count_diff, 0) for s in stats)
+
+    return {
+        "calls": number * repeat,
+        "min_us": round(min(timings), 2),
+        "median_us": round(statistics.median(timings), 2),
+        "max_us": round(max(timings), 2),
+        "retained_bytes_per_call": round(allocated / calls, 1),
+        "retained_blocks_per_call": round(blocks / calls, 2),
+        "peak_kib": round(peak / 1024, 1),
+    }
+
+
+def query_plan(database, dia: datetime) -> str:
+    """Plano de execução da consulta de get_compromissos_do_dia no banco em uso."""
+    from sqlalchemy import text
+
+    db = database.SessionLocal()
+    try:
+        query = db.query(database.Compromisso).filter(
+            database.Compromisso.data_hora >= dia,
+            database.Compromisso.data_hora <= dia + timedelta(days=1),
+        ).order_by(database.Compromisso.data_hora)
+        compiled = query.statement.compile(database.engine, compile_kwargs={"literal_binds": True})
+        prefix = "EXPLAIN QUERY PLAN " if database.engine.dialect.name == "sqlite" else "EXPLAIN "
+        rows = db.execute(text(prefix + str(compiled))).fetchall()
+        plan = "\n".join(" ".join(str(col) for col in row) for row in rows)
+        # Custos estimados variam a cada execução; só a forma do plano interessa
+        return re.sub(r"\s*\(cost=[^)]*\)", "", plan)
+    finally:
+        db.close()
+
+
+def compare(results: dict, baseline: dict, tolerance: float):
+    regressions = []
+    for name, current in results["cases"].items():
+        previous = (baseline.get("cases") or {}).get(name)
+        if not previous:
+            continue
+        if current["median_us"] > previous["median_us"] * (1 + tolerance):
+            regressions.append(f"{name}: mediana {previous['median_us']}µs -> {current['median_us']}µs")
+        if current["retained_bytes_per_call"] > previous["retained_bytes_per_call"] * (1 + tolerance) + 64:
+            regressions.append(f"{name}: retenção {previous['retained_bytes_per_call']}B -> "
+                               f"{current['retained_bytes_per_call']}B por chamada")
+    if baseline.get("query_plan") and baseline["query_plan"] != results["query_plan"]:
+        regressions.append("plano de execução de get_compromissos_do_dia mudou")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmarks de parser, consultas e formatação.")
+    parser.add_argument("--rows", type=int, default=10000, help="Compromissos na tabela (10k a 1M)")
+    parser.add_argument("--per-day", type=int, default=20, help="Compromissos por dia na semeadura")
+    parser.add_argument("--number", type=int, default=200, help="Chamadas por repetição")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--save", help="Salva o resultado neste arquivo JSON")
+    parser.add_argument("--baseline", help="Compara com um resultado salvo anteriormente")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    args = parser.parse_args()
+
+    os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.gettempdir()}/alfred_micro_{args.rows}.db")
+
+    import agenda_cache
+    import database
+    import migrate
+    from main import formatar_agenda, simple_nlp_parser
+
+    migrate.run_migrations()
+    total = seed(database, args.rows, args.per_day)
+    dia_meio = INICIO_SEMEADURA.replace(hour=0) + timedelta(days=(total // args.per_day) // 2)
+
+    agenda_fake = [
+        agenda_cache.linha(i, f"Reunião {i}", dia_meio + timedelta(minutes=30 * i))
+        for i in range(args.per_day)
+    ]
+    mensagens = iter(MENSAGENS_PARSER * (args.number * args.repeat * 2))
+
+    db = database.SessionLocal()
+    try:
+        cases = {
+            "simple_nlp_parser": lambda: simple_nlp_parser(next(mensagens, MENSAGENS_PARSER[0])),
+            "formatar_agenda": lambda: formatar_agenda(dia_meio.date(), agenda_fake),
+            "get_compromissos_do_dia": lambda: (database.get_compromissos_do_dia(db, dia_meio), db.rollback()),
+            "agenda_cache_hit": lambda: agenda_cache.agenda_do_dia(db, dia_meio.date()),
+        }
+        results = {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "dialect": database.engine.dialect.name,
+            "rows": total,
+            "cases": {},
+            "query_plan": query_plan(database, dia_meio),
+        }
+        for name, fn in cases.items():
+            number = args.number if name != "get_compromissos_do_dia" else max(1, args.number // 10)
+            results["cases"][name] = measure(fn, number, args.repeat)
+    finally:
+        db.close()
+
+    print(f"\nBanco: {results['dialect']} com {total} compromissos")
+    print(f"{'caso':<26}{'mediana µs':>12}{'mín µs':>10}{'B/chamada':>12}{'pico KiB':>10}")
+    for name, r in results["cases"].items():
+        print(f"{name:<26}{r['median_us']:>12}{r['min_us']:>10}{r['retained_bytes_per_call']:>12}{r['peak_kib']:>10}")
+    print(f"\nPlano de get_compromissos_do_dia:\n{results['query_plan']}")
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+        print(f"Resultado salvo em {args.save}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print("\nREGRESSÕES em relação ao baseline:")
+            for line in regressions:
+                print(f"  - {line}")
+            sys.exit(1)
+        print("\nSem regressões em relação ao baseline.")
+
+
+if __name__ == "__main__":
+    main()
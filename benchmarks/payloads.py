@@ -0,0 +1,121 @@
+# benchmarks/payloads.py - Geração e leitura de payloads de webhook do WhatsApp
+
+import json
+import random
+import time
+import uuid
+
+# Mensagens típicas por intenção (mistura realista de uso)
+MENSAGENS = {
+    "agendar": [
+        "Agenda uma reunião com o cliente amanhã às 10h",
+        "Marca visita ao apartamento do Jardins sexta às 15h30",
+        "Quero agendar almoço com o investidor na terça às 12h",
+        "Reunião de alinhamento com a equipe de vendas às 9h",
+    ],
+    "consultar": [
+        "Quais são meus compromissos para hoje?",
+        "Como está minha agenda amanhã?",
+        "Consultar agenda de sexta",
+    ],
+    "cancelar": [
+        "Cancela o evento ID {id}",
+        "Pode cancelar o compromisso ID {id}?",
+    ],
+    "reagendar": [
+        "Reagenda o compromisso ID {id} para sexta às 14h",
+    ],
+    "conversa": [
+        "Bom dia!",
+        "Obrigado, Alfred",
+    ],
+}
+
+# Pesos padrão de cada tipo de evento
+MIX_PADRAO = {"agendar": 0.45, "consultar": 0.3, "cancelar": 0.08, "reagendar": 0.05,
+              "conversa": 0.07, "status": 0.05}
+
+
+def message_payload(from_number: str, text: str, message_id: str = None) -> dict:
+    """Payload de mensagem de texto no formato do webhook da Meta."""
+    return {
+        "object": "whatsapp_business_account",
+        "entry": [{
+            "id": "WHATSAPP_BUSINESS_ACCOUNT_ID",
+            "changes": [{
+                "field": "messages",
+                "value": {
+                    "messaging_product": "whatsapp",
+                    "metadata": {"display_phone_number": "15550000000", "phone_number_id": "1234567890"},
+                    "contacts": [{"profile": {"name": "Bench"}, "wa_id": from_number}],
+                    "messages": [{
+                        "from": from_number,
+                        "id": message_id or f"wamid.{uuid.uuid4().hex}",
+                        "timestamp": str(int(time.time())),
+                        "type": "text",
+                        "text": {"body": text},
+                    }],
+                },
+            }],
+        }],
+    }
+
+
+def status_payload(recipient: str, status: str = "delivered") -> dict:
+    """Payload de callback de status (entregue/lido), sem mensagens."""
+    return {
+        "object": "whatsapp_business_account",
+        "entry": [{
+            "id": "WHATSAPP_BUSINESS_ACCOUNT_ID",
+            "changes": [{
+                "field": "messages",
+                "value": {
+                    "messaging_product": "whatsapp",
+                    "metadata": {"display_phone_number": "15550000000", "phone_number_id": "1234567890"},
+                    "statuses": [{
+                        "id": f"wamid.{uuid.uuid4().hex}",
+                        "status": status,
+                        "timestamp": str(int(time.time())),
+                        "recipient_id": recipient,
+                    }],
+                },
+            }],
+        }],
+    }
+
+
+def sender_number(index: int) -> str:
+    """Número fictício e estável para o remetente de índice `index`."""
+    return f"55119{index:08d}"
+
+
+def synthetic_event(rng: random.Random, from_number: str, mix: dict = None):
+    """Sorteia um evento do mix e devolve (tipo, payload)."""
+    mix = mix or MIX_PADRAO
+    kind = rng.choices(list(mix), weights=list(mix.values()))[0]
+    if kind == "status":
+        return kind, status_payload(from_number, rng.choice(["sent", "delivered", "read"]))
+    text = rng.choice(MENSAGENS[kind]).format(id=rng.randint(1, 50))
+    return kind, message_payload(from_number, text)
+
+
+def synthetic_payloads(count: int, senders: int = 50, seed: int = 42, mix: dict = None):
+    """Gera `count` payloads sintéticos distribuídos entre `senders` remetentes."""
+    rng = random.Random(seed)
+    for _ in range(count):
+        yield synthetic_event(rng, sender_number(rng.randrange(senders)), mix)
+
+
+def load_payloads(path: str):
+    """Lê payloads gravados (um JSON por linha); aceita o payload puro ou {"payload": ...}."""
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            payload = record.get("payload", record)
+            if "entry" not in payload:
+                continue  # Linha que não é um webhook (ex: metadados)
+            value = payload["entry"][0]["changes"][0]["value"]
+            yield ("status" if not value.get("messages") else "gravado"), payload
@@ -0,0 +1,194 @@
+# benchmarks/replay_benchmark.py - Benchmark offline de ponta a ponta do main.app
+#
+# Reproduz payloads de webhook (gravados e/ou sintéticos) direto na aplicação
+# ASGI, com Meta, OpenAI e Google Calendar substituídos pelos stubs locais.
+# Mede p50/p95/p99 por etapa e mensagens/s, salva em JSON e compara com um
+# baseline salvo anteriormente.
+#
+#     python benchmarks/replay_benchmark.py --count 500 --concurrency 20 \
+#         --save bench.json --baseline bench_baseline.json
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks import payloads  # noqa: E402
+from benchmarks.stubs import add_stub_arguments, configs_from_args, start_stubs, stub_google_token  # noqa: E402
+
+
+async def post_webhook(app, payload: dict):
+    """Chama POST /webhook/whatsapp via protocolo ASGI; devolve (status, ack_s).
+
+    O processamento em si acontece na fila do admission.py; o tempo de ponta
+    a ponta de cada mensagem vem da etapa "mensagem_total" das métricas.
+    """
+    body = json.dumps(payload).encode()
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+        "method": "POST", "scheme": "http", "path": "/webhook/whatsapp", "raw_path": b"/webhook/whatsapp",
+        "query_string": b"", "root_path": "",
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+        "client": ("127.0.0.1", 50000), "server": ("127.0.0.1", 8000),
+    }
+    sent = False
+    result = {"status": None, "ack": None}
+    start = time.perf_counter()
+
+    async def receive():
+        nonlocal sent
+        if not sent:
+            sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        await asyncio.sleep(3600)
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            result["status"] = message["status"]
+            result["ack"] = time.perf_counter() - start
+
+    await app(scope, receive, send)
+    return result["status"], result["ack"]
+
+
+def summarize(values):
+    """p50/p95/p99 (ms) de uma lista de durações em segundos."""
+    import metrics
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    return {
+        "count": len(ordered),
+        "p50_ms": round(metrics.percentile(ordered, 50) * 1000, 3),
+        "p95_ms": round(metrics.percentile(ordered, 95) * 1000, 3),
+        "p99_ms": round(metrics.percentile(ordered, 99) * 1000, 3),
+    }
+
+
+async def replay(app, events, concurrency: int, controller):
+    """Dispara os eventos com no máximo `concurrency` requisições em voo e espera a fila esvaziar."""
+    semaphore = asyncio.Semaphore(concurrency)
+    acks, statuses = [], {}
+
+    async def one(payload):
+        async with semaphore:
+            status, ack = await post_webhook(app, payload)
+            statuses[status] = statuses.get(status, 0) + 1
+            if ack is not None:
+                acks.append(ack)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(payload) for _, payload in events))
+    await asyncio.to_thread(controller.wait_idle)
+    return acks, statuses, time.perf_counter() - start
+
+
+def compare(results: dict, baseline: dict, tolerance: float):
+    """Lista regressões de p95 por etapa e de vazão acima da tolerância."""
+    regressions = []
+    for stage, current in results["stages"].items():
+        previous = (baseline.get("stages") or {}).get(stage)
+        if not current or not previous:
+            continue
+        if current["p95_ms"] > previous["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{stage}: p95 {previous['p95_ms']}ms -> {current['p95_ms']}ms")
+    old_rate = baseline.get("messages_per_sec")
+    if old_rate and results["messages_per_sec"] < old_rate * (1 - tolerance):
+        regressions.append(f"vazão: {old_rate} msg/s -> {results['messages_per_sec']} msg/s")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark offline de ponta a ponta do webhook.")
+    parser.add_argument("--count", type=int, default=200, help="Quantidade de eventos sintéticos")
+    parser.add_argument("--senders", type=int, default=50, help="Remetentes distintos nos eventos sintéticos")
+    parser.add_argument("--payloads", help="Arquivo JSONL com payloads de webhook gravados")
+    parser.add_argument("--concurrency", type=int, default=10, help="Requisições simultâneas")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--save", help="Salva o resultado neste arquivo JSON")
+    parser.add_argument("--baseline", help="Compara com um resultado salvo anteriormente")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="Piora relativa aceitável em relação ao baseline (0.2 = 20%%)")
+    add_stub_arguments(parser)
+    args = parser.parse_args()
+
+    servers, env = start_stubs(*configs_from_args(args))
+    os.environ.update(env)
+    os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/bench.db")
+    # Por padrão a fila comporta todos os eventos; reduza para medir o descarte de carga
+    os.environ.setdefault("MESSAGE_QUEUE_CAPACITY", str(args.count + 1000))
+
+    # Importa só depois de configurar o ambiente: os módulos leem as variáveis na importação
+    import admission
+    import database
+    import migrate
+    import main as app_module
+    import metrics
+
+    migrate.run_migrations()
+    db = database.SessionLocal()
+    try:
+        database.save_token(db, user_id=app_module.MAIN_USER_ID,
+                            token_json=stub_google_token(servers["google_calendar"].url))
+    finally:
+        db.close()
+
+    events = []
+    if args.payloads:
+        events.extend(payloads.load_payloads(args.payloads))
+    events.extend(payloads.synthetic_payloads(args.count, args.senders, args.seed))
+
+    metrics.reset()
+    acks, statuses, wall = asyncio.run(replay(app_module.app, events, args.concurrency, admission.controller))
+
+    snapshot = metrics.snapshot()
+    stages = {stage: summary for stage, summary in snapshot["stages"].items() if summary}
+    stages["ack"] = summarize(acks)
+    results = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "events": len(events),
+        "concurrency": args.concurrency,
+        "wall_s": round(wall, 3),
+        "messages_per_sec": round(len(events) / wall, 2) if wall else None,
+        "http_status": {str(k): v for k, v in statuses.items()},
+        "stages": stages,
+        "stub_calls": {name: server.calls for name, server in servers.items()},
+    }
+
+    print(f"\n{'etapa':<18}{'n':>7}{'p50 ms':>11}{'p95 ms':>11}{'p99 ms':>11}")
+    for stage, summary in sorted(stages.items()):
+        if summary:
+            print(f"{stage:<18}{summary['count']:>7}{summary['p50_ms']:>11}"
+                  f"{summary['p95_ms']:>11}{summary['p99_ms']:>11}")
+    print(f"\n{results['events']} eventos em {results['wall_s']}s -> {results['messages_per_sec']} msg/s")
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+        print(f"Resultado salvo em {args.save}")
+
+    exit_code = 0
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print("\nREGRESSÕES em relação ao baseline:")
+            for line in regressions:
+                print(f"  - {line}")
+            exit_code = 1
+        else:
+            print("\nSem regressões em relação ao baseline.")
+
+    for server in servers.values():
+        server.stop()
+    sys.exit(exit_code)
+
+
+if __name__ == "__main__":
+    main()
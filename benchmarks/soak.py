@@ -0,0 +1,356 @@
+# benchmarks/soak.py - Gerador de carga sustentada (soak) com milhares de remetentes
+#
+# Diferente do replay_benchmark.py (uma rodada dentro do processo), este
+# script bate num uvicorn/gunicorn rodando de verdade, por um tempo
+# configurável, com rajadas periódicas, callbacks de status e reentregas.
+# Ao longo do teste amostra RSS e conexões abertas do servidor e as filas
+# expostas em /admin/metrics, e sinaliza regressões ao final.
+#
+# Subindo o servidor automaticamente (com os stubs e SQLite temporário):
+#     python benchmarks/soak.py --spawn --senders 5000 --rate 40 --duration 600
+#
+# Contra um servidor já no ar (informe o PID para amostrar memória):
+#     python benchmarks/soak.py --url http://127.0.0.1:8000 --pid 12345
+
+import argparse
+import json
+import os
+import random
+import secrets
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks import payloads  # noqa: E402
+from benchmarks.stubs import add_stub_arguments, configs_from_args, start_stubs  # noqa: E402
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+# --- Amostragem do processo servidor (via /proc, sem dependências extras) ---
+
+def _process_tree(pid: int):
+    """PID informado mais todos os descendentes (workers do gunicorn, por exemplo)."""
+    children = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(ppid, []).append(int(entry))
+    tree, stack = [], [pid]
+    while stack:
+        current = stack.pop()
+        tree.append(current)
+        stack.extend(children.get(current, ()))
+    return tree
+
+
+def _rss_mb(pid: int) -> float:
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return 0.0
+
+
+def _open_sockets(pid: int) -> int:
+    count = 0
+    try:
+        for fd in os.listdir(f"/proc/{pid}/fd"):
+            try:
+                if os.readlink(f"/proc/{pid}/fd/{fd}").startswith("socket:"):
+                    count += 1
+            except OSError:
+                continue
+    except OSError:
+        pass
+    return count
+
+
+def _admin_headers() -> dict:
+    """Header das rotas /admin/* (ADMIN_TOKEN do ambiente; o --spawn gera um)."""
+    return {"X-Admin-Token": os.environ.get("ADMIN_TOKEN", "")}
+
+
+def sample_server(url: str, pid: int = None) -> dict:
+    """Uma amostra: RSS e sockets de toda a árvore de processos + gauges do app."""
+    sample = {"t": time.time()}
+    if pid:
+        tree = _process_tree(pid)
+        sample["processes"] = len(tree)
+        sample["rss_mb"] = round(sum(_rss_mb(p) for p in tree), 2)
+        sample["open_sockets"] = sum(_open_sockets(p) for p in tree)
+    try:
+        snapshot = requests.get(f"{url}/admin/metrics", headers=_admin_headers(), timeout=5).json()
+        sample["gauges"] = snapshot.get("gauges", {})
+    except Exception as e:
+        sample["gauges_error"] = str(e)
+    return sample
+
+
+# --- Geração de carga ---
+
+class LoadStats:
+    """Contadores do lado do cliente, seguros entre threads."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = []
+        self.by_status = {}
+        self.by_kind = {}
+        self.errors = 0
+
+    def record(self, kind: str, status, latency: float):
+        with self.lock:
+            self.latencies.append(latency)
+            self.by_status[str(status)] = self.by_status.get(str(status), 0) + 1
+            self.by_kind[kind] = self.by_kind.get(kind, 0) + 1
+            if status is None or status >= 500:
+                self.errors += 1
+
+
+_local = threading.local()
+
+
+def _session() -> requests.Session:
+    if not hasattr(_local, "session"):
+        _local.session = requests.Session()
+    return _local.session
+
+
+def send_event(url: str, kind: str, payload: dict, stats: LoadStats):
+    start = time.perf_counter()
+    try:
+        status = _session().post(f"{url}/webhook/whatsapp", json=payload, timeout=30).status_code
+    except requests.RequestException:
+        status = None
+    stats.record(kind, status, time.perf_counter() - start)
+
+
+def current_rate(args, elapsed: float) -> float:
+    """Taxa alvo (eventos/s) no instante `elapsed`, com rajadas periódicas."""
+    if args.burst_every and (elapsed % args.burst_every) < args.burst_length:
+        return args.rate * args.burst_factor
+    return args.rate
+
+
+def run_load(args, url: str, stats: LoadStats, stop: threading.Event):
+    rng = random.Random(args.seed)
+    pool = ThreadPoolExecutor(max_workers=args.workers)
+    start = time.monotonic()
+    next_at = start
+    while not stop.is_set():
+        elapsed = time.monotonic() - start
+        if elapsed >= args.duration:
+            break
+        sender = payloads.sender_number(rng.randrange(args.senders))
+        kind, payload = payloads.synthetic_event(rng, sender)
+        pool.submit(send_event, url, kind, payload, stats)
+        if kind != "status" and rng.random() < args.retry_rate:
+            # Reentrega do mesmo evento (mesmo wamid), como a Meta faz sem 200 a tempo
+            pool.submit(send_event, url, "retry", payload, stats)
+        next_at += 1.0 / current_rate(args, elapsed)
+        delay = next_at - time.monotonic()
+        if delay > 0:
+            stop.wait(delay)
+    pool.shutdown(wait=True)
+
+
+# --- Análise ---
+
+def _slope_per_min(samples, key):
+    """Inclinação (unidades/minuto) por mínimos quadrados."""
+    points = [(s["t"], s[key]) for s in samples if key in s]
+    if len(points) < 2:
+        return 0.0
+    n = len(points)
+    mean_t = sum(p[0] for p in points) / n
+    mean_v = sum(p[1] for p in points) / n
+    var = sum((p[0] - mean_t) ** 2 for p in points)
+    if not var:
+        return 0.0
+    return sum((p[0] - mean_t) * (p[1] - mean_v) for p in points) / var * 60
+
+
+def analyze(args, stats: LoadStats, samples, wall: float) -> dict:
+    import metrics  # percentil compartilhado com o app
+    latencies = sorted(stats.latencies)
+    warm = [s for s in samples if s["t"] - samples[0]["t"] >= args.warmup] if samples else []
+    total = len(latencies)
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "duration_s": round(wall, 1),
+        "requests": total,
+        "requests_per_sec": round(total / wall, 2) if wall else None,
+        "error_rate": round(stats.errors / total, 4) if total else None,
+        "by_status": stats.by_status,
+        "by_kind": stats.by_kind,
+        "latency_ms": {
+            f"p{p}": round(metrics.percentile(latencies, p) * 1000, 2) for p in (50, 95, 99)
+        } if latencies else {},
+        "rss_mb_start": warm[0].get("rss_mb") if warm else None,
+        "rss_mb_end": warm[-1].get("rss_mb") if warm else None,
+        "rss_mb_per_min": round(_slope_per_min(warm, "rss_mb"), 3),
+        "open_sockets_max": max((s.get("open_sockets", 0) for s in samples), default=None),
+        "samples": samples,
+    }
+
+
+def find_regressions(args, results: dict, baseline: dict = None):
+    problems = []
+    if results["error_rate"] is not None and results["error_rate"] > args.max_error_rate:
+        problems.append(f"taxa de erro {results['error_rate']:.2%} > {args.max_error_rate:.2%}")
+    p95 = results["latency_ms"].get("p95")
+    if p95 is not None and p95 > args.max_p95_ms:
+        problems.append(f"p95 do webhook {p95}ms > {args.max_p95_ms}ms")
+    if results["rss_mb_per_min"] > args.max_rss_growth:
+        problems.append(f"RSS crescendo {results['rss_mb_per_min']} MB/min > {args.max_rss_growth} MB/min")
+    if baseline:
+        tolerance = 1 + args.tolerance
+        old_p95 = (baseline.get("latency_ms") or {}).get("p95")
+        if old_p95 and p95 and p95 > old_p95 * tolerance:
+            problems.append(f"p95 piorou: {old_p95}ms -> {p95}ms")
+        old_end = baseline.get("rss_mb_end")
+        if old_end and results["rss_mb_end"] and results["rss_mb_end"] > old_end * tolerance:
+            problems.append(f"RSS final piorou: {old_end}MB -> {results['rss_mb_end']}MB")
+        old_rate = baseline.get("requests_per_sec")
+        if old_rate and results["requests_per_sec"] < old_rate / tolerance:
+            problems.append(f"vazão caiu: {old_rate} -> {results['requests_per_sec']} req/s")
+    return problems
+
+
+# --- Servidor local ---
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def spawn_server(args):
+    """Sobe os stubs e o app (uvicorn ou o comando informado) apontando para eles."""
+    servers, env = start_stubs(*configs_from_args(args))
+    port = _free_port()
+    os.environ.setdefault("ADMIN_TOKEN", secrets.token_hex(16))
+    env = dict(os.environ, **env)
+    env.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/soak.db")
+    command = (args.server_command or "uvicorn main:app --host 127.0.0.1 --port {port}").format(port=port)
+    process = subprocess.Popen(command.split(), cwd=ROOT, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                               start_new_session=True)
+    url = f"http://127.0.0.1:{port}"
+    for _ in range(100):
+        try:
+            requests.get(f"{url}/admin/metrics", headers=_admin_headers(), timeout=1)
+            break
+        except requests.RequestException:
+            time.sleep(0.2)
+    else:
+        os.killpg(process.pid, signal.SIGTERM)
+        raise RuntimeError(f"Servidor não respondeu em {url}")
+    return url, process, servers
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Teste de carga sustentada do webhook.")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--url", help="URL base de um servidor já no ar")
+    target.add_argument("--spawn", action="store_true", help="Sobe stubs + servidor local")
+    parser.add_argument("--server-command", help="Comando do servidor em --spawn ({port} é substituído)")
+    parser.add_argument("--pid", type=int, help="PID do servidor (para RSS/sockets) quando usar --url")
+    parser.add_argument("--senders", type=int, default=2000, help="Remetentes (from_number) distintos")
+    parser.add_argument("--duration", type=float, default=300, help="Duração em segundos")
+    parser.add_argument("--rate", type=float, default=20, help="Eventos/s fora das rajadas")
+    parser.add_argument("--burst-factor", type=float, default=4, help="Multiplicador da taxa nas rajadas")
+    parser.add_argument("--burst-every", type=float, default=60, help="Intervalo entre rajadas (s); 0 desliga")
+    parser.add_argument("--burst-length", type=float, default=10, help="Duração de cada rajada (s)")
+    parser.add_argument("--retry-rate", type=float, default=0.03, help="Fração de mensagens reentregues")
+    parser.add_argument("--workers", type=int, default=64, help="Conexões simultâneas do cliente")
+    parser.add_argument("--sample-interval", type=float, default=5, help="Intervalo de amostragem (s)")
+    parser.add_argument("--warmup", type=float, default=30, help="Amostras ignoradas no cálculo de RSS (s)")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--max-error-rate", type=float, default=0.01)
+    parser.add_argument("--max-p95-ms", type=float, default=500)
+    parser.add_argument("--max-rss-growth", type=float, default=2.0, help="Crescimento máximo de RSS (MB/min)")
+    parser.add_argument("--save", help="Salva o resultado neste arquivo JSON")
+    parser.add_argument("--baseline", help="Compara com um resultado salvo anteriormente")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    add_stub_arguments(parser)
+    args = parser.parse_args()
+
+    process = servers = None
+    if args.spawn:
+        url, process, servers = spawn_server(args)
+        pid = process.pid
+    else:
+        url, pid = args.url.rstrip("/"), args.pid
+
+    stats, stop, samples = LoadStats(), threading.Event(), []
+
+    def sampler():
+        while not stop.is_set():
+            samples.append(sample_server(url, pid))
+            stop.wait(args.sample_interval)
+
+    sampler_thread = threading.Thread(target=sampler, daemon=True)
+    sampler_thread.start()
+    start = time.monotonic()
+    try:
+        run_load(args, url, stats, stop)
+    except KeyboardInterrupt:
+        print("Interrompido; analisando o que foi coletado...")
+    finally:
+        wall = time.monotonic() - start
+        stop.set()
+        sampler_thread.join()
+        samples.append(sample_server(url, pid))
+
+    results = analyze(args, stats, samples, wall)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+    problems = find_regressions(args, results, baseline)
+
+    print(f"\n{results['requests']} requisições em {results['duration_s']}s "
+          f"({results['requests_per_sec']} req/s), erro {results['error_rate']}")
+    print(f"Latência do webhook: {results['latency_ms']}")
+    print(f"RSS: {results['rss_mb_start']} -> {results['rss_mb_end']} MB "
+          f"({results['rss_mb_per_min']} MB/min), sockets máx: {results['open_sockets_max']}")
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+        print(f"Resultado salvo em {args.save}")
+
+    if process:
+        os.killpg(process.pid, signal.SIGTERM)
+        process.wait(timeout=30)
+        for server in servers.values():
+            server.stop()
+
+    if problems:
+        print("\nREGRESSÕES:")
+        for line in problems:
+            print(f"  - {line}")
+        sys.exit(1)
+    print("\nNenhuma regressão detectada.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+# benchmarks/startup_benchmark.py - Tempo de importação do main (cold start)
+#
+# Roda `python -X importtime -c "import main"` em processos novos, imprime o
+# tempo total de importação e os módulos mais caros (tempo cumulativo).
+#
+#     python benchmarks/startup_benchmark.py --runs 5 --top 25
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def import_once(module: str, env: dict):
+    """Importa `module` num processo novo; devolve (wall_s, {pacote: cumulativo_us})."""
+    start = time.perf_counter()
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                          cwd=ROOT, env=env, capture_output=True, text=True)
+    wall = time.perf_counter() - start
+    if proc.returncode != 0:
+        raise RuntimeError(f"Falha ao importar {module}:\n{proc.stderr[-2000:]}")
+    cumulative = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _self_us, cumul_us, name = line[len("import time:"):].split("|")
+        cumulative[name.strip()] = int(cumul_us)
+    return wall, cumulative
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mede o tempo de importação do app.")
+    parser.add_argument("--module", default="main")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=20, help="Quantos módulos mais caros listar")
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    env.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/startup.db")
+
+    walls, runs = [], []
+    for _ in range(args.runs):
+        wall, cumulative = import_once(args.module, env)
+        walls.append(wall)
+        runs.append(cumulative)
+
+    # Mediana por módulo entre as execuções
+    names = set().union(*runs)
+    medians = {name: statistics.median(r.get(name, 0) for r in runs) for name in names}
+
+    print(f"Processo + import {args.module}: mediana {statistics.median(walls) * 1000:.0f} ms "
+          f"(mín {min(walls) * 1000:.0f} ms, {args.runs} execuções)")
+    print(f"Import {args.module} (cumulativo): {medians.get(args.module, 0) / 1000:.1f} ms\n")
+    print(f"{'cumulativo ms':>14}  módulo")
+    for name, us in sorted(medians.items(), key=lambda item: item[1], reverse=True)[:args.top]:
+        print(f"{us / 1000:>14.1f}  {name}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,280 @@
+# benchmarks/stubs.py - Servidores locais que imitam Graph API, OpenAI e Google Calendar
+#
+# Cada servidor responde no formato mínimo que o cliente real espera, com
+# latência e taxa de erro configuráveis. Podem ser usados dentro do próprio
+# processo (ver replay_benchmark.py) ou isoladamente:
+#
+#     python benchmarks/stubs.py --openai-latency 0.4 --openai-error-rate 0.01
+
+import argparse
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StubConfig:
+    """Latência (segundos), variação e taxa de erro de um serviço simulado."""
+
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+
+    def wait(self):
+        """Dorme a latência configurada e diz se esta chamada deve falhar."""
+        delay = self.latency + random.uniform(0, self.jitter) if self.jitter else self.latency
+        if delay > 0:
+            time.sleep(delay)
+        return random.random() < self.error_rate
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    config = StubConfig()
+    calls = None  # contador compartilhado por servidor
+
+    def log_message(self, format, *args):
+        pass  # Silencia o log padrão do http.server
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+        return json.loads(body) if body else {}
+
+    def _send(self, status, payload=None):
+        body = json.dumps(payload).encode() if payload is not None else b""
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if body:
+            self.wfile.write(body)
+
+    def _handle(self, method):
+        body = self._read_json() if method in ("POST", "PUT", "PATCH") else {}
+        with self.calls_lock:
+            self.calls[method] = self.calls.get(method, 0) + 1
+        if self.config.wait():
+            self._send(500, {"error": {"message": "erro simulado", "code": 500}})
+            return
+        status, payload = self.route(method, self.path, body)
+        self._send(status, payload)
+
+    def do_GET(self):
+        self._handle("GET")
+
+    def do_POST(self):
+        self._handle("POST")
+
+    def do_PUT(self):
+        self._handle("PUT")
+
+    def do_PATCH(self):
+        self._handle("PATCH")
+
+    def do_DELETE(self):
+        self._handle("DELETE")
+
+    def route(self, method, path, body):
+        return 404, {"error": {"message": f"rota não simulada: {method} {path}"}}
+
+
+class GraphApiHandler(_StubHandler):
+    """Imita POST /{versão}/{phone_number_id}/messages da Meta Cloud API."""
+
+    def route(self, method, path, body):
+        if method == "POST" and path.rstrip("/").endswith("/messages"):
+            return 200, {
+                "messaging_product": "whatsapp",
+                "contacts": [{"input": body.get("to"), "wa_id": body.get("to")}],
+                "messages": [{"id": f"wamid.{uuid.uuid4().hex}"}],
+            }
+        return super().route(method, path, body)
+
+
+def fake_ai_decision(text: str):
+    """Decide uma ação plausível a partir de palavras-chave da mensagem."""
+    lowered = text.lower()
+    amanha = (datetime.now() + timedelta(days=1)).replace(hour=10, minute=0, second=0, microsecond=0)
+    id_match = re.search(r"\bid\s*(\d+)", lowered)
+    id_comp = int(id_match.group(1)) if id_match else None
+    if "cancel" in lowered:
+        return {"action": "cancelar", "id_compromisso": id_comp or 1,
+                "resposta_whatsapp": "Cancelado."}
+    if "reagend" in lowered:
+        return {"action": "reagendar", "id_compromisso": id_comp or 1,
+                "data_hora": (amanha + timedelta(hours=4)).isoformat(),
+                "resposta_whatsapp": "Reagendado."}
+    if "quais" in lowered or "minha agenda" in lowered or "consult" in lowered:
+        return {"action": "consultar", "data_hora": amanha.isoformat(),
+                "resposta_whatsapp": "Consultando."}
+    if "agend" in lowered or "marca" in lowered or "reuni" in lowered:
+        return {"action": "agendar", "titulo": "Reunião Cliente", "data_hora": amanha.isoformat(),
+                "assunto": text, "duracao": 60, "id_compromisso": None,
+                "resposta_whatsapp": "Certo, marquei."}
+    return {"action": "conversa", "resposta_whatsapp": "Olá! Em que posso ajudar?"}
+
+
+class OpenAIHandler(_StubHandler):
+    """Imita POST /v1/chat/completions devolvendo JSON de ação e `usage`."""
+
+    def route(self, method, path, body):
+        if method == "POST" and path.rstrip("/").endswith("/chat/completions"):
+            messages = body.get("messages") or [{}]
+            user_text = next((m.get("content", "") for m in reversed(messages) if m.get("role") == "user"), "")
+            prompt_chars = sum(len(m.get("content") or "") for m in messages)
+            content = json.dumps(fake_ai_decision(user_text), ensure_ascii=False)
+            prompt_tokens = max(1, prompt_chars // 4)
+            return 200, {
+                "id": f"chatcmpl-{uuid.uuid4().hex}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": body.get("model", "gpt-4o-mini"),
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": content},
+                    "finish_reason": "stop",
+                }],
+                "usage": {
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": max(1, len(content) // 4),
+                    "total_tokens": prompt_tokens + max(1, len(content) // 4),
+                    "prompt_tokens_details": {"cached_tokens": 0},
+                },
+            }
+        return super().route(method, path, body)
+
+
+class CalendarHandler(_StubHandler):
+    """Imita o subconjunto da Calendar API v3 usado pelo bot (events e freeBusy)."""
+
+    events = None  # id -> corpo do evento
+
+    def route(self, method, path, body):
+        path = path.split("?", 1)[0].rstrip("/")
+        match = re.search(r"/calendars/[^/]+/events(?:/([^/]+))?$", path)
+        if match:
+            event_id = match.group(1)
+            if method == "POST" and not event_id:
+                event = {**body, "id": uuid.uuid4().hex, "status": "confirmed"}
+                self.events[event["id"]] = event
+                return 200, event
+            if event_id and method == "GET":
+                event = self.events.get(event_id)
+                return (200, event) if event else (404, {"error": {"code": 404, "message": "Not Found"}})
+            if event_id and method in ("PUT", "PATCH"):
+                event = {**self.events.get(event_id, {}), **body, "id": event_id}
+                self.events[event_id] = event
+                return 200, event
+            if event_id and method == "DELETE":
+                self.events.pop(event_id, None)
+                return 204, None
+        if method == "POST" and path.endswith("/freeBusy"):
+            calendars = {item["id"]: {"busy": []} for item in body.get("items", [])}
+            return 200, {"kind": "calendar#freeBusy", "timeMin": body.get("timeMin"),
+                         "timeMax": body.get("timeMax"), "calendars": calendars}
+        return super().route(method, path, body)
+
+
+class StubServer:
+    """Sobe um handler em 127.0.0.1 numa porta livre, em thread daemon."""
+
+    def __init__(self, handler_cls, config: StubConfig, port: int = 0):
+        attrs = {"config": config, "calls": {}, "calls_lock": threading.Lock()}
+        if handler_cls is CalendarHandler:
+            attrs["events"] = {}
+        self.handler = type(handler_cls.__name__, (handler_cls,), attrs)
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", port), self.handler)
+        self.httpd.daemon_threads = True
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def calls(self):
+        return dict(self.handler.calls)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def start_stubs(graph: StubConfig, openai: StubConfig, calendar: StubConfig, ports=(0, 0, 0)):
+    """Sobe os três servidores e devolve (servidores, variáveis de ambiente para o app)."""
+    servers = {
+        "graph_api": StubServer(GraphApiHandler, graph, ports[0]).start(),
+        "openai": StubServer(OpenAIHandler, openai, ports[1]).start(),
+        "google_calendar": StubServer(CalendarHandler, calendar, ports[2]).start(),
+    }
+    env = {
+        "GRAPH_API_BASE_URL": servers["graph_api"].url,
+        "WHATSAPP_TOKEN": "stub-token",
+        "PHONE_NUMBER_ID": "1234567890",
+        "OPENAI_BASE_URL": f"{servers['openai'].url}/v1",
+        "OPENAI_API_KEY": "stub-key",
+        "GOOGLE_CALENDAR_API_ENDPOINT": f"{servers['google_calendar'].url}/calendar/v3/",
+    }
+    return servers, env
+
+
+def stub_google_token(calendar_url: str) -> str:
+    """Token OAuth falso (sem expiração) aceito por Credentials.from_authorized_user_info."""
+    return json.dumps({
+        "token": "stub-access-token",
+        "refresh_token": "stub-refresh-token",
+        "client_id": "stub-client-id",
+        "client_secret": "stub-client-secret",
+        "token_uri": f"{calendar_url}/token",
+        "scopes": ["https://www.googleapis.com/auth/calendar"],
+    })
+
+
+def add_stub_arguments(parser: argparse.ArgumentParser):
+    """Argumentos de latência/erro compartilhados pelas ferramentas de benchmark."""
+    for name, latency in (("graph", 0.05), ("openai", 0.3), ("calendar", 0.08)):
+        parser.add_argument(f"--{name}-latency", type=float, default=latency,
+                            help=f"Latência simulada (s) do stub {name}")
+        parser.add_argument(f"--{name}-jitter", type=float, default=latency / 2,
+                            help=f"Variação aleatória adicional (s) do stub {name}")
+        parser.add_argument(f"--{name}-error-rate", type=float, default=0.0,
+                            help=f"Fração de chamadas do stub {name} que devolvem 500")
+
+
+def configs_from_args(args):
+    """Converte os argumentos de add_stub_arguments() em StubConfig."""
+    return tuple(
+        StubConfig(getattr(args, f"{name}_latency"), getattr(args, f"{name}_jitter"),
+                   getattr(args, f"{name}_error_rate"))
+        for name in ("graph", "openai", "calendar")
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sobe os stubs de Graph API, OpenAI e Calendar.")
+    add_stub_arguments(parser)
+    parser.add_argument("--ports", type=int, nargs=3, default=(8101, 8102, 8103),
+                        metavar=("GRAPH", "OPENAI", "CALENDAR"))
+    args = parser.parse_args()
+
+    servers, env = start_stubs(*configs_from_args(args), ports=args.ports)
+    print("Stubs no ar. Exporte no processo do app:")
+    for key, value in env.items():
+        print(f"export {key}={value}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        for server in servers.values():
+            server.stop()
@@ -0,0 +1,161 @@
+# cache_bus.py - Barramento de invalidação de cache entre processos (Postgres LISTEN/NOTIFY)
+#
+# Cada worker mantém caches em memória (token, agenda...). Quando um dado muda,
+# quem alterou chama publish(tópico, chave): os callbacks locais rodam na hora
+# e um NOTIFY avisa os demais workers, que rodam os seus ao receber.
+#
+# Sem Postgres (ex: SQLite) o barramento funciona só dentro do processo.
+# LISTEN não funciona através de PgBouncer em modo transaction; nesse caso
+# aponte CACHE_BUS_DATABASE_URL para uma conexão direta com o Postgres.
+
+import json
+import os
+import select
+import socket
+import threading
+import time
+import uuid
+
+import metrics
+
+CANAL = os.getenv("CACHE_BUS_CHANNEL", "alfred_cache")
+CACHE_BUS_DATABASE_URL = os.getenv("CACHE_BUS_DATABASE_URL")
+# Validade máxima (s) das entradas dos caches invalidados pelo barramento
+# (token, agenda, conversas). É a rede de segurança para um NOTIFY que não
+# chegou: um worker fica com dado velho por no máximo esse tempo.
+CACHE_BUS_TTL = float(os.getenv("CACHE_BUS_TTL", "60"))
+# Tentativas de NOTIFY antes de desistir (o TTL acima cobre a falha)
+_TENTATIVAS_PUBLICAR = 2
+# Segundos de silêncio no LISTEN até testar a conexão com um SELECT 1
+_INTERVALO_PING = 30
+# Keepalive TCP da conexão do LISTEN: sem ele, uma conexão derrubada por NAT ou
+# balanceador sem avisar deixaria o próprio SELECT 1 esperando por minutos
+_KEEPALIVES = {"keepalives": 1, "keepalives_idle": 30, "keepalives_interval": 10, "keepalives_count": 3}
+
+# Identifica este processo, para ignorar o eco das próprias notificações
+ORIGEM = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+_assinantes = {}  # tópico -> lista de callbacks(chave)
+_lock = threading.Lock()
+_listener = None
+_estado = {"conectado": False, "reconexoes": 0}
+
+
+def subscribe(topico: str, callback):
+    """Registra callback(chave) para invalidações do tópico. chave=None significa 'tudo'."""
+    with _lock:
+        _assinantes.setdefault(topico, []).append(callback)
+
+
+def _dispatch(topico: str, chave):
+    for callback in list(_assinantes.get(topico, ())):
+        try:
+            callback(chave)
+        except Exception as e:
+            print(f"LOG (Cache Bus): Erro no callback de {topico}: {e}", flush=True)
+
+
+def _invalidar_tudo():
+    for topico in list(_assinantes):
+        _dispatch(topico, None)
+
+
+def _usa_postgres() -> bool:
+    import database
+    return database.engine.dialect.name == "postgresql"
+
+
+def publish(topico: str, chave=None):
+    """Invalida localmente e avisa os outros processos. Chame após o commit."""
+    _dispatch(topico, chave)
+    metrics.incr("cache_bus_publicados")
+    if not _usa_postgres():
+        return
+    import database
+    from sqlalchemy import text
+
+    payload = json.dumps({"o": ORIGEM, "t": topico, "k": chave}, default=str)
+    for tentativa in range(_TENTATIVAS_PUBLICAR):
+        try:
+            with database.engine.begin() as conn:
+                conn.execute(text("SELECT pg_notify(:canal, :payload)"), {"canal": CANAL, "payload": payload})
+            return
+        except Exception as e:
+            erro = e
+    # Os outros workers ficam com a entrada velha até CACHE_BUS_TTL; não derruba a operação
+    metrics.incr("cache_bus_falhas_publicar")
+    print(f"LOG (Cache Bus): Falha ao publicar {topico}: {erro}", flush=True)
+
+
+def _conectar():
+    """Conexão psycopg2 dedicada (fora do pool) para o LISTEN."""
+    import database
+    from sqlalchemy.engine import make_url
+
+    url = make_url(CACHE_BUS_DATABASE_URL) if CACHE_BUS_DATABASE_URL else database.engine.url
+    cargs, cparams = database.engine.dialect.create_connect_args(url)
+    for nome, valor in _KEEPALIVES.items():
+        cparams.setdefault(nome, valor)
+    conn = database.engine.dialect.dbapi.connect(*cargs, **cparams)
+    conn.autocommit = True
+    with conn.cursor() as cur:
+        cur.execute(f'LISTEN "{CANAL}"')
+    return conn
+
+
+def _listen_loop():
+    espera = 1.0
+    while True:
+        conn = None
+        try:
+            conn = _conectar()
+            _estado["conectado"] = True
+            espera = 1.0
+            # Mensagens podem ter sido perdidas enquanto estávamos desconectados
+            _invalidar_tudo()
+            while True:
+                if select.select([conn], [], [], _INTERVALO_PING) == ([], [], []):
+                    # Silêncio pode ser conexão morta: se o SELECT 1 falhar, reconecta
+                    # (e invalida tudo, pois avisos podem ter se perdido nesse meio-tempo)
+                    with conn.cursor() as cur:
+                        cur.execute("SELECT 1")
+                else:
+                    conn.poll()
+                while conn.notifies:
+                    notify = conn.notifies.pop(0)
+                    try:
+                        msg = json.loads(notify.payload)
+                    except ValueError:
+                        continue
+                    if msg.get("o") == ORIGEM:
+                        continue
+                    metrics.incr("cache_bus_recebidos")
+                    _dispatch(msg.get("t"), msg.get("k"))
+        except Exception as e:
+            print(f"LOG (Cache Bus): Listener desconectado ({e}); reconectando em {espera:.0f}s", flush=True)
+        finally:
+            _estado["conectado"] = False
+            if conn is not None:
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+        _estado["reconexoes"] += 1
+        time.sleep(espera)
+        espera = min(espera * 2, 30)
+
+
+def start():
+    """Inicia o listener deste processo (chamado no warm-up, depois do fork do gunicorn)."""
+    global _listener
+    if _listener is not None or not _usa_postgres():
+        return
+    _listener = threading.Thread(target=_listen_loop, name="cache-bus", daemon=True)
+    _listener.start()
+
+
+def status() -> dict:
+    return dict(_estado, origem=ORIGEM, ativo=_listener is not None)
+
+
+metrics.register_gauge("cache_bus", status)
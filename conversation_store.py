@@ -0,0 +1,193 @@
+# conversation_store.py - Estado de conversa por remetente (multi-turno)
+#
+# Guarda, por número de WhatsApp, um anel com os últimos turnos e o pedido
+# pendente (ex: um "agendar" em que faltou o horário). O estado fica em
+# memória (LRU com TTL) e é persistido na tabela "conversas", para sobreviver
+# a reinícios e ser visto por outros workers: cada salvar() publica no
+# cache_bus (tópico "conversa", chave = remetente), e os demais workers
+# descartam a cópia em memória e relêem do banco na próxima mensagem (se o
+# aviso se perder, a cópia vence sozinha após cache_bus.CACHE_BUS_TTL).
+#
+# Quando há um pedido pendente e a resposta seguinte é só o dado que faltava
+# ("às 15h", "amanhã às 9h", "pode ser sexta"), ela é completada localmente,
+# sem chamar a IA. Qualquer outra mensagem ("qual minha agenda amanhã?",
+# "esquece, marca almoço às 13h") vai para a IA, com o pedido pendente e os
+# turnos recentes como contexto.
+
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict, deque
+from datetime import datetime, timedelta
+
+import cache_bus
+import database
+from nlp_processor import AgendaAction, DURACAO_PADRAO, agora_local, extrair_data, extrair_hora, sem_data_hora
+
+CONVERSA_MAX_TURNOS = int(os.getenv("CONVERSA_MAX_TURNOS", "6"))
+CONVERSA_TTL = int(os.getenv("CONVERSA_TTL", "1800"))  # segundos
+CONVERSA_MAX_REMETENTES = int(os.getenv("CONVERSA_MAX_REMETENTES", "10000"))
+
+
+class Conversa:
+    """Turnos recentes e pedido pendente de um remetente."""
+    __slots__ = ("remetente", "turnos", "pendente", "atualizado_em")
+
+    def __init__(self, remetente: str, turnos=(), pendente=None, atualizado_em=None):
+        self.remetente = remetente
+        self.turnos = deque(turnos, maxlen=CONVERSA_MAX_TURNOS)
+        self.pendente = pendente
+        self.atualizado_em = atualizado_em or datetime.utcnow()
+
+    def registrar(self, papel: str, texto: str):
+        self.turnos.append((papel, texto))
+        self.atualizado_em = datetime.utcnow()
+
+    def expirada(self) -> bool:
+        return datetime.utcnow() - self.atualizado_em > timedelta(seconds=CONVERSA_TTL)
+
+    def to_json(self) -> str:
+        return json.dumps({"turnos": list(self.turnos), "pendente": self.pendente}, ensure_ascii=False)
+
+    @classmethod
+    def from_json(cls, remetente: str, estado_json: str, atualizado_em):
+        estado = json.loads(estado_json or "{}")
+        return cls(remetente, [tuple(t) for t in estado.get("turnos", [])], estado.get("pendente"), atualizado_em)
+
+
+_cache = OrderedDict()  # remetente -> (Conversa, expira_em) (LRU)
+_lock = threading.Lock()
+
+
+def _invalidar(remetente):
+    with _lock:
+        if remetente is None:
+            _cache.clear()
+        else:
+            _cache.pop(remetente, None)
+
+
+cache_bus.subscribe("conversa", _invalidar)
+
+
+def carregar(db, remetente: str) -> Conversa:
+    """Conversa do remetente: memória, depois banco; nova se expirada ou inexistente."""
+    with _lock:
+        entrada = _cache.get(remetente)
+        conversa = entrada[0] if entrada is not None and entrada[1] > time.monotonic() else None
+        if conversa is not None:
+            _cache.move_to_end(remetente)
+    if conversa is None:
+        registro = db.get(database.Conversa, remetente)
+        if registro is not None:
+            conversa = Conversa.from_json(remetente, registro.estado_json, registro.atualizado_em)
+    if conversa is None or conversa.expirada():
+        conversa = Conversa(remetente)
+    return conversa
+
+
+def salvar(db, conversa: Conversa):
+    """Persiste no banco, avisa os outros workers e atualiza a memória (com despejo LRU)."""
+    db.merge(database.Conversa(remetente=conversa.remetente, estado_json=conversa.to_json(),
+                               atualizado_em=conversa.atualizado_em))
+    db.commit()
+    # Também descarta a cópia local; a versão recém-salva entra logo abaixo
+    cache_bus.publish("conversa", conversa.remetente)
+    with _lock:
+        _cache[conversa.remetente] = (conversa, time.monotonic() + cache_bus.CACHE_BUS_TTL)
+        _cache.move_to_end(conversa.remetente)
+        while len(_cache) > CONVERSA_MAX_REMETENTES:
+            _cache.popitem(last=False)
+
+
+def novo_pendente(acao: AgendaAction):
+    """Pedido pendente a partir de uma resposta 'erro' da IA que pede dado faltante."""
+    if not acao.acao_pendente:
+        return None
+    return {
+        "action": acao.acao_pendente,
+        "titulo": acao.titulo,
+        "assunto": acao.assunto,
+        "duracao": acao.duracao or DURACAO_PADRAO,
+        "id_compromisso": acao.id_compromisso,
+        "data": acao.data,
+        "hora": acao.hora,
+    }
+
+
+# Palavras que podem acompanhar a data/hora numa resposta curta ("pode ser amanhã às 15h, ok")
+_PREENCHIMENTO = {
+    "a", "à", "às", "as", "ao", "o", "e", "de", "do", "da", "dia", "no", "na", "em", "para", "pra", "pro",
+    "pode", "ser", "seria", "que", "tal", "então", "entao", "sim", "ok", "isso", "melhor", "prefiro",
+    "hora", "horas", "hrs", "feira", "por", "favor", "obrigado", "obrigada",
+}
+
+
+def _so_data_hora(texto: str) -> bool:
+    """A mensagem é só uma data/horário (mais palavras de ligação), sem outro pedido."""
+    return all(palavra in _PREENCHIMENTO for palavra in re.findall(r"\w+", sem_data_hora(texto).lower()))
+
+
+def preencher_pendente(conversa: Conversa, texto: str, agora: datetime = None):
+    """Tenta completar o pedido pendente só com a mensagem nova.
+
+    Devolve uma AgendaAction (pronta para executar, ou um "erro" pedindo o
+    horário quando só veio a data), ou None quando a mensagem não é só o dado
+    que faltava (a IA decide, com o pendente como contexto). Não altera
+    conversa.pendente.
+    """
+    if not conversa.pendente or conversa.pendente.get("action") not in ("agendar", "reagendar"):
+        return None
+    if conversa.pendente["action"] == "reagendar" and not conversa.pendente.get("id_compromisso"):
+        return None
+    if not _so_data_hora(texto):
+        return None
+    # Cópia: o objeto da conversa é o mesmo guardado no cache em memória
+    pendente = dict(conversa.pendente)
+    agora = agora or agora_local()
+
+    data = extrair_data(texto, agora)
+    hora = extrair_hora(texto)
+    if data:
+        pendente["data"] = data.isoformat()
+    if hora:
+        pendente["hora"] = f"{hora[0]:02d}:{hora[1]:02d}"
+    if not pendente.get("hora"):
+        if not data:
+            return None  # Mensagem não trouxe nada do que falta: deixa para a IA
+        # Veio só a data: pergunta o horário sem gastar uma chamada à IA
+        return AgendaAction(
+            action="erro",
+            titulo=pendente.get("titulo"),
+            assunto=pendente.get("assunto"),
+            duracao=pendente.get("duracao") or DURACAO_PADRAO,
+            id_compromisso=pendente.get("id_compromisso"),
+            resposta_whatsapp=f"Anotado, {data.strftime('%d/%m')}. E qual o horário?",
+            acao_pendente=pendente["action"],
+            data=pendente["data"],
+        )
+
+    hh, mm = (int(x) for x in pendente["hora"].split(":"))
+    if pendente.get("data"):
+        dia = datetime.fromisoformat(pendente["data"]).date()
+    else:
+        # Só o horário: hoje se ainda não passou, senão amanhã (mesma regra do simple_nlp_parser)
+        dia = agora.date() if (hh, mm) > (agora.hour, agora.minute) else (agora + timedelta(days=1)).date()
+    data_hora = datetime(dia.year, dia.month, dia.day, hh, mm)
+
+    titulo = pendente.get("titulo") or "Compromisso"
+    if pendente["action"] == "agendar":
+        resposta = f"Certo, marquei {titulo} para {data_hora.strftime('%d/%m')} às {data_hora.strftime('%H:%M')}."
+    else:
+        resposta = f"Feito, remarquei para {data_hora.strftime('%d/%m')} às {data_hora.strftime('%H:%M')}."
+    return AgendaAction(
+        action=pendente["action"],
+        titulo=titulo,
+        data_hora=data_hora,
+        assunto=pendente.get("assunto"),
+        duracao=pendente.get("duracao") or DURACAO_PADRAO,
+        id_compromisso=pendente.get("id_compromisso"),
+        resposta_whatsapp=resposta,
+    )
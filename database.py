@@ -1,22 +1,146 @@
 # database.py - Versão Final para PostgreSQL (SQLAlchemy)
 
 import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
 from datetime import datetime
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, func
+from sqlalchemy import create_engine, event, select, text, update, Column, Integer, String, Date, DateTime, Float, func
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.exc import SQLAlchemyError
+import cache_bus
+import metrics
 
 # 1. Configuração do Banco de Dados
 # O Render injeta a URL de conexão no DATABASE_URL
 DATABASE_URL = os.environ.get("DATABASE_URL")
 
+# Modo embarcado (nó único): sem DATABASE_URL, usa um arquivo SQLite local em
+# WAL. Serve para rodar localmente, testes, benchmarks e clientes pequenos.
+SQLITE_PATH = os.environ.get("SQLITE_PATH", "alfred.db")
+# Quanto tempo (s) esperar por um lock do SQLite antes de falhar
+SQLITE_BUSY_TIMEOUT = float(os.environ.get("SQLITE_BUSY_TIMEOUT", "30"))
+# Prazo (s) do lock de job no SQLite (job_locks); renovado a cada terço enquanto o
+# job roda, vence sozinho se o processo morrer
+JOB_LOCK_TTL = float(os.environ.get("JOB_LOCK_TTL", "180"))
+
 if not DATABASE_URL:
-    # Esta é uma URL de fallback, mas o Render deve fornecer a correta
-    raise ValueError("DATABASE_URL environment variable not set.")
+    DATABASE_URL = f"sqlite:///{SQLITE_PATH}"
+    print(f"AVISO: DATABASE_URL não definida; usando SQLite embarcado em {os.path.abspath(SQLITE_PATH)} "
+          "(apenas um processo/worker).", flush=True)
+
+# SQLAlchemy exige "postgresql://"; o Render/Heroku ainda entregam "postgres://"
+if DATABASE_URL.startswith("postgres://"):
+    DATABASE_URL = "postgresql://" + DATABASE_URL[len("postgres://"):]
+
+IS_SQLITE = DATABASE_URL.startswith("sqlite")
+
+# Configuração do pool de conexões (todas opcionais)
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", "30"))
+# Recicla conexões antes que o Postgres gerenciado derrube as ociosas
+DB_POOL_RECYCLE = int(os.environ.get("DB_POOL_RECYCLE", "1800"))
+# Testa a conexão (SELECT 1) ao retirá-la do pool; evita erros de conexão morta
+DB_POOL_PRE_PING = os.environ.get("DB_POOL_PRE_PING", "1") == "1"
+# Com um pooler externo (PgBouncer em modo transaction) o pool fica com ele:
+# cada sessão abre/fecha sua conexão com o PgBouncer (NullPool)
+DB_EXTERNAL_POOLER = os.environ.get("DB_EXTERNAL_POOLER", "0") == "1"
+
+
+def _engine_kwargs(url: str) -> dict:
+    """Parâmetros do create_engine conforme o modo de pool configurado."""
+    if DB_EXTERNAL_POOLER:
+        return {"poolclass": NullPool}
+    kwargs = {"pool_pre_ping": DB_POOL_PRE_PING, "pool_recycle": DB_POOL_RECYCLE}
+    if url.startswith("sqlite"):
+        # As sessões rodam em threads da fila de mensagens e do threadpool
+        kwargs["connect_args"] = {"check_same_thread": False, "timeout": SQLITE_BUSY_TIMEOUT}
+    else:
+        kwargs.update(pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW, pool_timeout=DB_POOL_TIMEOUT)
+    return kwargs
+
 
 # Cria o engine de conexão
-engine = create_engine(DATABASE_URL)
+engine = create_engine(DATABASE_URL, **_engine_kwargs(DATABASE_URL))
+
+
+def pool_status() -> dict:
+    """Estado atual do pool de conexões (exportado nas métricas)."""
+    pool = engine.pool
+    status = {"classe": type(pool).__name__}
+    for nome, metodo in (("tamanho", "size"), ("livres", "checkedin"),
+                         ("em_uso", "checkedout"), ("overflow", "overflow")):
+        if hasattr(pool, metodo):
+            status[nome] = getattr(pool, metodo)()
+    return status
+
+
+metrics.register_gauge("db_pool", pool_status)
+
+@event.listens_for(engine, "connect")
+def _nova_conexao(dbapi_connection, connection_record):
+    metrics.incr("db_pool_conexoes_abertas")
+
+# --- SQLite embarcado: pragmas e escritor único ---
+#
+# O SQLite aceita um único escritor por vez. Em vez de deixar as threads
+# disputarem o lock do arquivo (e falharem com "database is locked"), cada
+# transação de escrita pega _escritor antes do primeiro INSERT/UPDATE/DELETE/DDL
+# e o devolve quando a conexão volta ao pool. Leituras não esperam (WAL).
+_escritor = threading.Lock()
+_ESCRITAS = ("INSERT", "UPDATE", "DELETE", "REPLACE", "CREATE", "ALTER", "DROP")
+
+def _liberar_escritor(info):
+    if info.pop("escritor", False):
+        _escritor.release()
+
+if IS_SQLITE:
+    @event.listens_for(engine, "connect")
+    def _pragmas_sqlite(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for pragma in ("journal_mode=WAL", "synchronous=NORMAL", "foreign_keys=ON", "temp_store=MEMORY",
+                       "cache_size=-32000", "mmap_size=268435456", f"busy_timeout={int(SQLITE_BUSY_TIMEOUT * 1000)}"):
+            cursor.execute(f"PRAGMA {pragma}")
+        cursor.close()
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _pegar_escritor(conn, cursor, statement, parameters, context, executemany):
+        if conn.info.get("escritor") or not statement.lstrip()[:7].upper().startswith(_ESCRITAS):
+            return
+        inicio = time.perf_counter()
+        if not _escritor.acquire(timeout=SQLITE_BUSY_TIMEOUT):
+            raise TimeoutError("Tempo esgotado esperando a vez de escrever no SQLite.")
+        metrics.observe("sqlite_fila_escrita", time.perf_counter() - inicio)
+        conn.info["escritor"] = True
+
+    # A Session (e o engine.begin()) devolve a conexão ao pool logo após o
+    # commit/rollback; é aí que o escritor é liberado, já com o COMMIT feito
+    @event.listens_for(engine, "checkin")
+    def _checkin_sqlite(dbapi_connection, connection_record):
+        _liberar_escritor(connection_record.info)
+
+@event.listens_for(engine, "invalidate")
+def _conexao_invalidada(dbapi_connection, connection_record, exception):
+    metrics.incr("db_pool_conexoes_invalidadas")
+
+# Mede o tempo de cada comando SQL (etapa "db" das métricas)
+@event.listens_for(engine, "before_cursor_execute")
+def _inicio_query(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+@event.listens_for(engine, "after_cursor_execute")
+def _fim_query(conn, cursor, statement, parameters, context, executemany):
+    metrics.observe("db", time.perf_counter() - conn.info["query_start"].pop())
+
+@event.listens_for(engine, "handle_error")
+def _erro_query(context):
+    conn = context.connection
+    if conn is not None and conn.info.get("query_start"):
+        metrics.observe("db", time.perf_counter() - conn.info["query_start"].pop(), ok=False)
 
 # Base Declarativa para os modelos
 Base = declarative_base()
@@ -33,14 +157,65 @@ class Token(Base):
 class Compromisso(Base):
     """Modelo para armazenar os compromissos agendados via WhatsApp."""
     __tablename__ = "compromissos"
+    # No SQLite, sem AUTOINCREMENT o maior ID volta a ser usado depois que a
+    # linha sai da tabela (arquivamento), colidindo com compromissos_arquivo
+    __table_args__ = {"sqlite_autoincrement": True}
     id = Column(Integer, primary_key=True, index=True)
     titulo = Column(String)
-    data_hora = Column(DateTime)
+    data_hora = Column(DateTime, index=True)
     assunto = Column(String)
     duracao = Column(Integer)  # Duração em minutos
     recorrencia = Column(String, nullable=True)
     # Adiciona um campo para rastrear o ID do evento no Google Calendar
     google_event_id = Column(String, nullable=True)
+    # Número de WhatsApp de quem marcou (destinatário do resumo diário)
+    usuario = Column(String, nullable=True, index=True)
+    # Incrementada a cada alteração (compare-and-swap em update_compromisso)
+    version = Column(Integer, nullable=False, default=1, server_default="1")
+
+class CompromissoArquivo(Base):
+    """Compromissos passados movidos pelo arquivamento (arquivamento.py); mesmas colunas da tabela quente."""
+    __tablename__ = "compromissos_arquivo"
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    titulo = Column(String)
+    data_hora = Column(DateTime, index=True)
+    assunto = Column(String)
+    duracao = Column(Integer)
+    recorrencia = Column(String, nullable=True)
+    google_event_id = Column(String, nullable=True)
+    usuario = Column(String, nullable=True, index=True)
+    version = Column(Integer, nullable=False, default=1, server_default="1")
+    arquivado_em = Column(DateTime, default=datetime.utcnow)
+
+class Conversa(Base):
+    """Estado da conversa por remetente (turnos recentes e pedido pendente), em JSON."""
+    __tablename__ = "conversas"
+    remetente = Column(String, primary_key=True)
+    estado_json = Column(String)
+    atualizado_em = Column(DateTime, index=True)
+
+class CanalPush(Base):
+    """Canal de push do Google Calendar em uso, por conta; parado antes de abrir o próximo."""
+    __tablename__ = "canais_push"
+    user_id = Column(String, primary_key=True)
+    canal_id = Column(String)
+    resource_id = Column(String)
+    expira_em = Column(DateTime, nullable=True)
+    renovado_em = Column(DateTime, default=datetime.utcnow)
+
+class DigestEnvio(Base):
+    """Checkpoint do resumo diário: um registro por (dia, usuário) já enviado."""
+    __tablename__ = "digest_envios"
+    dia = Column(Date, primary_key=True)
+    usuario = Column(String, primary_key=True)
+    enviado_em = Column(DateTime, default=datetime.utcnow)
+
+class JobLock(Base):
+    """Lock de job no SQLite (o advisory lock do Postgres não existe lá): dono e prazo."""
+    __tablename__ = "job_locks"
+    chave = Column(Integer, primary_key=True)
+    dono = Column(String, nullable=False)
+    expira_em = Column(Float, nullable=False)  # time.time()
 
 # 3. Inicialização do Banco de Dados
 def initialize_db():
@@ -59,6 +234,78 @@ def get_compromisso_por_id(db, compromisso_id: int):
     """Retorna um compromisso pelo ID."""
     return db.query(Compromisso).filter(Compromisso.id == compromisso_id).first()
 
+@contextmanager
+def advisory_lock(chave: int):
+    """Lock exclusivo entre processos para jobs: `with advisory_lock(ID) as obtido:`.
+
+    No Postgres é um pg_try_advisory_xact_lock numa conexão dedicada, com a
+    transação aberta durante todo o bloco; o rollback ao sair libera o lock
+    (também se o processo morrer), e a transação prende a mesma conexão do
+    servidor mesmo atrás de PgBouncer em modo transaction. O trabalho do job
+    roda nas suas próprias sessões.
+
+    No SQLite o app e os jobs de linha de comando (digest.py, arquivamento.py)
+    podem rodar ao mesmo tempo sobre o mesmo arquivo: o lock é uma linha em
+    job_locks, tomada num BEGIN IMMEDIATE e renovada em segundo plano.
+    """
+    if engine.dialect.name == "sqlite":
+        with _job_lock_sqlite(chave) as obtido:
+            yield obtido
+        return
+    if engine.dialect.name != "postgresql":
+        yield True
+        return
+    with engine.connect() as conn:
+        transacao = conn.begin()
+        try:
+            yield bool(conn.execute(text("SELECT pg_try_advisory_xact_lock(:id)"), {"id": chave}).scalar())
+        finally:
+            transacao.rollback()
+
+@contextmanager
+def _job_lock_sqlite(chave: int):
+    t = JobLock.__table__
+    dono = f"{os.getpid()}:{uuid.uuid4().hex[:8]}"
+    with engine.connect() as conn:
+        # IMMEDIATE: pega o lock de escrita do arquivo já no BEGIN, então ler e
+        # gravar a linha é atômico também entre processos
+        conn.exec_driver_sql("BEGIN IMMEDIATE")
+        try:
+            t.create(conn, checkfirst=True)  # o lock das migrações vem antes do create_all
+            agora = time.time()
+            conn.execute(t.delete().where(t.c.chave == chave, t.c.expira_em < agora))
+            obtido = conn.execute(select(t.c.dono).where(t.c.chave == chave)).first() is None
+            if obtido:
+                conn.execute(t.insert().values(chave=chave, dono=dono, expira_em=agora + JOB_LOCK_TTL))
+        except Exception:
+            conn.rollback()
+            raise
+        conn.commit()
+    if not obtido:
+        yield False
+        return
+
+    parar = threading.Event()
+
+    def renovar():
+        while not parar.wait(JOB_LOCK_TTL / 3):
+            try:
+                with engine.begin() as conn:
+                    conn.execute(t.update().where(t.c.chave == chave, t.c.dono == dono)
+                                 .values(expira_em=time.time() + JOB_LOCK_TTL))
+            except Exception as e:  # tenta de novo no próximo ciclo, ainda dentro do prazo
+                print(f"LOG (DB): Falha ao renovar o lock de job {chave:#x}: {e}", flush=True)
+
+    renovador = threading.Thread(target=renovar, name=f"job-lock-{chave:x}", daemon=True)
+    renovador.start()
+    try:
+        yield True
+    finally:
+        parar.set()
+        renovador.join()
+        with engine.begin() as conn:
+            conn.execute(t.delete().where(t.c.chave == chave, t.c.dono == dono))
+
 def get_db():
     """Função utilitária para obter uma sessão de banco de dados."""
     db = SessionLocal()
@@ -67,20 +314,40 @@ def get_db():
     finally:
         db.close()
 
-def create_compromisso(db, titulo: str, data_hora: datetime, assunto: str, duracao: int, recorrencia: str = None):
+@contextmanager
+def session_scope():
+    """Sessão para jobs em segundo plano: rollback em caso de erro e devolução garantida ao pool."""
+    db = SessionLocal()
+    try:
+        yield db
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+def create_compromisso(db, titulo: str, data_hora: datetime, assunto: str, duracao: int, recorrencia: str = None,
+                       usuario: str = None):
     """Cria um novo compromisso no banco de dados."""
     db_compromisso = Compromisso(
         titulo=titulo,
         data_hora=data_hora,
         assunto=assunto,
         duracao=duracao,
-        recorrencia=recorrencia
+        recorrencia=recorrencia,
+        usuario=usuario
     )
     db.add(db_compromisso)
     db.commit()
     db.refresh(db_compromisso)
+    publicar_dias_agenda(data_hora)
     return db_compromisso
 
+def publicar_dias_agenda(*datas):
+    """Invalida (via cache_bus, tópico "agenda") o cache dos dias afetados. Chame após o commit."""
+    for dia in {d.date() for d in datas if d is not None}:
+        cache_bus.publish("agenda", dia.isoformat())
+
 def get_compromissos_do_dia(db, data: datetime):
     """Retorna todos os compromissos para uma data específica."""
     start_of_day = data.replace(hour=0, minute=0, second=0, microsecond=0)
@@ -91,28 +358,82 @@ def get_compromissos_do_dia(db, data: datetime):
         Compromisso.data_hora <= end_of_day
     ).order_by(Compromisso.data_hora).all()
 
-def update_compromisso(db, compromisso_id: int, novos_dados: dict):
-    """Atualiza um compromisso existente."""
-    db_compromisso = db.query(Compromisso).filter(Compromisso.id == compromisso_id).first()
-    if db_compromisso:
-        for key, value in novos_dados.items():
-            setattr(db_compromisso, key, value)
-        db.commit()
-        db.refresh(db_compromisso)
-        return db_compromisso
-    return None
+class ConflitoVersao(Exception):
+    """O compromisso foi alterado por outro processo entre a leitura e a escrita."""
+
+# Quantas vezes update_compromisso relê a versão e tenta de novo antes de desistir
+UPDATE_TENTATIVAS = 3
+
+def update_compromisso(db, compromisso_id: int, novos_dados: dict, versao_esperada: int = None):
+    """
+    Atualiza um compromisso existente com compare-and-swap na coluna version:
+    um único UPDATE ... WHERE id = ? AND version = ?, que também incrementa a versão.
+    Com versao_esperada (a versão que o chamador leu), um conflito levanta
+    ConflitoVersao na hora; é o caminho de qualquer edição pedida pelo usuário.
+    Sem ela, a versão atual é relida e o UPDATE tentado de novo (até
+    UPDATE_TENTATIVAS vezes): última escrita vence, só para rotinas internas.
+    """
+    tabela = Compromisso.__table__
+    novos_dados = {k: v for k, v in novos_dados.items() if k not in ("id", "version")}
+    for _ in range(UPDATE_TENTATIVAS):
+        atual = db.execute(
+            select(tabela.c.version, tabela.c.data_hora).where(tabela.c.id == compromisso_id)
+        ).first()
+        if atual is None:
+            return None
+        versao = atual.version if versao_esperada is None else versao_esperada
+        resultado = db.execute(
+            update(tabela)
+            .where(tabela.c.id == compromisso_id, tabela.c.version == versao)
+            .values(version=tabela.c.version + 1, **novos_dados)
+        )
+        if resultado.rowcount == 1:
+            db.commit()
+            db_compromisso = db.get(Compromisso, compromisso_id)  # o commit expira a sessão: vem recarregado
+            # Reagendamento para outro dia: invalida o dia antigo e o novo
+            publicar_dias_agenda(atual.data_hora, db_compromisso.data_hora)
+            return db_compromisso
+        db.rollback()
+        metrics.incr("compromisso_conflitos_versao")
+        if versao_esperada is not None:
+            break
+    raise ConflitoVersao(f"Compromisso {compromisso_id} alterado concorrentemente.")
+
+def vincular_google_event(db, compromisso_id: int, google_event_id: str):
+    """Grava o ID do evento no Google sem mudar a versão (não é uma edição do compromisso)."""
+    tabela = Compromisso.__table__
+    db.execute(update(tabela).where(tabela.c.id == compromisso_id).values(google_event_id=google_event_id))
+    db.commit()
 
 def delete_compromisso(db, compromisso_id: int):
     """Deleta um compromisso pelo ID."""
     db_compromisso = db.query(Compromisso).filter(Compromisso.id == compromisso_id).first()
     if db_compromisso:
+        data_hora = db_compromisso.data_hora
         db.delete(db_compromisso)
         db.commit()
+        publicar_dias_agenda(data_hora)
         return True
     return False
 
 # 6. Funções de CRUD para Token (Google Calendar)
 
+# Cache em memória de user_id -> (token_json, expira_em), invalidado via cache_bus
+# (tópico "token") e, se um aviso se perder, vencido após cache_bus.CACHE_BUS_TTL
+_token_cache = {}
+# Incrementada a cada invalidação: uma leitura iniciada antes dela não repovoa o cache
+_token_geracao = 0
+
+def _invalidar_token(user_id):
+    global _token_geracao
+    _token_geracao += 1
+    if user_id is None:
+        _token_cache.clear()
+    else:
+        _token_cache.pop(user_id, None)
+
+cache_bus.subscribe("token", _invalidar_token)
+
 def save_token(db, user_id: str, token_json: str):
     """Salva ou atualiza o token de acesso do Google Calendar."""
     db_token = db.query(Token).filter(Token.user_id == user_id).first()
@@ -123,20 +444,52 @@ def save_token(db, user_id: str, token_json: str):
         db.add(db_token)
     db.commit()
     db.refresh(db_token)
+    cache_bus.publish("token", user_id)
     return db_token
 
 def get_token(db, user_id: str):
     """Obtém o token de acesso do Google Calendar."""
     return db.query(Token).filter(Token.user_id == user_id).first()
 
+def get_token_json(db, user_id: str):
+    """Obtém só o JSON do token, servido do cache em memória quando possível."""
+    entrada = _token_cache.get(user_id)
+    if entrada is not None and entrada[1] > time.monotonic():
+        return entrada[0]
+    geracao = _token_geracao
+    db_token = get_token(db, user_id)
+    token_json = db_token.token_json if db_token else None
+    if geracao == _token_geracao:
+        _token_cache[user_id] = (token_json, time.monotonic() + cache_bus.CACHE_BUS_TTL)
+    return token_json
+
 def delete_token(db, user_id: str):
     """Deleta o token de acesso do Google Calendar."""
     db_token = db.query(Token).filter(Token.user_id == user_id).first()
     if db_token:
         db.delete(db_token)
         db.commit()
+        cache_bus.publish("token", user_id)
         return True
     return False
 
+def get_canal_push(db, user_id: str):
+    """Canal de push registrado para a conta (ou None)."""
+    return db.query(CanalPush).filter(CanalPush.user_id == user_id).first()
+
+def save_canal_push(db, user_id: str, canal_id: str, resource_id: str, expira_em: datetime = None):
+    """Grava o canal de push recém-aberto, substituindo o anterior."""
+    canal = get_canal_push(db, user_id) or CanalPush(user_id=user_id)
+    canal.canal_id, canal.resource_id, canal.expira_em = canal_id, resource_id, expira_em
+    canal.renovado_em = datetime.utcnow()
+    db.add(canal)
+    db.commit()
+    return canal
+
+def delete_canal_push(db, user_id: str):
+    """Esquece o canal de push da conta (já parado ou inválido)."""
+    db.query(CanalPush).filter(CanalPush.user_id == user_id).delete()
+    db.commit()
+
 # 7. Chamada de Inicialização (para ser chamada no main.py)
 # A função initialize_db() deve ser chamada uma vez na inicialização do FastAPI.
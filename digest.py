@@ -0,0 +1,152 @@
+# digest.py - Resumo diário da agenda enviado pelo WhatsApp
+#
+# Uma única consulta busca os compromissos do dia de TODOS os usuários,
+# ordenados por usuário; as mensagens são montadas em lote e enviadas pela
+# sessão HTTP compartilhada do whatsapp_api, com concorrência limitada
+# (DIGEST_CONCORRENCIA) e um limite de envios por segundo (DIGEST_TAXA).
+#
+# Cada envio bem-sucedido é gravado em "digest_envios"; se o job for
+# interrompido, a próxima execução do mesmo dia retoma de onde parou.
+#
+# Uso:
+#   python digest.py                 # resumo de hoje
+#   python digest.py --data 2025-03-10
+# Ou agendado no próprio app com DIGEST_AGENDADO=1 (horário em DIGEST_HORA).
+
+import argparse
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import date, datetime, timedelta
+from itertools import groupby
+
+from pytz import timezone
+
+import agendador
+import database
+import metrics
+from whatsapp_api import send_whatsapp_message
+
+DIGEST_CONCORRENCIA = int(os.getenv("DIGEST_CONCORRENCIA", "4"))
+DIGEST_TAXA = float(os.getenv("DIGEST_TAXA", "20"))  # envios por segundo
+DIGEST_HORA = os.getenv("DIGEST_HORA", "07:00")
+DIGEST_AGENDADO = os.getenv("DIGEST_AGENDADO", "0") == "1"
+
+TZ = timezone('America/Sao_Paulo')
+# Chave do advisory lock do Postgres: só um worker/processo envia o resumo por vez
+_LOCK_ID = 0x616C6664  # "alfd"
+
+
+class TokenBucket:
+    """Limitador de taxa: até `taxa` liberações por segundo, com rajada de `capacidade`."""
+
+    def __init__(self, taxa: float, capacidade: float = None):
+        self.taxa = taxa
+        self.capacidade = capacidade or max(1.0, taxa)
+        self._tokens = self.capacidade
+        self._ultimo = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                agora = time.monotonic()
+                self._tokens = min(self.capacidade, self._tokens + (agora - self._ultimo) * self.taxa)
+                self._ultimo = agora
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                espera = (1 - self._tokens) / self.taxa
+            time.sleep(espera)
+
+
+def compromissos_por_usuario(db, dia: date):
+    """{usuario: [(id, titulo, data_hora), ...]} do dia, numa única consulta agrupada."""
+    inicio = datetime.combine(dia, datetime.min.time())
+    c = database.Compromisso
+    linhas = db.query(c.usuario, c.id, c.titulo, c.data_hora).filter(
+        c.usuario.isnot(None),
+        c.data_hora >= inicio,
+        c.data_hora < inicio + timedelta(days=1),
+    ).order_by(c.usuario, c.data_hora).all()
+    return {usuario: [l[1:] for l in grupo] for usuario, grupo in groupby(linhas, key=lambda l: l[0])}
+
+
+def renderizar(dia: date, itens) -> str:
+    """Texto do resumo de um usuário."""
+    linhas = "\n".join(f"- {data_hora.strftime('%H:%M')} {titulo} (ID {id_})" for id_, titulo, data_hora in itens)
+    return f"Bom dia! Sua agenda de hoje ({dia.strftime('%d/%m')}):\n{linhas}"
+
+
+def _ja_enviados(db, dia: date) -> set:
+    return {u for (u,) in db.query(database.DigestEnvio.usuario).filter(database.DigestEnvio.dia == dia)}
+
+
+def _registrar_envio(db, dia: date, usuario: str):
+    db.add(database.DigestEnvio(dia=dia, usuario=usuario))
+    db.commit()
+
+
+def enviar_digest(dia: date = None) -> dict:
+    """Monta e envia o resumo do dia para todos os usuários ainda não atendidos."""
+    dia = dia or datetime.now(TZ).date()
+    resultado = {"dia": dia.isoformat(), "usuarios": 0, "enviados": 0, "ja_enviados": 0, "falhas": 0}
+
+    with metrics.timed("digest"), database.advisory_lock(_LOCK_ID) as obtido, database.session_scope() as db:
+        if not obtido:
+            print("LOG (Digest): Outro processo já está enviando o resumo.", flush=True)
+            resultado["em_andamento"] = True
+            return resultado
+
+        agenda = compromissos_por_usuario(db, dia)
+        enviados = _ja_enviados(db, dia)
+        resultado["usuarios"] = len(agenda)
+        mensagens = {u: renderizar(dia, itens) for u, itens in agenda.items() if u not in enviados}
+        resultado["ja_enviados"] = len(agenda) - len(mensagens)
+
+        limite = TokenBucket(DIGEST_TAXA)
+
+        def enviar(usuario, texto):
+            limite.acquire()
+            return send_whatsapp_message(usuario, texto)
+
+        # Os envios rodam no pool; o checkpoint é gravado aqui, numa só thread/sessão
+        with ThreadPoolExecutor(max_workers=DIGEST_CONCORRENCIA, thread_name_prefix="digest") as pool:
+            futuros = {pool.submit(enviar, u, texto): u for u, texto in mensagens.items()}
+            for futuro in as_completed(futuros):
+                usuario = futuros[futuro]
+                try:
+                    ok = futuro.result()
+                except Exception as e:
+                    print(f"LOG (Digest): Erro ao enviar para {usuario}: {e}", flush=True)
+                    ok = False
+                if ok:
+                    _registrar_envio(db, dia, usuario)
+                    resultado["enviados"] += 1
+                else:
+                    resultado["falhas"] += 1
+
+    metrics.incr("digest_enviados", resultado["enviados"])
+    metrics.incr("digest_falhas", resultado["falhas"])
+    print(f"LOG (Digest): {resultado}", flush=True)
+    return resultado
+
+
+def start():
+    """Liga o envio diário às DIGEST_HORA, se DIGEST_AGENDADO=1."""
+    if DIGEST_AGENDADO:
+        agendador.diario("digest", DIGEST_HORA, enviar_digest)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Envia o resumo diário da agenda pelo WhatsApp.")
+    parser.add_argument("--data", type=date.fromisoformat, help="Dia do resumo (YYYY-MM-DD); padrão: hoje")
+    args = parser.parse_args()
+    try:
+        resultado = enviar_digest(args.data)
+    except Exception as e:
+        print(f"Erro ao enviar o resumo: {e}", flush=True)
+        sys.exit(1)
+    sys.exit(1 if resultado["falhas"] else 0)
@@ -1,11 +1,16 @@
 import os
 import json
 import base64
-from datetime import timedelta
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import Flow
-from google.auth.transport.requests import Request
-from googleapiclient.discovery import build
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from pytz import timezone
+import cache_bus
+import metrics
+
+# As bibliotecas do Google (em especial googleapiclient.discovery) são pesadas
+# de importar; por isso são importadas dentro das funções, no primeiro uso.
 
 # --- Configuração ---
 
@@ -22,6 +27,9 @@ if RENDER_URL.endswith('/'):
     RENDER_URL = RENDER_URL[:-1]
 REDIRECT_URI = f"{RENDER_URL}/auth/google/callback"
 
+# Endpoint alternativo da Calendar API (ex: servidor local dos benchmarks)
+CALENDAR_API_ENDPOINT = os.environ.get("GOOGLE_CALENDAR_API_ENDPOINT")
+
 # --- Funções Auxiliares ---
 
 def load_client_config():
@@ -59,6 +67,10 @@ def get_calendar_service(token_json: str):
         return None
     
     try:
+        from google.oauth2.credentials import Credentials
+        from google.auth.transport.requests import Request
+        from googleapiclient.discovery import build
+
         # O token_json é a string JSON salva no banco de dados.
         # Precisamos desserializar para um dicionário para criar o objeto Credentials.
         token_info = json.loads(token_json)
@@ -71,17 +83,24 @@ def get_calendar_service(token_json: str):
             creds.refresh(Request())
             
         # Constrói o serviço
-        service = build('calendar', 'v3', credentials=creds)
+        client_options = {"api_endpoint": CALENDAR_API_ENDPOINT} if CALENDAR_API_ENDPOINT else None
+        service = build('calendar', 'v3', credentials=creds, client_options=client_options)
         return service
         
     except Exception as e:
         print(f"Erro ao criar serviço do Calendar: {e}", flush=True)
         return None
 
+def warm_up():
+    """Pré-importa o cliente da Calendar API (chamado pelo warm-up em segundo plano)."""
+    import googleapiclient.discovery  # noqa: F401
+    import google.oauth2.credentials  # noqa: F401
+
 # --- Funções de Autenticação ---
 
 def google_auth_flow_start():
     """Inicia o fluxo de autenticação OAuth2."""
+    from google_auth_oauthlib.flow import Flow
     client_config = load_client_config()
     flow = Flow.from_client_config(
         client_config, 
@@ -99,6 +118,7 @@ def google_auth_flow_start():
 
 def google_auth_flow_callback(full_url: str) -> str:
     """Completa o fluxo de autenticação e retorna o token JSON."""
+    from google_auth_oauthlib.flow import Flow
     client_config = load_client_config()
     flow = Flow.from_client_config(
         client_config, 
@@ -116,45 +136,90 @@ def google_auth_flow_callback(full_url: str) -> str:
 
 # Em google_calendar_service.py
 
+def _event_body(compromisso) -> dict:
+    start_time = compromisso.data_hora
+    duracao = getattr(compromisso, 'duracao', 60) or 60
+    end_time = start_time + timedelta(minutes=duracao)
+
+    # --- CORREÇÃO DE FUSO HORÁRIO ---
+    # Removemos a informação de timezone do objeto datetime (tornando-o naive)
+    # e deixamos o campo 'timeZone' do payload controlar a localização.
+    start_iso = start_time.replace(tzinfo=None).isoformat()
+    end_iso = end_time.replace(tzinfo=None).isoformat()
+
+    return {
+        'summary': compromisso.titulo,
+        'location': 'Online',
+        'description': compromisso.assunto,
+        'start': {
+            'dateTime': start_iso, 
+            'timeZone': 'America/Sao_Paulo', 
+        },
+        'end': {
+            'dateTime': end_iso,
+            'timeZone': 'America/Sao_Paulo',
+        },
+        'reminders': {
+            'useDefault': True,
+        },
+        # Versão local do compromisso: permite descartar sincronizações fora de ordem
+        'extendedProperties': {
+            'private': {'versao': str(getattr(compromisso, 'version', None) or 1)},
+        },
+    }
+
+def _versao_remota(event) -> int:
+    """Versão do compromisso gravada no evento (0 se o evento é anterior ao versionamento)."""
+    try:
+        return int(event.get('extendedProperties', {}).get('private', {}).get('versao', 0))
+    except (TypeError, ValueError):
+        return 0
+
 def create_google_event(token_json: str, compromisso):
     service = get_calendar_service(token_json)
     if not service:
         return None
 
     try:
-        start_time = compromisso.data_hora
-        duracao = getattr(compromisso, 'duracao', 60) or 60
-        end_time = start_time + timedelta(minutes=duracao)
-
-        # --- CORREÇÃO DE FUSO HORÁRIO ---
-        # Removemos a informação de timezone do objeto datetime (tornando-o naive)
-        # e deixamos o campo 'timeZone' do payload controlar a localização.
-        start_iso = start_time.replace(tzinfo=None).isoformat()
-        end_iso = end_time.replace(tzinfo=None).isoformat()
-
-        event_body = {
-            'summary': compromisso.titulo,
-            'location': 'Online',
-            'description': compromisso.assunto,
-            'start': {
-                'dateTime': start_iso, 
-                'timeZone': 'America/Sao_Paulo', 
-            },
-            'end': {
-                'dateTime': end_iso,
-                'timeZone': 'America/Sao_Paulo',
-            },
-            'reminders': {
-                'useDefault': True,
-            },
-        }
-
-        event = service.events().insert(calendarId='primary', body=event_body).execute()
+        event_body = _event_body(compromisso)
+        with metrics.timed("google_calendar"):
+            event = service.events().insert(calendarId='primary', body=event_body).execute()
+        cache_bus.publish("freebusy", USUARIO_PADRAO)
         return event.get('id')
     except Exception as e:
         print(f"Erro create_google_event: {e}", flush=True)
         return None
 
+def create_google_events_batch(token_json: str, compromissos) -> dict:
+    """
+    Cria vários eventos numa única requisição batch (até 50 por chamada).
+    Retorna {compromisso.id: google_event_id} dos que foram criados.
+    """
+    service = get_calendar_service(token_json)
+    if not service or not compromissos:
+        return {}
+
+    criados = {}
+
+    def _callback(request_id, response, exception):
+        if exception is not None:
+            print(f"Erro create_google_events_batch ({request_id}): {exception}", flush=True)
+        else:
+            criados[int(request_id)] = response.get('id')
+
+    try:
+        batch = service.new_batch_http_request(callback=_callback)
+        for compromisso in compromissos:
+            batch.add(service.events().insert(calendarId='primary', body=_event_body(compromisso)),
+                      request_id=str(compromisso.id))
+        with metrics.timed("google_calendar"):
+            batch.execute()
+    except Exception as e:
+        print(f"Erro create_google_events_batch: {e}", flush=True)
+    if criados:
+        cache_bus.publish("freebusy", USUARIO_PADRAO)
+    return criados
+
 def update_google_event(token_json: str, compromisso):
     if not getattr(compromisso, 'google_event_id', None):
         return
@@ -163,27 +228,52 @@ def update_google_event(token_json: str, compromisso):
     if not service:
         return
 
+    from googleapiclient.errors import HttpError
+
+    versao = getattr(compromisso, 'version', None) or 1
     try:
-        # Pega o evento atual
-        event = service.events().get(calendarId='primary', eventId=compromisso.google_event_id).execute()
+        for _ in range(3):
+            # Pega o evento atual
+            with metrics.timed("google_calendar"):
+                event = service.events().get(calendarId='primary', eventId=compromisso.google_event_id).execute()
 
-        start_time = compromisso.data_hora
-        duracao = getattr(compromisso, 'duracao', 60) or 60
-        end_time = start_time + timedelta(minutes=duracao)
+            # Outro worker já sincronizou uma versão mais nova: esta chegou atrasada
+            if _versao_remota(event) >= versao:
+                print(f"LOG (Calendar): Versão {versao} do compromisso {compromisso.id} descartada "
+                      f"(evento já está na {_versao_remota(event)}).", flush=True)
+                metrics.incr("google_sync_descartadas")
+                return
 
-        event['summary'] = compromisso.titulo
-        event['start']['dateTime'] = start_time.isoformat()
-        event['end']['dateTime'] = end_time.isoformat()
-        
-        # Garante que o fuso horário seja mantido
-        event['start']['timeZone'] = 'America/Sao_Paulo'
-        event['end']['timeZone'] = 'America/Sao_Paulo'
-
-        service.events().update(
-            calendarId='primary', 
-            eventId=compromisso.google_event_id, 
-            body=event
-        ).execute()
+            start_time = compromisso.data_hora
+            duracao = getattr(compromisso, 'duracao', 60) or 60
+            end_time = start_time + timedelta(minutes=duracao)
+
+            event['summary'] = compromisso.titulo
+            event['start']['dateTime'] = start_time.isoformat()
+            event['end']['dateTime'] = end_time.isoformat()
+            
+            # Garante que o fuso horário seja mantido
+            event['start']['timeZone'] = 'America/Sao_Paulo'
+            event['end']['timeZone'] = 'America/Sao_Paulo'
+            event.setdefault('extendedProperties', {}).setdefault('private', {})['versao'] = str(versao)
+
+            request = service.events().update(
+                calendarId='primary',
+                eventId=compromisso.google_event_id,
+                body=event
+            )
+            # Só grava se ninguém alterou o evento desde o get (senão relê e compara de novo)
+            if event.get('etag'):
+                request.headers['If-Match'] = event['etag']
+            try:
+                with metrics.timed("google_calendar"):
+                    request.execute()
+                cache_bus.publish("freebusy", USUARIO_PADRAO)
+                return
+            except HttpError as e:
+                if getattr(e.resp, 'status', None) != 412:
+                    raise
+        print(f"Erro update_google_event: conflitos repetidos no evento {compromisso.google_event_id}", flush=True)
     except Exception as e:
         print(f"Erro update_google_event: {e}", flush=True)
 
@@ -194,6 +284,171 @@ def delete_google_event(token_json: str, google_event_id: str):
     if not service:
         return
     try:
-        service.events().delete(calendarId='primary', eventId=google_event_id).execute()
+        with metrics.timed("google_calendar"):
+            service.events().delete(calendarId='primary', eventId=google_event_id).execute()
+        cache_bus.publish("freebusy", USUARIO_PADRAO)
     except Exception as e:
         print(f"Erro delete_google_event: {e}", flush=True)
+
+# --- Disponibilidade (FreeBusy) ---
+#
+# Os intervalos ocupados do calendário (inclusive eventos criados fora do bot)
+# vêm de UMA chamada freebusy.query para uma janela de FREEBUSY_JANELA_DIAS
+# dias e ficam em memória por usuário, por até FREEBUSY_TTL segundos. Eventos
+# criados, alterados ou apagados pelo bot invalidam o cache deste e dos demais
+# workers via cache_bus (tópico "freebusy"); alterações feitas direto no
+# Google chegam pelo canal de push (/webhook/google-calendar), que faz o mesmo.
+#
+# Se o Google não responder, as funções devolvem None em vez de uma agenda
+# vazia: "sem dados" não pode virar "dia todo livre".
+
+FREEBUSY_TTL = int(os.environ.get("FREEBUSY_TTL", "300"))
+FREEBUSY_JANELA_DIAS = int(os.environ.get("FREEBUSY_JANELA_DIAS", "14"))
+# Segredo do canal de push; sem ele o cache depende só do TTL
+GOOGLE_PUSH_TOKEN = os.environ.get("GOOGLE_PUSH_TOKEN")
+# Mesmo MAIN_USER_ID do main.py: o bot tem uma única conta Google autorizada
+USUARIO_PADRAO = "main_user"
+# Expediente considerado nas respostas de "quando estou livre"
+EXPEDIENTE = (int(os.environ.get("EXPEDIENTE_INICIO", "8")), int(os.environ.get("EXPEDIENTE_FIM", "18")))
+
+TZ = timezone('America/Sao_Paulo')
+
+_freebusy = {}  # user_id -> {"inicio", "fim", "ocupado": [(inicio, fim)], "expira_em"}
+_freebusy_lock = threading.Lock()
+_freebusy_geracao = 0
+
+
+def _invalidar_freebusy(user_id):
+    global _freebusy_geracao
+    with _freebusy_lock:
+        _freebusy_geracao += 1
+        if user_id is None:
+            _freebusy.clear()
+        else:
+            _freebusy.pop(user_id, None)
+
+cache_bus.subscribe("freebusy", _invalidar_freebusy)
+
+
+def _local(valor: str) -> datetime:
+    """RFC3339 da API -> datetime local (America/Sao_Paulo) sem tzinfo."""
+    dt = datetime.fromisoformat(valor.replace("Z", "+00:00"))
+    return dt.astimezone(TZ).replace(tzinfo=None) if dt.tzinfo else dt
+
+
+def _consultar_freebusy(token_json: str, inicio: datetime, fim: datetime):
+    service = get_calendar_service(token_json)
+    if not service:
+        return None
+    body = {
+        "timeMin": TZ.localize(inicio).isoformat(),
+        "timeMax": TZ.localize(fim).isoformat(),
+        "timeZone": "America/Sao_Paulo",
+        "items": [{"id": "primary"}],
+    }
+    with metrics.timed("google_calendar"):
+        resposta = service.freebusy().query(body=body).execute()
+    busy = resposta.get("calendars", {}).get("primary", {}).get("busy", [])
+    return sorted((_local(b["start"]), _local(b["end"])) for b in busy)
+
+
+def intervalos_ocupados(token_json: str, inicio: datetime, fim: datetime, user_id: str = USUARIO_PADRAO):
+    """Intervalos ocupados que tocam [inicio, fim), do cache ou de uma única chamada freeBusy.
+    None se o calendário não pôde ser consultado."""
+    agora = time.monotonic()
+    with _freebusy_lock:
+        entrada = _freebusy.get(user_id)
+        geracao = _freebusy_geracao
+    if entrada and entrada["expira_em"] > agora and entrada["inicio"] <= inicio and fim <= entrada["fim"]:
+        metrics.incr("freebusy_cache_hits")
+        ocupado = entrada["ocupado"]
+    else:
+        metrics.incr("freebusy_cache_misses")
+        # Janela de vários dias (a partir de hoje, ou do dia pedido se estiver fora
+        # dela): uma chamada atende as perguntas seguintes
+        janela = timedelta(days=FREEBUSY_JANELA_DIAS)
+        hoje = datetime.combine(datetime.now(TZ).date(), datetime.min.time())
+        janela_inicio = hoje if hoje <= inicio < hoje + janela else datetime.combine(inicio.date(), datetime.min.time())
+        janela_fim = max(fim, janela_inicio + janela)
+        try:
+            ocupado = _consultar_freebusy(token_json, janela_inicio, janela_fim)
+        except Exception as e:
+            print(f"Erro freebusy: {e}", flush=True)
+            ocupado = None
+        if ocupado is None:
+            return None
+        with _freebusy_lock:
+            if geracao == _freebusy_geracao:
+                _freebusy[user_id] = {"inicio": janela_inicio, "fim": janela_fim, "ocupado": ocupado,
+                                      "expira_em": agora + FREEBUSY_TTL}
+    return [(a, b) for a, b in ocupado if a < fim and b > inicio]
+
+
+def conflitos(token_json: str, inicio: datetime, duracao: int, user_id: str = USUARIO_PADRAO):
+    """Intervalos ocupados que se sobrepõem a um novo compromisso (None se não deu para consultar)."""
+    return intervalos_ocupados(token_json, inicio, inicio + timedelta(minutes=duracao or 60), user_id)
+
+
+def horarios_livres(token_json: str, dia, duracao: int = 60, user_id: str = USUARIO_PADRAO):
+    """Janelas livres do dia dentro do EXPEDIENTE com pelo menos `duracao` minutos (None se não deu para consultar)."""
+    inicio = datetime.combine(dia, datetime.min.time()).replace(hour=EXPEDIENTE[0])
+    fim = inicio.replace(hour=EXPEDIENTE[1])
+    if dia == datetime.now(TZ).date():
+        # Hoje: só a partir da próxima meia hora
+        agora = datetime.now(TZ).replace(tzinfo=None, second=0, microsecond=0)
+        agora += timedelta(minutes=(30 - agora.minute % 30) % 30)
+        inicio = max(inicio, agora)
+    ocupados = intervalos_ocupados(token_json, inicio, fim, user_id)
+    if ocupados is None:
+        return None
+    livres, cursor = [], inicio
+    for a, b in ocupados:
+        if a - cursor >= timedelta(minutes=duracao):
+            livres.append((cursor, a))
+        cursor = max(cursor, b)
+    if fim - cursor >= timedelta(minutes=duracao):
+        livres.append((cursor, fim))
+    return livres
+
+
+def registrar_push(token_json: str):
+    """Abre (ou renova) o canal de push do calendário principal para /webhook/google-calendar."""
+    if not GOOGLE_PUSH_TOKEN or not RENDER_URL.startswith("https://"):
+        return None  # O Google só entrega push para HTTPS público
+    service = get_calendar_service(token_json)
+    if not service:
+        return None
+    body = {
+        "id": uuid.uuid4().hex,
+        "type": "web_hook",
+        "address": f"{RENDER_URL}/webhook/google-calendar",
+        "token": GOOGLE_PUSH_TOKEN,
+    }
+    try:
+        with metrics.timed("google_calendar"):
+            return service.events().watch(calendarId='primary', body=body).execute()
+    except Exception as e:
+        print(f"Erro registrar_push: {e}", flush=True)
+        return None
+
+
+def parar_push(token_json: str, canal_id: str, resource_id: str) -> bool:
+    """Para um canal de push aberto antes; sem isso ele segue notificando até expirar."""
+    service = get_calendar_service(token_json)
+    if not service:
+        return False
+    from googleapiclient.errors import HttpError
+
+    try:
+        with metrics.timed("google_calendar"):
+            service.channels().stop(body={"id": canal_id, "resourceId": resource_id}).execute()
+        return True
+    except HttpError as e:
+        # 404: o canal já expirou (ou é de outra conta); não há o que parar
+        if getattr(e.resp, 'status', None) == 404:
+            return True
+        print(f"Erro parar_push: {e}", flush=True)
+        return False
+    except Exception as e:
+        print(f"Erro parar_push: {e}", flush=True)
+        return False
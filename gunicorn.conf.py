@@ -0,0 +1,62 @@
+# gunicorn.conf.py - Modo multi-worker (gunicorn gerenciando workers uvicorn)
+#
+#     gunicorn main:app -c gunicorn.conf.py
+#
+# Cada worker é um processo com seu próprio pool de banco e caches em memória;
+# os caches são mantidos coerentes pelo cache_bus (Postgres LISTEN/NOTIFY).
+# Conexões no Postgres: workers x (DB_POOL_SIZE + DB_MAX_OVERFLOW) + 1 (LISTEN).
+
+import multiprocessing
+import os
+
+
+def _memoria_disponivel_mb():
+    """Limite de memória do container (cgroup v2/v1), ou None se não houver."""
+    for path in ("/sys/fs/cgroup/memory.max", "/sys/fs/cgroup/memory/memory.limit_in_bytes"):
+        try:
+            with open(path) as f:
+                valor = f.read().strip()
+        except OSError:
+            continue
+        if valor.isdigit() and int(valor) < 1 << 50:
+            return int(valor) // (1024 * 1024)
+    return None
+
+
+def _workers_padrao():
+    """2 x CPUs + 1 (carga majoritariamente de I/O), limitado pela memória do container."""
+    por_cpu = multiprocessing.cpu_count() * 2 + 1
+    memoria = _memoria_disponivel_mb()
+    if memoria:
+        # Reserva ~20% para o master e picos; cada worker usa ~WORKER_MEMORY_MB
+        por_memoria = max(1, int(memoria * 0.8) // int(os.getenv("WORKER_MEMORY_MB", "150")))
+        return min(por_cpu, por_memoria)
+    return por_cpu
+
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+worker_class = "uvicorn.workers.UvicornWorker"
+workers = int(os.getenv("WEB_CONCURRENCY", _workers_padrao()))
+# SQLite embarcado (sem DATABASE_URL): o escritor único e o cache_bus valem
+# só dentro de um processo, então roda com um worker
+if not os.getenv("DATABASE_URL", "").startswith(("postgres://", "postgresql")):
+    workers = 1
+
+# Mensagens são processadas em background, mas a IA pode demorar
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+# Deve ser maior que SHUTDOWN_DRAIN_TIMEOUT (admission.py), o tempo de drenagem da fila
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "30"))
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", "5"))
+
+# Reciclagem periódica de workers desligada por padrão: cada reciclagem é um
+# desligamento, e mensagens já confirmadas à Meta que não drenarem a tempo se
+# perdem (admission.py). Ligue só se houver crescimento de memória a conter.
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", "0"))
+max_requests_jitter = int(os.getenv("GUNICORN_MAX_REQUESTS_JITTER", "200"))
+
+# Sem preload: engine, pools, clientes HTTP e o listener do cache_bus
+# precisam ser criados depois do fork, em cada worker
+preload_app = False
+
+accesslog = "-"
+errorlog = "-"
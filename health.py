@@ -0,0 +1,76 @@
+# health.py - Relatório de saúde para /healthz e /readyz
+#
+# Nada aqui chama os serviços externos: a latência e a taxa de erro de
+# OpenAI, Graph API, Calendar e banco vêm das amostras das chamadas reais
+# (metrics.stage_summary). O relatório fica em cache por HEALTH_CACHE_TTL
+# segundos para que probes frequentes do host não custem nada.
+
+import os
+import threading
+import time
+
+import metrics
+
+HEALTH_CACHE_TTL = float(os.getenv("HEALTH_CACHE_TTL", "2"))
+# Uma dependência com taxa de erro acima disto (e amostras suficientes) aparece como degradada
+HEALTH_ERRO_MAX = float(os.getenv("HEALTH_ERRO_MAX", "0.5"))
+HEALTH_MIN_AMOSTRAS = int(os.getenv("HEALTH_MIN_AMOSTRAS", "5"))
+
+DEPENDENCIAS = {"openai": "openai", "graph_api": "graph_api", "google_calendar": "google_calendar", "banco": "db"}
+
+_INICIO = time.time()
+_cache = {"expira_em": 0.0, "relatorio": None}
+_lock = threading.Lock()
+
+
+def _dependencia(etapa: str, agora: float) -> dict:
+    resumo = metrics.stage_summary(etapa)
+    if resumo is None:
+        return {"status": "sem_dados"}
+    degradada = resumo["count"] >= HEALTH_MIN_AMOSTRAS and resumo["error_rate"] > HEALTH_ERRO_MAX
+    return {
+        "status": "degradado" if degradada else "ok",
+        "p50_ms": resumo["p50_ms"],
+        "p95_ms": resumo["p95_ms"],
+        "error_rate": resumo["error_rate"],
+        "amostras": resumo["count"],
+        "ultima_chamada_ha_s": round(agora - resumo["last_seen"], 1),
+    }
+
+
+def _montar() -> dict:
+    import admission
+    import database
+    import warmup
+
+    agora = time.time()
+    dependencias = {nome: _dependencia(etapa, agora) for nome, etapa in DEPENDENCIAS.items()}
+    fila = admission.controller.stats()
+    aquecimento = warmup.status()
+    return {
+        "status": "degradado" if any(d["status"] == "degradado" for d in dependencias.values()) else "ok",
+        "pronto": aquecimento["pronto"],
+        "uptime_s": round(agora - _INICIO, 1),
+        "dependencias": dependencias,
+        "db_pool": database.pool_status(),
+        "fila": fila,
+        "warmup": aquecimento,
+    }
+
+
+def relatorio() -> dict:
+    """Relatório atual (do cache, se ainda válido)."""
+    agora = time.monotonic()
+    with _lock:
+        if _cache["relatorio"] is not None and _cache["expira_em"] > agora:
+            return _cache["relatorio"]
+    relatorio = _montar()
+    with _lock:
+        _cache["relatorio"], _cache["expira_em"] = relatorio, agora + HEALTH_CACHE_TTL
+    return relatorio
+
+
+def pronto(relatorio: dict) -> bool:
+    """Pode receber tráfego: warm-up concluído com o banco alcançado, fila com espaço e sem desligamento em curso."""
+    fila = relatorio["fila"]
+    return relatorio["pronto"] and fila["ocupacao"] < 1.0 and not fila["encerrando"]
@@ -0,0 +1,317 @@
+# ics_io.py - Importação/exportação de compromissos em iCalendar (.ics)
+#
+# Importação: o arquivo é lido linha a linha (memória constante, mesmo com
+# dezenas de milhares de eventos) e gravado em lotes de ICS_LOTE linhas com
+# um único INSERT executemany por lote, em vez de um create_compromisso
+# (commit + refresh) por evento. Opcionalmente cria os eventos no Google
+# Calendar em requisições batch.
+#
+# Exportação: as linhas vêm do banco por cursor do lado do servidor
+# (stream_results/yield_per) e o .ics é gerado sob demanda. Períodos anteriores
+# ao corte de retenção incluem também compromissos_arquivo (arquivamento.py).
+#
+# Uso:
+#   python ics_io.py importar agenda.ics [--usuario 5562999999999] [--google]
+#   python ics_io.py exportar saida.ics [--de 2025-01-01] [--ate 2025-12-31]
+# A exportação também está disponível em GET /admin/agenda.ics.
+
+import argparse
+import os
+import sys
+from datetime import date, datetime, timedelta
+from itertools import islice
+
+from pytz import timezone, utc
+from sqlalchemy import bindparam, column, insert, select, union_all, update
+
+import arquivamento
+import cache_bus
+import database
+import metrics
+
+ICS_LOTE = int(os.getenv("ICS_LOTE", "1000"))
+# Tamanho das requisições batch ao Google (limite da API: 50 por batch)
+GOOGLE_LOTE = 50
+
+TZ = timezone('America/Sao_Paulo')
+_TABELA = database.Compromisso.__table__
+
+
+# --- Leitura (parser incremental) ---
+
+def _desdobrar(linhas):
+    """Junta as linhas "dobradas" do iCalendar (continuação começa com espaço/tab)."""
+    atual = None
+    for linha in linhas:
+        linha = linha.rstrip("\r\n")
+        if linha[:1] in (" ", "\t") and atual is not None:
+            atual += linha[1:]
+            continue
+        if atual is not None:
+            yield atual
+        atual = linha
+    if atual:
+        yield atual
+
+
+def _desescapar(valor: str) -> str:
+    return (valor.replace("\\n", "\n").replace("\\N", "\n").replace("\\,", ",")
+                 .replace("\\;", ";").replace("\\\\", "\\"))
+
+
+def _data_hora(valor: str, params: dict):
+    """DTSTART/DTEND -> (datetime local sem tzinfo, dia_inteiro)."""
+    if params.get("VALUE") == "DATE" or len(valor) == 8:
+        return datetime.strptime(valor[:8], "%Y%m%d"), True
+    dt = datetime.strptime(valor.rstrip("Z")[:15], "%Y%m%dT%H%M%S")
+    if valor.endswith("Z"):
+        dt = utc.localize(dt).astimezone(TZ)
+    elif params.get("TZID"):
+        try:
+            dt = timezone(params["TZID"]).localize(dt).astimezone(TZ)
+        except Exception:
+            pass  # TZID desconhecido: trata como horário local
+    return dt.replace(tzinfo=None), False
+
+
+def _duracao_iso(valor: str) -> int:
+    """DURATION (ex: PT1H30M, P1D) em minutos."""
+    minutos, numero = 0, ""
+    for ch in valor.lstrip("+-P"):
+        if ch.isdigit():
+            numero += ch
+        elif ch in "WDHMS" and numero:
+            minutos += int(numero) * {"W": 10080, "D": 1440, "H": 60, "M": 1, "S": 0}[ch]
+            numero = ""
+    return minutos
+
+
+def ler_eventos(linhas, ignorados: list = None):
+    """Gera um dict por VEVENT (titulo, data_hora, duracao, assunto, recorrencia).
+
+    Eventos sem DTSTART legível são pulados; se `ignorados` for dado, recebe o
+    UID (ou título) de cada um. Um DTEND ilegível só cai na duração padrão.
+    """
+    evento = None
+    for linha in _desdobrar(linhas):
+        if linha == "BEGIN:VEVENT":
+            evento = {}
+            continue
+        if evento is None:
+            continue
+        if linha == "END:VEVENT":
+            if "data_hora" not in evento:
+                if ignorados is not None:
+                    ignorados.append(evento.get("_uid") or evento.get("titulo") or "?")
+            else:
+                evento.pop("_uid", None)
+                fim = evento.pop("_fim", None)
+                if "duracao" not in evento:
+                    if fim:
+                        evento["duracao"] = max(0, int((fim - evento["data_hora"]).total_seconds() // 60))
+                    else:
+                        evento["duracao"] = 1440 if evento.pop("_dia_inteiro", False) else 60
+                evento.pop("_dia_inteiro", None)
+                yield evento
+            evento = None
+            continue
+        nome, _, valor = linha.partition(":")
+        nome, *partes = nome.split(";")
+        params = dict(p.split("=", 1) for p in partes if "=" in p)
+        nome = nome.upper()
+        if nome == "SUMMARY":
+            evento["titulo"] = _desescapar(valor)
+        elif nome == "DESCRIPTION":
+            evento["assunto"] = _desescapar(valor)
+        elif nome == "UID":
+            evento["_uid"] = valor
+        elif nome == "DTSTART":
+            try:
+                evento["data_hora"], evento["_dia_inteiro"] = _data_hora(valor, params)
+            except ValueError:
+                pass  # sem data_hora: o evento é pulado no END:VEVENT
+        elif nome == "DTEND":
+            try:
+                evento["_fim"] = _data_hora(valor, params)[0]
+            except ValueError:
+                pass
+        elif nome == "DURATION":
+            evento["duracao"] = _duracao_iso(valor)
+        elif nome == "RRULE":
+            evento["recorrencia"] = valor
+
+
+def _lotes(iteravel, tamanho: int):
+    iterador = iter(iteravel)
+    while True:
+        lote = list(islice(iterador, tamanho))
+        if not lote:
+            return
+        yield lote
+
+
+def importar(caminho: str, usuario: str = None, sincronizar_google: bool = False, lote: int = ICS_LOTE) -> dict:
+    """Importa um .ics em lotes; devolve contagens de importados, sincronizados e ignorados."""
+    resultado = {"importados": 0, "sincronizados": 0, "ignorados": 0}
+    ignorados = []
+    token_json = None
+
+    with metrics.timed("ics_import"), database.session_scope() as db, \
+            open(caminho, encoding="utf-8-sig") as arquivo:
+        if sincronizar_google:
+            token_json = database.get_token_json(db, user_id="main_user")
+            if not token_json:
+                print("LOG (ICS): Google Calendar não autorizado; importando sem sincronizar.", flush=True)
+
+        for eventos in _lotes(ler_eventos(arquivo, ignorados), lote):
+            linhas = [{
+                "titulo": e.get("titulo") or "Compromisso",
+                "data_hora": e["data_hora"],
+                "assunto": e.get("assunto"),
+                "duracao": e["duracao"],
+                "recorrencia": e.get("recorrencia"),
+                "usuario": usuario,
+            } for e in eventos]
+            if token_json:
+                # RETURNING devolve os ids do lote inteiro (insertmanyvalues)
+                ids = db.execute(insert(_TABELA).returning(_TABELA.c.id), linhas).scalars().all()
+            else:
+                db.execute(insert(_TABELA), linhas)
+                ids = []
+            db.commit()
+            resultado["importados"] += len(linhas)
+            dias = {linha["data_hora"].date() for linha in linhas}
+            if len(dias) > 100:
+                cache_bus.publish("agenda")  # lote espalhado: mais barato descartar tudo
+            else:
+                database.publicar_dias_agenda(*(datetime.combine(d, datetime.min.time()) for d in dias))
+
+            if token_json:
+                resultado["sincronizados"] += _sincronizar(db, token_json, ids, linhas)
+            print(f"LOG (ICS): {resultado['importados']} compromissos importados", flush=True)
+
+    resultado["ignorados"] = len(ignorados)
+    if ignorados:
+        print(f"LOG (ICS): {len(ignorados)} eventos sem DTSTART válido ignorados (ex.: {', '.join(ignorados[:5])})",
+              flush=True)
+    metrics.incr("ics_importados", resultado["importados"])
+    return resultado
+
+
+def _sincronizar(db, token_json: str, ids, linhas) -> int:
+    """Cria os eventos no Google em batches e grava os google_event_id num único UPDATE."""
+    import google_calendar_service
+
+    sincronizados = 0
+    for grupo in _lotes(zip(ids, linhas), GOOGLE_LOTE):
+        compromissos = [database.Compromisso(id=id_, **linha) for id_, linha in grupo]
+        eventos = google_calendar_service.create_google_events_batch(token_json, compromissos)
+        if eventos:
+            db.execute(
+                update(_TABELA).where(_TABELA.c.id == bindparam("b_id"))
+                .values(google_event_id=bindparam("b_event")),
+                [{"b_id": id_, "b_event": event_id} for id_, event_id in eventos.items()],
+            )
+            db.commit()
+            sincronizados += len(eventos)
+    return sincronizados
+
+
+# --- Escrita (exportação em streaming) ---
+
+def _escapar(valor: str) -> str:
+    return (valor.replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,")
+                 .replace("\r\n", "\\n").replace("\n", "\\n"))
+
+
+def _dobrar(linha: str) -> str:
+    """Quebra linhas longas em 75 octetos, como pede a RFC 5545."""
+    dados = linha.encode("utf-8")
+    if len(dados) <= 75:
+        return linha + "\r\n"
+    partes, inicio, limite = [], 0, 75
+    while inicio < len(dados):
+        fim = min(inicio + limite, len(dados))
+        while fim < len(dados) and (dados[fim] & 0xC0) == 0x80:
+            fim -= 1  # não corta no meio de um caractere UTF-8
+        partes.append(dados[inicio:fim].decode("utf-8"))
+        inicio, limite = fim, 74
+    return "\r\n ".join(partes) + "\r\n"
+
+
+def _consulta_exportacao(t, inicio: date, fim: date, usuario: str):
+    consulta = select(t.c.id, t.c.titulo, t.c.data_hora, t.c.assunto, t.c.duracao, t.c.recorrencia)
+    if inicio:
+        consulta = consulta.where(t.c.data_hora >= datetime.combine(inicio, datetime.min.time()))
+    if fim:
+        consulta = consulta.where(t.c.data_hora < datetime.combine(fim + timedelta(days=1), datetime.min.time()))
+    if usuario:
+        consulta = consulta.where(t.c.usuario == usuario)
+    return consulta
+
+
+def exportar(inicio: date = None, fim: date = None, usuario: str = None, lote: int = ICS_LOTE):
+    """Gera o .ics em pedaços de texto, lendo o banco por cursor do lado do servidor."""
+    agora = datetime.utcnow().strftime("%Y%m%dT%H%M%SZ")
+    yield "BEGIN:VCALENDAR\r\nVERSION:2.0\r\nPRODID:-//BlackHaus//Agenda IA//PT\r\nCALSCALE:GREGORIAN\r\n"
+
+    # Sem início, ou começando antes do corte de retenção, parte do período já está no arquivo
+    tabelas = [_TABELA]
+    if inicio is None or inicio < arquivamento.corte():
+        tabelas.append(database.CompromissoArquivo.__table__)
+    consultas = [_consulta_exportacao(t, inicio, fim, usuario) for t in tabelas]
+    consulta = (consultas[0] if len(consultas) == 1 else union_all(*consultas)).order_by(column("data_hora"))
+
+    with database.session_scope() as db:
+        linhas = db.execute(consulta.execution_options(stream_results=True, yield_per=lote))
+        buffer = []
+        for id_, titulo, data_hora, assunto, duracao, recorrencia in linhas:
+            if data_hora is None:
+                continue
+            termino = data_hora + timedelta(minutes=duracao or 60)
+            buffer.append("BEGIN:VEVENT\r\n")
+            buffer.append(f"UID:compromisso-{id_}@agenda-ia\r\n")
+            buffer.append(f"DTSTAMP:{agora}\r\n")
+            buffer.append(f"DTSTART;TZID=America/Sao_Paulo:{data_hora.strftime('%Y%m%dT%H%M%S')}\r\n")
+            buffer.append(f"DTEND;TZID=America/Sao_Paulo:{termino.strftime('%Y%m%dT%H%M%S')}\r\n")
+            buffer.append(_dobrar(f"SUMMARY:{_escapar(titulo or '')}"))
+            if assunto:
+                buffer.append(_dobrar(f"DESCRIPTION:{_escapar(assunto)}"))
+            if recorrencia:
+                buffer.append(_dobrar(f"RRULE:{recorrencia}"))
+            buffer.append("END:VEVENT\r\n")
+            if len(buffer) >= lote:
+                yield "".join(buffer)
+                buffer = []
+        if buffer:
+            yield "".join(buffer)
+
+    yield "END:VCALENDAR\r\n"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Importa/exporta compromissos em formato iCalendar.")
+    sub = parser.add_subparsers(dest="comando", required=True)
+    imp = sub.add_parser("importar", help="Importa um arquivo .ics")
+    imp.add_argument("arquivo")
+    imp.add_argument("--usuario", help="Número de WhatsApp dono dos compromissos")
+    imp.add_argument("--google", action="store_true", help="Cria os eventos também no Google Calendar")
+    imp.add_argument("--lote", type=int, default=ICS_LOTE)
+    exp = sub.add_parser("exportar", help="Exporta os compromissos para um .ics ('-' = saída padrão)")
+    exp.add_argument("arquivo")
+    exp.add_argument("--de", type=date.fromisoformat)
+    exp.add_argument("--ate", type=date.fromisoformat)
+    exp.add_argument("--usuario")
+    args = parser.parse_args()
+
+    try:
+        if args.comando == "importar":
+            print(importar(args.arquivo, args.usuario, args.google, args.lote), flush=True)
+        else:
+            saida = sys.stdout if args.arquivo == "-" else open(args.arquivo, "w", encoding="utf-8", newline="")
+            with saida:
+                for pedaco in exportar(args.de, args.ate, args.usuario):
+                    saida.write(pedaco)
+    except Exception as e:
+        print(f"Erro: {e}", file=sys.stderr, flush=True)
+        sys.exit(1)
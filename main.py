@@ -1,13 +1,29 @@
 from fastapi import FastAPI, Request, Depends, HTTPException, BackgroundTasks
-from fastapi.responses import RedirectResponse, HTMLResponse, PlainTextResponse, Response
+from fastapi.responses import RedirectResponse, HTMLResponse, PlainTextResponse, Response, FileResponse, JSONResponse, StreamingResponse
 from sqlalchemy.orm import Session
+import hmac
 import json
 import os
 import re
 import traceback
+import anyio
 from datetime import datetime, time, date, timedelta
 from pytz import timezone # Para lidar com fuso horário
 import ai_service
+import admission
+import agendador
+import agenda_cache
+import arquivamento
+import cache_bus
+import conversation_store
+import digest
+import health
+import ics_io
+import metrics
+import profiler
+import static_pages
+import warmup
+from nlp_processor import AgendaAction, agora_local
 # --- SUAS IMPORTAÇÕES DE MÓDULOS LOCAIS ---
 from whatsapp_api import send_whatsapp_message 
 import database 
@@ -27,24 +43,7 @@ get_compromisso_por_id = database.get_compromisso_por_id
 google_auth_flow_start = google_calendar_service.google_auth_flow_start
 google_auth_flow_callback = google_calendar_service.google_auth_flow_callback
 
-try:
-    print("Verificando/Criando tabelas no banco de dados...")
-    database.Base.metadata.create_all(bind=database.engine)
-    print("Tabelas prontas para uso!")
-except Exception as e:
-    print(f"Erro ao criar tabelas: {e}")
-
-# --- CLASSE DE AÇÃO (Substitui o Mock) ---
-class AgendaAction:
-    """Estrutura de dados para a ação de agendamento."""
-    def __init__(self, action, titulo, data_hora, assunto, duracao=60, recorrencia=None, id_compromisso=None):
-        self.action = action
-        self.titulo = titulo
-        self.data_hora = data_hora
-        self.assunto = assunto
-        self.duracao = duracao
-        self.recorrencia = recorrencia
-        self.id_compromisso = id_compromisso
+# As tabelas não são mais criadas na importação: veja migrate.py e warmup.py.
 
 # --- PARSER SIMPLES (Substitui o Mock da IA) ---
 def simple_nlp_parser(message_text: str) -> AgendaAction:
@@ -111,23 +110,112 @@ def simple_nlp_parser(message_text: str) -> AgendaAction:
     )
 # --- FIM DO PARSER SIMPLES ---
 
+def formatar_agenda(dia: date, linhas) -> str:
+    """Monta a resposta do 'consultar' com as linhas (já renderizadas) da agenda do dia."""
+    if linhas:
+        lista = "\n".join(linhas)
+        return f"Agenda para {dia.strftime('%d/%m/%Y')}:\n{lista}"
+    return f"Não encontrei compromissos para {dia.strftime('%d/%m/%Y')}."
+
+def formatar_livres(dia: date, livres) -> str:
+    """Monta a resposta do 'disponibilidade' com as janelas livres do dia."""
+    if livres:
+        lista = "\n".join(f"- {a.strftime('%H:%M')} às {b.strftime('%H:%M')}" for a, b in livres)
+        return f"Horários livres em {dia.strftime('%d/%m/%Y')}:\n{lista}"
+    return f"Sem horários livres em {dia.strftime('%d/%m/%Y')}."
+
 # Inicializa a aplicação FastAPI
 app = FastAPI()
 
+
+@app.on_event("startup")
+def iniciar_warmup():
+    """Aplica o schema e pré-conecta banco/clientes HTTP sem bloquear o boot."""
+    warmup.start()
+    digest.start()
+    arquivamento.start()
+    if google_calendar_service.GOOGLE_PUSH_TOKEN:
+        # Os canais de push do Google expiram: renova um por dia
+        agendador.diario("google_push", "04:00", renovar_push_google)
+
+
+@app.on_event("shutdown")
+def encerrar_fila():
+    """Dá às mensagens já aceitas a chance de terminar antes de o processo sair."""
+    admission.controller.shutdown(timeout=admission.SHUTDOWN_DRAIN_TIMEOUT)
+
 # ID Fixo para o token na base de dados
 MAIN_USER_ID = "main_user"
 
+
+# Chave do advisory lock da renovação: um único worker/instância troca o canal
+_PUSH_LOCK_ID = 0x616C6670  # "alfp"
+# Renovações mais próximas que isso da anterior são ignoradas (outro worker já renovou hoje)
+PUSH_RENOVACAO_MIN = timedelta(hours=12)
+
+
+def renovar_push_google(token_json: str = None, forcar: bool = False):
+    """
+    Troca o canal de push do Google Calendar (invalidação do cache de freeBusy):
+    para o canal gravado em canais_push e abre um novo. Com o lock e o registro
+    do canal, vários workers agendando o mesmo job não acumulam canais.
+    """
+    with database.advisory_lock(_PUSH_LOCK_ID) as obtido, database.session_scope() as db:
+        if not obtido:
+            print("LOG (Push Google): Outro processo já está renovando o canal.", flush=True)
+            return
+        token_json = token_json or database.get_token_json(db, user_id=MAIN_USER_ID)
+        if not token_json:
+            return
+        anterior = database.get_canal_push(db, MAIN_USER_ID)
+        if anterior and not forcar and datetime.utcnow() - anterior.renovado_em < PUSH_RENOVACAO_MIN:
+            return
+        if anterior:
+            google_calendar_service.parar_push(token_json, anterior.canal_id, anterior.resource_id)
+            database.delete_canal_push(db, MAIN_USER_ID)
+        canal = google_calendar_service.registrar_push(token_json)
+        if canal:
+            expira_em = datetime.utcfromtimestamp(int(canal["expiration"]) / 1000) if canal.get("expiration") else None
+            database.save_canal_push(db, MAIN_USER_ID, canal["id"], canal.get("resourceId"), expira_em)
+
+# 🔒 TOKEN DAS ROTAS ADMINISTRATIVAS (/admin/*)
+# Sem ADMIN_TOKEN configurado, as rotas ficam fechadas (403)
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
+
+def exigir_admin(request: Request):
+    """Dependência das rotas /admin/*: exige o header X-Admin-Token igual a ADMIN_TOKEN."""
+    token = request.headers.get("X-Admin-Token", "")
+    if not ADMIN_TOKEN or not hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=403, detail="Acesso restrito.")
+
 # 🔒 TOKEN DE VERIFICAÇÃO DO META
 # Usando os.getenv para o token de verificação, mas mantendo o fallback para o teste
 VERIFY_TOKEN = os.getenv("WHATSAPP_VERIFY_TOKEN", "meu_token_real_123")
 
 
+def _threadpool_stats():
+    """Ocupação do threadpool do AnyIO (onde rodam as rotas síncronas e BackgroundTasks)."""
+    stats = anyio.to_thread.current_default_thread_limiter().statistics()
+    return {"em_uso": stats.borrowed_tokens, "total": stats.total_tokens, "aguardando": stats.tasks_waiting}
+
+
+metrics.register_gauge("threadpool", _threadpool_stats)
+
+
 # --- FUNÇÃO DE PROCESSAMENTO EM SEGUNDO PLANO ---
-def process_message_background(data: dict, db: Session):
+def process_message_background(data: dict):
     """
     Função processa a lógica de negócios real usando IA (OpenAI), 
     DB local e sincronização com Google Calendar.
+    Abre a própria sessão: a da requisição já foi devolvida ao pool.
     """
+    with metrics.timed("process_message"), profiler.maybe_profile("process_message"), \
+            database.session_scope() as db:
+        _process_message(data, db)
+
+
+def _process_message(data: dict, db: Session):
     try:
         print(f"LOG PAYLOAD (Background): {json.dumps(data)}", flush=True)
 
@@ -143,78 +231,114 @@ def process_message_background(data: dict, db: Session):
         from_number = message_data['from']
 
         # 3. Processamento de IA (Chamada ao ai_service que criamos)
-        # Importante: certifique-se de ter 'import ai_service' no topo do seu main.py
-        import ai_service
-        ai_result = ai_service.get_ai_response(message_text)
+        # Se havia um pedido pendente (ex: faltou o horário), tenta completá-lo
+        # localmente; senão a IA recebe o pendente e os turnos recentes.
+        conversa = conversation_store.carregar(db, from_number)
+        ai_result = conversation_store.preencher_pendente(conversa, message_text)
+        if ai_result is None:
+            ai_result = ai_service.get_ai_response(
+                message_text, historico=list(conversa.turnos), pendente=conversa.pendente
+            )
         
-        action = ai_result.get("action")
+        action = ai_result.action
         # A IA já sugere uma resposta educada e direta no campo 'resposta_whatsapp'
-        response_message = ai_result.get("resposta_whatsapp", "Processando sua solicitação...")
+        response_message = ai_result.resposta_whatsapp or "Processando sua solicitação..."
 
         # 4. Recuperação de credenciais do Google
-        token_record = get_token(db, user_id=MAIN_USER_ID)
-        google_token_json = token_record.token_json if token_record else None
+        google_token_json = database.get_token_json(db, user_id=MAIN_USER_ID)
 
         # 5. Execução da Lógica de Negócio baseada na decisão da IA
+        # (data_hora já chega como datetime validado; pedidos incompletos viram "erro")
         
         if action == "agendar":
-            data_iso = ai_result.get("data_hora")
-            if not data_iso:
-                # Caso a IA não tenha conseguido extrair a data, a resposta já pedirá os dados.
-                pass 
+            # Conflito com eventos do Google (inclusive os criados fora do bot), do cache de freeBusy
+            if google_token_json:
+                ocupados = google_calendar_service.conflitos(google_token_json, ai_result.data_hora, ai_result.duracao)
+                if ocupados is None:
+                    response_message += "\n\n⚠️ Não consegui verificar conflitos na sua agenda agora."
+                elif ocupados:
+                    response_message += "\n\n⚠️ Atenção: esse horário conflita com outro compromisso da sua agenda."
+
+            compromisso = create_compromisso(
+                db,
+                titulo=ai_result.titulo,
+                data_hora=ai_result.data_hora,
+                assunto=ai_result.assunto,
+                duracao=ai_result.duracao,
+                usuario=from_number
+            )
+
+            if google_token_json:
+                event_id = google_calendar_service.create_google_event(google_token_json, compromisso)
+                if event_id:
+                    database.vincular_google_event(db, compromisso.id, event_id)
             else:
-                # Converte o ISO da IA para objeto datetime para o banco de dados
-                dt_obj = datetime.fromisoformat(data_iso)
-                
-                compromisso = create_compromisso(
-                    db,
-                    titulo=ai_result.get("titulo"),
-                    data_hora=dt_obj,
-                    assunto=ai_result.get("assunto"),
-                    duracao=ai_result.get("duracao", 60)
-                )
-
-                if google_token_json:
-                    event_id = google_calendar_service.create_google_event(google_token_json, compromisso)
-                    if event_id:
-                        update_compromisso(db, compromisso.id, {"google_event_id": event_id})
-                else:
-                    response_message += "\n\n⚠️ O Google Calendar não está sincronizado."
+                response_message += "\n\n⚠️ O Google Calendar não está sincronizado."
 
         elif action == "reagendar":
-            id_comp = ai_result.get("id_compromisso")
-            data_iso = ai_result.get("data_hora")
-            
-            if id_comp and data_iso:
-                dt_obj = datetime.fromisoformat(data_iso)
-                compromisso = get_compromisso_por_id(db, id_comp)
-                if compromisso:
-                    update_compromisso(db, compromisso.id, {"data_hora": dt_obj})
-                    if google_token_json and compromisso.google_event_id:
-                        google_calendar_service.update_google_event(google_token_json, compromisso)
+            compromisso = get_compromisso_por_id(db, ai_result.id_compromisso)
+            if compromisso:
+                # Compare-and-swap contra a versão lida acima: se outro pedido mudou o
+                # compromisso nesse meio-tempo, o usuário confirma em vez de sobrescrever
+                try:
+                    compromisso = update_compromisso(
+                        db, compromisso.id, {"data_hora": ai_result.data_hora}, versao_esperada=compromisso.version
+                    )
+                except database.ConflitoVersao:
+                    atual = get_compromisso_por_id(db, ai_result.id_compromisso)
+                    compromisso = None
+                    if atual:
+                        response_message = (
+                            f"O compromisso ID {atual.id} ({atual.titulo}) acabou de ser alterado e agora está "
+                            f"em {atual.data_hora.strftime('%d/%m às %H:%M')}. Confirma que quer mudar para "
+                            f"{ai_result.data_hora.strftime('%d/%m às %H:%M')}? Se sim, me peça de novo."
+                        )
+                    else:
+                        response_message = f"O compromisso ID {ai_result.id_compromisso} acabou de ser cancelado."
+                # A versão vai junto: o Google descarta uma sincronização mais antiga que chegue depois
+                if compromisso and google_token_json and compromisso.google_event_id:
+                    google_calendar_service.update_google_event(google_token_json, compromisso)
 
         elif action == "cancelar":
-            id_comp = ai_result.get("id_compromisso")
-            if id_comp:
-                compromisso = get_compromisso_por_id(db, id_comp)
-                if compromisso:
-                    if google_token_json and compromisso.google_event_id:
-                        google_calendar_service.delete_google_event(google_token_json, compromisso.google_event_id)
-                    delete_compromisso(db, compromisso.id)
+            compromisso = get_compromisso_por_id(db, ai_result.id_compromisso)
+            if compromisso:
+                if google_token_json and compromisso.google_event_id:
+                    google_calendar_service.delete_google_event(google_token_json, compromisso.google_event_id)
+                delete_compromisso(db, compromisso.id)
 
         elif action == "consultar":
-            # Para consultas, usamos a data que a IA identificou ou hoje
-            data_iso = ai_result.get("data_hora")
-            dt_consulta = datetime.fromisoformat(data_iso).date() if data_iso else datetime.now().date()
-            
-            compromissos = get_compromissos_do_dia(db, datetime.combine(dt_consulta, datetime.min.time()))
-            if compromissos:
-                lista = "\n".join([f"- ID {c.id}: {c.titulo} às {c.data_hora.strftime('%H:%M')}" for c in compromissos])
-                response_message = f"Agenda para {dt_consulta.strftime('%d/%m/%Y')}:\n{lista}"
+            # Para consultas, usamos a data que a IA identificou ou hoje (no fuso da agenda)
+            dt_consulta = ai_result.data_hora.date() if ai_result.data_hora else agora_local().date()
+
+            # Só os compromissos de quem pergunta. Linhas antigas sem usuario (de antes da
+            # coluna existir) não têm dono conhecido e não aparecem para ninguém aqui, como no
+            # digest; continuam no /admin/agenda.ics. Servido do cache em memória.
+            response_message = formatar_agenda(
+                dt_consulta, agenda_cache.agenda_do_dia(db, dt_consulta, usuario=from_number)
+            )
+
+        elif action == "disponibilidade":
+            dia = ai_result.data_hora.date() if ai_result.data_hora else agora_local().date()
+            if google_token_json:
+                livres = google_calendar_service.horarios_livres(google_token_json, dia, ai_result.duracao)
+                if livres is None:
+                    response_message = ("Não consegui consultar sua disponibilidade no Google Calendar agora. "
+                                        "Tente de novo em instantes.")
+                else:
+                    response_message = formatar_livres(dia, livres)
             else:
-                response_message = f"Não encontrei compromissos para {dt_consulta.strftime('%d/%m/%Y')}."
+                response_message = "Para ver sua disponibilidade preciso do Google Calendar sincronizado."
+
+        # 6. Atualiza o estado da conversa (pedido pendente e turnos recentes)
+        if action == "erro":
+            conversa.pendente = conversation_store.novo_pendente(ai_result) or conversa.pendente
+        else:
+            conversa.pendente = None
+        conversa.registrar("user", message_text)
+        conversa.registrar("assistant", response_message)
+        conversation_store.salvar(db, conversa)
 
-        # 6. Envio da Resposta Final via WhatsApp
+        # 7. Envio da Resposta Final via WhatsApp
         send_whatsapp_message(from_number, response_message)
         print(f"LOG (WhatsApp Send): Resposta enviada para {from_number}", flush=True)
 
@@ -229,114 +353,20 @@ def process_message_background(data: dict, db: Session):
             pass
 
 @app.get("/privacidade", response_class=HTMLResponse)
-async def privacidade():
+async def privacidade(request: Request):
     """
-    Retorna a página de Política de Privacidade formatada em HTML.
+    Retorna a página de Política de Privacidade (static/privacidade.html).
     Esta URL deve ser inserida no painel do Meta Developers.
     """
-    content = """
-    <!DOCTYPE html>
-    <html lang="pt-br">
-        <head>
-            <meta charset="UTF-8">
-            <title>Política de Privacidade - Alfred</title>
-            <style>
-                body { font-family: 'Segoe UI', Arial, sans-serif; padding: 40px; line-height: 1.6; max-width: 800px; margin: auto; color: #333; }
-                h1 { color: #2c3e50; border-bottom: 2px solid #eee; padding-bottom: 10px; }
-                h2 { color: #2c3e50; margin-top: 30px; }
-                p { margin-bottom: 15px; text-align: justify; }
-                ul { margin-bottom: 15px; }
-                .footer { margin-top: 50px; font-size: 0.9em; color: #7f8c8d; border-top: 1px solid #eee; pt: 20px; }
-            </style>
-        </head>
-        <body>
-            <h1>Política de Privacidade</h1>
-            <p><strong>Última atualização: 24/12/2025</strong></p>
-            
-            <p>A sua privacidade é importante para nós. É política do <strong>Alfred</strong> respeitar a sua privacidade em relação a qualquer informação sua que possamos coletar no serviço Alfred, e outros sites que possuímos e operamos.</p>
-
-            <p>Solicitamos informações pessoais apenas quando realmente precisamos delas para lhe fornecer um serviço, como a integração com o <strong>Google Calendar</strong> e <strong>WhatsApp Business API</strong>. Fazemo-lo por meios justos e legais, com o seu conhecimento e consentimento. Também informamos por que estamos coletando e como será usado.</p>
-
-            <p>Apenas retemos as informações coletadas pelo tempo necessário para fornecer o serviço solicitado. Quando armazenamos dados (como tokens de acesso), protegemos dentro de meios comercialmente aceitáveis para evitar perdas e roubos, bem como acesso, divulgação, cópia, uso ou modificação não autorizados.</p>
-
-            <p>Não compartilhamos informações de identificação pessoal publicamente ou com terceiros, exceto quando exigido por lei.</p>
-
-            <h2>Compromisso do Usuário</h2>
-            <p>O usuário se compromete a fazer uso adequado dos conteúdos e da informação que o Alfred oferece:</p>
-            <ul>
-                <li><strong>A)</strong> Não se envolver em atividades que sejam ilegais ou contrárias à boa fé;</li>
-                <li><strong>B)</strong> Não causar danos aos sistemas físicos (hardwares) e lógicos (softwares) do Alfred;</li>
-                <li><strong>C)</strong> Não disseminar vírus informáticos ou quaisquer outros sistemas que sejam capazes de causar danos.</li>
-            </ul>
-
-            <div class="footer">
-                <p>Esta política é efetiva a partir de 24 de Dezembro de 2025.</p>
-                <p>Contato: https://alfred-5klb.onrender.com</p>
-            </div>
-        </body>
-    </html>
-    """
-    return HTMLResponse(content=content, status_code=200)
+    return static_pages.responder(request, "privacidade.html")
 
 @app.get("/termos", response_class=HTMLResponse)
-async def termos():
+async def termos(request: Request):
     """
-    Retorna a página de Termos de Serviço formatada em HTML.
+    Retorna a página de Termos de Serviço (static/termos.html).
     Esta URL é necessária para a conformidade do app no Meta Developers.
     """
-    content = """
-    <!DOCTYPE html>
-    <html lang="pt-br">
-        <head>
-            <meta charset="UTF-8">
-            <title>Termos de Serviço - Alfred</title>
-            <style>
-                body { font-family: 'Segoe UI', Arial, sans-serif; padding: 40px; line-height: 1.6; max-width: 800px; margin: auto; color: #333; }
-                h1 { color: #2c3e50; border-bottom: 2px solid #eee; padding-bottom: 10px; }
-                h2 { color: #2c3e50; margin-top: 30px; font-size: 1.4em; }
-                p { margin-bottom: 15px; text-align: justify; }
-                ol { margin-bottom: 15px; }
-                li { margin-bottom: 10px; }
-                .footer { margin-top: 50px; font-size: 0.9em; color: #7f8c8d; border-top: 1px solid #eee; padding-top: 20px; }
-            </style>
-        </head>
-        <body>
-            <h1>Termos de Serviço</h1>
-            
-            <h2>1. Termos</h2>
-            <p>Ao acessar ao site <a href="https://alfred-5klb.onrender.com" style="color: #3498db; text-decoration: none;">Alfred</a>, concorda em cumprir estes termos de serviço, todas as leis e regulamentos aplicáveis e concorda que é responsável pelo cumprimento de todas as leis locais aplicáveis. Os materiais contidos neste site são protegidos pelas leis de direitos autorais e marcas comerciais aplicáveis.</p>
-
-            <h2>2. Uso de Licença</h2>
-            <p>É concedida permissão para baixar temporariamente uma cópia dos materiais (informações ou software) no site Alfred, apenas para visualização transitória pessoal e não comercial. Esta é a concessão de uma licença, não uma transferência de título e, sob esta licença, você não pode:</p>
-            <ol>
-                <li>Modificar ou copiar os materiais;</li>
-                <li>Usar os materiais para qualquer finalidade comercial ou para exibição pública;</li>
-                <li>Tentar descompilar ou fazer engenharia reversa de qualquer software contido no site Alfred;</li>
-                <li>Remover quaisquer direitos autorais ou outras notações de propriedade;</li>
-                <li>Transferir os materiais para outra pessoa ou 'espelhar' os materiais em outro servidor.</li>
-            </ol>
-
-            <h2>3. Isenção de Responsabilidade</h2>
-            <p>Os materiais no site da Alfred são fornecidos 'como estão'. Alfred não oferece garantias, expressas ou implícitas, e, por este meio, isenta e nega todas as outras garantias, incluindo, sem limitação, condições de comercialização ou adequação a um fim específico.</p>
-
-            <h2>4. Limitações</h2>
-            <p>Em nenhum caso o Alfred ou seus fornecedores serão responsáveis por quaisquer danos (incluindo, sem limitação, danos por perda de dados ou lucro ou devido a interrupção dos negócios) decorrentes do uso ou da incapacidade de usar os materiais em Alfred.</p>
-
-            <h2>5. Precisão dos Materiais</h2>
-            <p>Os materiais exibidos no site da Alfred podem incluir erros técnicos, tipográficos ou fotográficos. Alfred não garante que qualquer material em seu site seja preciso, completo ou atual.</p>
-
-            <h2>6. Links</h2>
-            <p>O Alfred não analisou todos os sites vinculados ao seu site e não é responsável pelo conteúdo de nenhum site vinculado. O uso de qualquer site vinculado é por conta e risco do usuário.</p>
-
-            <div class="footer">
-                <p><strong>Modificações:</strong> O Alfred pode revisar estes termos a qualquer momento, sem aviso prévio. Ao usar este site, você concorda em ficar vinculado à versão atual desses termos de serviço.</p>
-                <p><strong>Lei Aplicável:</strong> Estes termos são regidos pelas leis locais e você se submete à jurisdição exclusiva dos tribunais naquela localidade.</p>
-                <p>Contato: blackhaus.com.br</p>
-            </div>
-        </body>
-    </html>
-    """
-    return HTMLResponse(content=content, status_code=200)
+    return static_pages.responder(request, "termos.html")
 
 # --- ROTAS DE AUTENTICAÇÃO DO GOOGLE CALENDAR ---
 
@@ -360,6 +390,8 @@ async def google_auth_callback(request: Request, db: Session = Depends(get_db)):
 
         # O token_info já é a string JSON, não precisa de json.dumps()
         save_token(db, user_id=MAIN_USER_ID, token_json=token_info)
+        # Nova autorização (talvez de outra conta): troca o canal mesmo que tenha sido renovado hoje
+        renovar_push_google(token_info, forcar=True)
 
         return HTMLResponse(
             content="<h1>✅ Autenticação Concluída com Sucesso!</h1><p>O Google Calendar está agora sincronizado com o seu bot do WhatsApp. Você pode fechar esta página.</p>",
@@ -373,18 +405,25 @@ async def google_auth_callback(request: Request, db: Session = Depends(get_db)):
             status_code=500
         )
 
+# --- PUSH DO GOOGLE CALENDAR ---
+@app.post("/webhook/google-calendar")
+def google_calendar_push(request: Request):
+    """Notificação de mudança no calendário: descarta o cache de freeBusy (todos os workers)."""
+    if not google_calendar_service.GOOGLE_PUSH_TOKEN or \
+            request.headers.get("X-Goog-Channel-Token") != google_calendar_service.GOOGLE_PUSH_TOKEN:
+        raise HTTPException(status_code=403, detail="Canal desconhecido.")
+    # "sync" é só a confirmação de abertura do canal
+    if request.headers.get("X-Goog-Resource-State") != "sync":
+        cache_bus.publish("freebusy", google_calendar_service.USUARIO_PADRAO)
+    return Response(status_code=200)
+
 # --- ROTA TEMPORÁRIA DE LIMPEZA DE TOKEN ---
-@app.get("/admin/clear-token")
+@app.get("/admin/clear-token", dependencies=[Depends(exigir_admin)])
 def clear_token(db: Session = Depends(get_db)):
     """Rota temporária para deletar o token do Google Calendar do DB."""
     try:
-        # Tenta obter o registro do token
-        token_record = get_token(db, user_id=MAIN_USER_ID)
-        
-        if token_record:
-            # Deleta o registro e commita
-            db.delete(token_record)
-            db.commit()
+        # Deleta o registro (e invalida o cache de token em todos os workers)
+        if database.delete_token(db, user_id=MAIN_USER_ID):
             return {"status": "ok", "message": "Token do Google Calendar deletado com sucesso. Por favor, refaça a autenticação."}
         
         return {"status": "ok", "message": "Nenhum token encontrado para deletar."}
@@ -395,58 +434,63 @@ def clear_token(db: Session = Depends(get_db)):
         return {"status": "error", "message": f"Erro ao deletar token: {e}"}
 
 
+# --- ROTA DE MÉTRICAS ---
+@app.get("/admin/metrics", dependencies=[Depends(exigir_admin)])
+async def admin_metrics():
+    """Latências por etapa, contadores e gauges (filas, threadpool) em JSON."""
+    return metrics.snapshot()
+
+
+# --- SAÚDE E PRONTIDÃO ---
+@app.get("/healthz")
+async def healthz():
+    """Liveness: sempre 200 enquanto o processo responde; o corpo traz o estado das dependências."""
+    return health.relatorio()
+
+
+@app.get("/readyz")
+async def readyz():
+    """Readiness: 503 até o warm-up terminar (ou com a fila de mensagens cheia)."""
+    relatorio = health.relatorio()
+    return JSONResponse(relatorio, status_code=200 if health.pronto(relatorio) else 503)
+
+
+# --- ROTAS DE PERFIS (PROFILER AMOSTRAL) ---
+@app.get("/admin/profiles", dependencies=[Depends(exigir_admin)])
+def admin_profiles():
+    """Lista os perfis recentes gravados pelo profiler (PROFILE_SAMPLE_RATE > 0)."""
+    return {"sample_rate": profiler.PROFILE_SAMPLE_RATE, "profiles": profiler.list_profiles()}
+
+
+@app.get("/admin/profiles/{name}", dependencies=[Depends(exigir_admin)])
+def admin_profile_download(name: str):
+    """Baixa um perfil no formato folded (flamegraph.pl, speedscope)."""
+    path = profiler.profile_path(name)
+    if not path:
+        raise HTTPException(status_code=404, detail="Perfil não encontrado.")
+    return FileResponse(path, media_type="text/plain", filename=name)
+
+
+# --- EXPORTAÇÃO ICS ---
+@app.get("/admin/agenda.ics", dependencies=[Depends(exigir_admin)])
+def admin_export_ics(de: date = None, ate: date = None, usuario: str = None):
+    """Exporta os compromissos em iCalendar, em streaming (cursor do lado do servidor)."""
+    return StreamingResponse(
+        ics_io.exportar(de, ate, usuario),
+        media_type="text/calendar; charset=utf-8",
+        headers={"Content-Disposition": 'attachment; filename="agenda.ics"'},
+    )
+
+
 # --- ROTAS DA APLICAÇÃO ---
 
 @app.get("/", response_class=HTMLResponse)
-def read_root():
+async def read_root(request: Request):
     """
-    Retorna a Landing Page do Alfred. 
+    Retorna a Landing Page do Alfred (static/index.html).
     Essencial para aprovação do Display Name na Meta.
     """
-    content = """
-    <!DOCTYPE html>
-    <html lang="pt-br">
-    <head>
-        <meta charset="UTF-8">
-        <meta name="viewport" content="width=device-width, initial-scale=1.0">
-        <title>Alfred - Assessor Empresarial</title>
-        <style>
-            body { font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif; line-height: 1.6; color: #333; max-width: 800px; margin: 0 auto; padding: 20px; text-align: center; }
-            .container { background: #f9f9f9; padding: 40px; border-radius: 15px; box-shadow: 0 4px 6px rgba(0,0,0,0.1); }
-            h1 { color: #2c3e50; font-size: 2.5em; margin-bottom: 10px; }
-            .subtitle { color: #3498db; font-size: 1.2em; font-weight: bold; margin-bottom: 30px; }
-            .description { font-size: 1.1em; color: #555; margin-bottom: 30px; }
-            .footer { margin-top: 50px; font-size: 0.9em; color: #7f8c8d; border-top: 1px solid #ddd; padding-top: 20px; }
-            .highlight { color: #2ecc71; font-weight: bold; }
-        </style>
-    </head>
-    <body>
-        <div class="container">
-            <h1>Alfred</h1>
-            <p class="subtitle">Assessor Empresarial Inteligente</p>
-            
-            <p class="description">
-                Simplifique sua rotina. O <span class="highlight">Alfred</span> cuida do agendamento e organização 
-                dos seus eventos para você focar no que realmente importa. Integrado diretamente ao seu 
-                WhatsApp e Google Calendar.
-            </p>
-
-            <div class="features">
-                <p>✅ Agendamento Automático</p>
-                <p>✅ Sincronização em Tempo Real</p>
-                <p>✅ Assistente Pessoal via WhatsApp</p>
-            </div>
-
-            <div class="footer">
-                <p>&copy; 2026 <strong>Alfred - Assessor Empresarial</strong></p>
-                <p>Contato: alfred-5klb.onrender.com</p>
-                <p><a href="/privacidade">Política de Privacidade</a> | <a href="/termos">Termos de Uso</a></p>
-            </div>
-        </div>
-    </body>
-    </html>
-    """
-    return HTMLResponse(content=content, status_code=200)
+    return static_pages.responder(request, "index.html")
 
 # --- ROTA DE VERIFICAÇÃO DO WEBHOOK (GET) ---
 # Esta é a rota crítica que estava falhando
@@ -481,21 +525,43 @@ def verify_webhook(request: Request):
 @app.post("/webhook/whatsapp")
 async def handle_whatsapp_message(
     request: Request,
-    background_tasks: BackgroundTasks,
-    db: Session = Depends(get_db)
+    background_tasks: BackgroundTasks
 ):
     """
     Recebe o payload do Meta e responde imediatamente.
+    Se a fila de processamento estiver cheia, descarta a carga (ver admission.py).
     """
     print("--- POST RECEBIDO: Iniciando processamento ---", flush=True)
 
     try:
-        data = await request.json()
-
-        # Agenda a função pesada para background
-        background_tasks.add_task(process_message_background, data, db)
-
-        return {"status": "ok", "message": "Evento agendado."}
+        with metrics.timed("webhook"):
+            data = await request.json()
+
+            try:
+                value = data['entry'][0]['changes'][0]['value']
+            except (KeyError, IndexError, TypeError):
+                value = {}
+            # Callbacks de status (entregue/lido) não geram trabalho: não ocupam a fila
+            if not value.get('messages'):
+                print("LOG: Evento sem mensagens (status) recebido. Ignorando.", flush=True)
+                return {"status": "ok", "message": "Evento ignorado."}
+
+            # Envia a função pesada para a fila limitada de processamento
+            if admission.controller.submit(process_message_background, data):
+                return {"status": "ok", "message": "Evento agendado."}
+
+        print("--- SOBRECARGA: Fila de mensagens cheia ou worker encerrando, descartando carga ---", flush=True)
+        # Encerrando: 503 sempre, para a Meta reentregar a outro worker
+        if admission.SHED_MODE == "reply" and not admission.controller.encerrando:
+            from_number = value['messages'][0].get('from')
+            if from_number:
+                background_tasks.add_task(send_whatsapp_message, from_number, admission.MENSAGEM_SOBRECARGA)
+            return {"status": "ok", "message": "Sobrecarregado; usuário avisado."}
+        return JSONResponse(
+            status_code=503,
+            content={"status": "busy", "message": "Sobrecarregado; tente novamente."},
+            headers={"Retry-After": str(admission.SHED_RETRY_AFTER)},
+        )
 
     except Exception as e:
         error_detail = f"Erro FATAL no POST: {e}\n{traceback.format_exc()}"
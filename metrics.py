@@ -0,0 +1,152 @@
+# metrics.py - Métricas em memória (latências por etapa, contadores e gauges)
+
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+# Quantidade de amostras recentes mantidas por etapa (janela deslizante)
+METRICS_WINDOW = int(os.getenv("METRICS_WINDOW", "2048"))
+
+_lock = threading.Lock()
+_samples = {}   # etapa -> deque[(timestamp, segundos, ok)]
+_counters = {}  # nome -> int
+_gauges = {}    # nome -> função sem argumentos
+_llm = {}       # ação -> agregados de uso do LLM
+
+
+class _Timer:
+    """Cronômetro devolvido por timed(); permite marcar a etapa como falha."""
+    __slots__ = ("ok",)
+
+    def __init__(self):
+        self.ok = True
+
+    def fail(self):
+        self.ok = False
+
+
+def observe(stage: str, seconds: float, ok: bool = True):
+    """Registra uma amostra de latência para a etapa informada."""
+    with _lock:
+        bucket = _samples.get(stage)
+        if bucket is None:
+            bucket = _samples[stage] = deque(maxlen=METRICS_WINDOW)
+        bucket.append((time.time(), seconds, ok))
+
+
+@contextmanager
+def timed(stage: str):
+    """Mede o bloco e registra em observe(). Exceções contam como falha."""
+    timer = _Timer()
+    start = time.perf_counter()
+    try:
+        yield timer
+    except BaseException:
+        timer.ok = False
+        raise
+    finally:
+        observe(stage, time.perf_counter() - start, timer.ok)
+
+
+def incr(name: str, n: int = 1):
+    """Incrementa um contador."""
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + n
+
+
+def record_llm_usage(action: str, prompt_tokens: int, completion_tokens: int,
+                     cached_tokens: int, cost: float, latency: float):
+    """Acumula tokens, custo e latência das chamadas ao LLM por ação."""
+    with _lock:
+        agg = _llm.get(action)
+        if agg is None:
+            agg = _llm[action] = {"chamadas": 0, "prompt_tokens": 0, "completion_tokens": 0,
+                                  "cached_tokens": 0, "custo_usd": 0.0, "latencia_s": 0.0}
+        agg["chamadas"] += 1
+        agg["prompt_tokens"] += prompt_tokens
+        agg["completion_tokens"] += completion_tokens
+        agg["cached_tokens"] += cached_tokens
+        agg["custo_usd"] += cost
+        agg["latencia_s"] += latency
+
+
+def llm_summary():
+    """Agregados por ação: totais, médias, fração de prompt servida do cache e custo."""
+    with _lock:
+        aggs = {action: dict(agg) for action, agg in _llm.items()}
+    resumo = {}
+    for action, agg in aggs.items():
+        n = agg["chamadas"]
+        resumo[action] = {
+            "chamadas": n,
+            "prompt_tokens": agg["prompt_tokens"],
+            "completion_tokens": agg["completion_tokens"],
+            "cached_tokens": agg["cached_tokens"],
+            "cache_hit_ratio": round(agg["cached_tokens"] / agg["prompt_tokens"], 4) if agg["prompt_tokens"] else 0.0,
+            "custo_usd": round(agg["custo_usd"], 6),
+            "custo_medio_usd": round(agg["custo_usd"] / n, 8),
+            "latencia_media_ms": round(agg["latencia_s"] / n * 1000, 1),
+        }
+    return resumo
+
+
+def register_gauge(name: str, fn):
+    """Registra uma função que devolve o valor atual de um gauge."""
+    _gauges[name] = fn
+
+
+def percentile(values, p: float):
+    """Percentil por interpolação linear sobre uma lista já ordenada."""
+    if not values:
+        return None
+    k = (len(values) - 1) * p / 100.0
+    lo = int(k)
+    hi = min(lo + 1, len(values) - 1)
+    return values[lo] + (values[hi] - values[lo]) * (k - lo)
+
+
+def stage_summary(stage: str):
+    """Resumo (contagem, p50/p95/p99 em ms, taxa de erro) de uma etapa."""
+    with _lock:
+        samples = list(_samples.get(stage, ()))
+    if not samples:
+        return None
+    latencies = sorted(s[1] for s in samples)
+    errors = sum(1 for s in samples if not s[2])
+    return {
+        "count": len(samples),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+        "error_rate": round(errors / len(samples), 4),
+        "last_seen": samples[-1][0],
+    }
+
+
+def snapshot():
+    """Fotografia de todas as métricas, pronta para serializar em JSON."""
+    with _lock:
+        stages = list(_samples)
+        counters = dict(_counters)
+    gauges = {}
+    for name, fn in list(_gauges.items()):
+        try:
+            gauges[name] = fn()
+        except Exception as e:
+            gauges[name] = f"erro: {e}"
+    return {
+        "stages": {stage: stage_summary(stage) for stage in stages},
+        "counters": counters,
+        "gauges": gauges,
+        "llm": llm_summary(),
+    }
+
+
+def reset():
+    """Limpa amostras e contadores (usado pelos benchmarks entre rodadas)."""
+    with _lock:
+        _samples.clear()
+        _counters.clear()
+        _llm.clear()
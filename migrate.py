@@ -0,0 +1,141 @@
+# migrate.py - Criação/atualização do schema do banco de dados
+#
+# O schema não é mais criado na importação do main.py. Ele é aplicado:
+#   - explicitamente, antes do deploy:   python migrate.py
+#   - ou pelo warm-up em segundo plano na inicialização do app (AUTO_MIGRATE=1,
+#     padrão), com novas tentativas se o banco ainda não estiver disponível.
+#
+# Todos os passos são idempotentes: podem rodar várias vezes sem efeito colateral.
+# Com vários workers subindo juntos, um lock (database.advisory_lock) faz um só
+# aplicar as migrações; os outros esperam por ele e depois só confirmam o schema.
+
+import os
+import sys
+import time
+
+from sqlalchemy import inspect, text
+
+import database
+
+_LOCK_ID = 0x616C666D  # "alfm"
+# Quanto tempo (s) esperar pela migração de outro processo antes de desistir
+MIGRATE_LOCK_TIMEOUT = float(os.getenv("MIGRATE_LOCK_TIMEOUT", "300"))
+
+# Colunas adicionadas depois da criação original das tabelas: create_all não
+# altera tabelas existentes, então elas são acrescentadas aqui se faltarem.
+# (tabela, coluna, DDL da coluna, índice opcional)
+COLUNAS_NOVAS = [
+    ("compromissos", "usuario", "VARCHAR", "ix_compromissos_usuario"),
+    ("compromissos", "version", "INTEGER NOT NULL DEFAULT 1", None),
+    ("compromissos_arquivo", "version", "INTEGER NOT NULL DEFAULT 1", None),
+]
+
+# Índices criados depois da tabela (create_all só os cria em tabelas novas)
+INDICES_NOVOS = [
+    ("compromissos", "data_hora", "ix_compromissos_data_hora"),
+]
+
+
+def _atualizar_tabelas(conn):
+    inspector = inspect(conn)
+    for tabela, coluna, ddl, indice in COLUNAS_NOVAS:
+        existentes = {c["name"] for c in inspector.get_columns(tabela)}
+        if coluna in existentes:
+            continue
+        conn.execute(text(f"ALTER TABLE {tabela} ADD COLUMN {coluna} {ddl}"))
+        if indice:
+            conn.execute(text(f"CREATE INDEX IF NOT EXISTS {indice} ON {tabela} ({coluna})"))
+        print(f"Migração: coluna {tabela}.{coluna} adicionada.", flush=True)
+    for tabela, coluna, indice in INDICES_NOVOS:
+        conn.execute(text(f"CREATE INDEX IF NOT EXISTS {indice} ON {tabela} ({coluna})"))
+
+
+_TABELA_ANTIGA = "compromissos_sem_autoincrement"
+
+
+def _autoincrement_sqlite(conn):
+    """SQLite: recria "compromissos" com AUTOINCREMENT (bancos criados antes dele) e
+    garante que a sequência passe do maior ID já arquivado, para nenhum ID ser reusado."""
+    tabelas = set(conn.execute(text("SELECT name FROM sqlite_master WHERE type = 'table'")).scalars())
+    if _TABELA_ANTIGA in tabelas:
+        # Recriação interrompida por uma versão anterior (não atômica) desta migração:
+        # o create_all já recriou "compromissos"; termina a cópia das linhas que ficaram para trás
+        antigas = {c["name"] for c in inspect(conn).get_columns(_TABELA_ANTIGA)}
+        colunas = ", ".join(c.name for c in database.Compromisso.__table__.columns if c.name in antigas)
+        conn.execute(text(
+            f"INSERT INTO compromissos ({colunas}) SELECT {colunas} FROM {_TABELA_ANTIGA} "
+            f"WHERE id NOT IN (SELECT id FROM compromissos)"
+        ))
+        conn.execute(text(f"DROP TABLE {_TABELA_ANTIGA}"))
+        print(f"Migração: linhas recuperadas de {_TABELA_ANTIGA}.", flush=True)
+
+    ddl = conn.execute(text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'compromissos'")).scalar()
+    if "AUTOINCREMENT" not in ddl.upper():
+        colunas = ", ".join(c.name for c in database.Compromisso.__table__.columns)
+        indices = conn.execute(text(
+            "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'compromissos' AND sql IS NOT NULL"
+        )).scalars().all()
+        for indice in indices:
+            conn.execute(text(f"DROP INDEX {indice}"))
+        conn.execute(text(f"ALTER TABLE compromissos RENAME TO {_TABELA_ANTIGA}"))
+        database.Compromisso.__table__.create(conn)
+        conn.execute(text(f"INSERT INTO compromissos ({colunas}) SELECT {colunas} FROM {_TABELA_ANTIGA}"))
+        conn.execute(text(f"DROP TABLE {_TABELA_ANTIGA}"))
+        print("Migração: compromissos recriada com AUTOINCREMENT.", flush=True)
+
+    maior = conn.execute(text(
+        "SELECT MAX(m) FROM (SELECT MAX(id) AS m FROM compromissos UNION ALL SELECT MAX(id) FROM compromissos_arquivo)"
+    )).scalar() or 0
+    atual = conn.execute(text("SELECT seq FROM sqlite_sequence WHERE name = 'compromissos'")).scalar()
+    if atual is None:
+        conn.execute(text("INSERT INTO sqlite_sequence (name, seq) VALUES ('compromissos', :seq)"), {"seq": maior})
+    elif atual < maior:
+        conn.execute(text("UPDATE sqlite_sequence SET seq = :seq WHERE name = 'compromissos'"), {"seq": maior})
+
+
+def _transacao_sqlite(passo):
+    """Roda passo(conn) numa transação SQLite de verdade.
+
+    O pysqlite não emite BEGIN antes de DDL: dentro de um engine.begin() comum,
+    RENAME/CREATE/DROP seriam efetivados um a um e uma falha no meio deixaria
+    as linhas presas na tabela antiga. Com o BEGIN explícito, tudo ou nada.
+    """
+    with database.engine.connect() as conn:
+        conn.exec_driver_sql("BEGIN")
+        try:
+            passo(conn)
+        except Exception:
+            conn.rollback()
+            raise
+        conn.commit()
+
+
+def run_migrations():
+    """Aplica o schema completo. Levanta exceção se o banco estiver inacessível."""
+    limite = time.monotonic() + MIGRATE_LOCK_TIMEOUT
+    while True:
+        with database.advisory_lock(_LOCK_ID) as obtido:
+            if obtido:
+                _aplicar()
+                return
+        if time.monotonic() > limite:
+            raise TimeoutError("Outro processo segura o lock de migração há tempo demais.")
+        print("Migração: outro processo está migrando; aguardando.", flush=True)
+        time.sleep(1)
+
+
+def _aplicar():
+    database.Base.metadata.create_all(bind=database.engine)
+    with database.engine.begin() as conn:
+        _atualizar_tabelas(conn)
+    if database.engine.dialect.name == "sqlite":
+        _transacao_sqlite(_autoincrement_sqlite)
+
+
+if __name__ == "__main__":
+    try:
+        run_migrations()
+    except Exception as e:
+        print(f"Erro ao aplicar migrações: {e}", flush=True)
+        sys.exit(1)
+    print("Migrações aplicadas com sucesso.", flush=True)
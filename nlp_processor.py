@@ -1,66 +1,289 @@
-# nlp_processor.py - Versão Final Corrigida
+# nlp_processor.py - Modelo único de ação e validação da saída do LLM
+#
+# AgendaAction é a estrutura usada por ai_service, main e conversation_store.
+# parse_action() é o único caminho de entrada da saída da IA: decodifica o
+# JSON (orjson quando disponível), normaliza os campos e conserta localmente
+# o que for possível (datas relativas, duração ausente, ID em texto) em vez de
+# gastar outra chamada ao LLM com uma resposta de erro.
 
-import os
 import json
-from datetime import datetime
-from typing import Optional
-from pydantic import BaseModel
-from openai import OpenAI
+import re
+from datetime import datetime, timedelta
 
-# O cliente OpenAI é inicializado automaticamente com a variável de ambiente OPENAI_API_KEY
-client = OpenAI()
+from pytz import timezone
 
-# 1. Definição da Classe que o main.py precisa importar
-class AgendaAction(BaseModel):
+try:
+    import orjson
+    _loads = orjson.loads
+except ImportError:  # orjson é opcional; json da stdlib funciona igual, só mais devagar
+    _loads = json.loads
+
+TZ = timezone('America/Sao_Paulo')
+
+ACOES = {"agendar", "reagendar", "cancelar", "consultar", "disponibilidade", "conversa", "erro"}
+_SINONIMOS = {
+    "agendamento": "agendar", "marcar": "agendar", "criar": "agendar",
+    "reagendamento": "reagendar", "remarcar": "reagendar", "alterar": "reagendar",
+    "cancelamento": "cancelar", "excluir": "cancelar", "deletar": "cancelar",
+    "consulta": "consultar", "listar": "consultar", "agenda": "consultar",
+    "livre": "disponibilidade", "disponivel": "disponibilidade", "disponível": "disponibilidade",
+    "chat": "conversa", "outro": "conversa",
+}
+
+DURACAO_PADRAO = 60
+
+_HORA = re.compile(
+    r'\b(\d{1,2})\s*(?:h|:)\s*(\d{2})?\b'
+    # "15 horas", "15hrs"; depois de "de/por/durante" é duração ("por 2 horas"), não horário
+    r'|(?<!\bde )(?<!\bpor )(?<!durante )\b(\d{1,2})\s*(?:horas?|hrs?)\b',
+    re.IGNORECASE,
+)
+_DATA = re.compile(r'\b(\d{1,2})/(\d{1,2})(?:/(\d{2,4}))?\b')
+# "1h30", "2 horas", "45 min", "meia hora", "1 hora e meia" (o " e " é removido antes)
+_DURACAO = re.compile(
+    r'(?:(\d+)\s*h(?:oras?|rs?)?)?\s*(meia(?:\s*hora)?)?\s*(?:(\d+)\s*(?:min(?:utos?)?|m)?)?', re.IGNORECASE
+)
+_FORMATOS_DATA_HORA = ("%d/%m/%Y %H:%M", "%d/%m/%Y %H:%M:%S", "%Y-%m-%d %H:%M", "%d/%m/%Y")
+_DIAS_SEMANA = {
+    "segunda": 0, "terça": 1, "terca": 1, "quarta": 2, "quinta": 3,
+    "sexta": 4, "sábado": 5, "sabado": 5, "domingo": 6,
+}
+
+
+class AgendaAction:
     """Estrutura de dados para a ação e os parâmetros extraídos pela IA."""
-    action: str  # Ex: agendar, reagendar, cancelar, consultar
-    titulo: Optional[str] = None
-    data_hora: Optional[datetime] = None
-    assunto: Optional[str] = None
-    duracao: Optional[int] = 120  # Duração padrão em minutos
-    recorrencia: Optional[str] = None
-    id_compromisso: Optional[int] = None  # Para reagendar/cancelar
-
-# 2. Função de Processamento de IA
-def process_message_with_ai(message: str) -> AgendaAction:
-    """Envia a mensagem para a OpenAI para extrair a ação e os parâmetros."""
-    
-    # O prompt deve ser o mais claro possível para garantir o formato JSON
-    prompt = f"""
-    Você é um assistente de agendamento de compromissos. Sua tarefa é analisar a mensagem do usuário e extrair a intenção (action) e os parâmetros relevantes em formato JSON.
-
-    Regras de Extração:
-    1. A 'action' deve ser uma das seguintes: 'agendar', 'reagendar', 'cancelar', 'consultar'.
-    2. A 'data_hora' deve ser convertida para o formato ISO 8601 (YYYY-MM-DDTHH:MM:SS) e deve ser no futuro. Se a data não for especificada, use a data de hoje. Se a hora não for especificada, use 09:00.
-    3. O 'id_compromisso' é obrigatório para 'reagendar' e 'cancelar'.
-    4. O 'duracao' é em minutos. Use 120 (2 horas) como padrão se não for especificado.
-    5. O JSON de saída deve ser estritamente compatível com o schema AgendaAction.
-
-    Mensagem do Usuário: "{message}"
+    __slots__ = ("action", "titulo", "data_hora", "assunto", "duracao", "recorrencia",
+                 "id_compromisso", "resposta_whatsapp", "acao_pendente", "data", "hora")
+
+    def __init__(self, action, titulo=None, data_hora=None, assunto=None, duracao=DURACAO_PADRAO,
+                 recorrencia=None, id_compromisso=None, resposta_whatsapp=None,
+                 acao_pendente=None, data=None, hora=None):
+        self.action = action
+        self.titulo = titulo
+        self.data_hora = data_hora
+        self.assunto = assunto
+        self.duracao = duracao
+        self.recorrencia = recorrencia
+        self.id_compromisso = id_compromisso
+        self.resposta_whatsapp = resposta_whatsapp
+        self.acao_pendente = acao_pendente  # só em "erro": ação que aguarda o dado faltante
+        self.data = data                    # YYYY-MM-DD já conhecida de um pedido incompleto
+        self.hora = hora                    # HH:MM já conhecida de um pedido incompleto
+
+    def to_dict(self) -> dict:
+        d = {slot: getattr(self, slot) for slot in self.__slots__}
+        if isinstance(self.data_hora, datetime):
+            d["data_hora"] = self.data_hora.isoformat()
+        return d
+
+    def __repr__(self):
+        return f"AgendaAction({self.to_dict()!r})"
+
+
+# --- Extração de datas/horas em português (também usada pelo conversation_store) ---
+
+def extrair_data(texto: str, agora: datetime):
+    """Data de expressões como 'hoje', 'amanhã', 'sexta', '27/10'; None se não houver."""
+    lower = texto.lower()
+    if "depois de amanhã" in lower or "depois de amanha" in lower:
+        return (agora + timedelta(days=2)).date()
+    if "amanhã" in lower or "amanha" in lower:
+        return (agora + timedelta(days=1)).date()
+    if "hoje" in lower:
+        return agora.date()
+    match = _DATA.search(texto)
+    if match:
+        dia, mes, ano = int(match.group(1)), int(match.group(2)), match.group(3)
+        ano = int(ano) + (2000 if len(ano) == 2 else 0) if ano else agora.year
+        try:
+            return datetime(ano, mes, dia).date()
+        except ValueError:
+            return None
+    for nome, indice in _DIAS_SEMANA.items():
+        if re.search(rf'\b{nome}\b', lower):
+            dias = (indice - agora.weekday()) % 7 or 7
+            return (agora + timedelta(days=dias)).date()
+    return None
+
+
+def extrair_hora(texto: str):
+    """(hora, minuto) de expressões como '15h', '9h30', '14:00'; None se não houver."""
+    match = _HORA.search(texto)
+    if not match:
+        return None
+    hora, minuto = int(match.group(1) or match.group(3)), int(match.group(2) or 0)
+    if hora > 23 or minuto > 59:
+        return None
+    return hora, minuto
+
+
+_EXPRESSOES_DATA = re.compile(
+    r"depois de amanh[ãa]|amanh[ãa]|hoje|\b(?:" + "|".join(_DIAS_SEMANA) + r")\b", re.IGNORECASE
+)
+
+
+def sem_data_hora(texto: str) -> str:
+    """O texto sem as expressões de data e hora reconhecidas por extrair_data/extrair_hora."""
+    return _EXPRESSOES_DATA.sub(" ", _HORA.sub(" ", _DATA.sub(" ", texto)))
+
+
+def agora_local() -> datetime:
+    """Agora em America/Sao_Paulo, sem tzinfo (mesma convenção das colunas do banco)."""
+    return datetime.now(TZ).replace(tzinfo=None)
+
+
+# --- Normalização campo a campo ---
+
+def _texto(valor):
+    if valor is None:
+        return None
+    valor = str(valor).strip()
+    return valor or None
+
+
+def _normalizar_acao(valor) -> str:
+    acao = (_texto(valor) or "conversa").lower()
+    acao = _SINONIMOS.get(acao, acao)
+    return acao if acao in ACOES else "conversa"
+
+
+def _normalizar_id(valor):
+    if isinstance(valor, bool) or valor is None:
+        return None
+    if isinstance(valor, int):
+        return valor if valor > 0 else None
+    match = re.search(r'\d+', str(valor))
+    return int(match.group(0)) if match else None
+
+
+def _normalizar_duracao(valor) -> int:
+    if isinstance(valor, (int, float)) and not isinstance(valor, bool):
+        minutos = int(valor)
+    else:
+        texto = _texto(valor)
+        if not texto:
+            return DURACAO_PADRAO
+        if texto.isdigit():
+            minutos = int(texto)
+        else:
+            match = _DURACAO.fullmatch(texto.replace(" e ", " "))
+            if not match or not any(match.groups()):
+                return DURACAO_PADRAO
+            minutos = int(match.group(1) or 0) * 60 + (30 if match.group(2) else 0) + int(match.group(3) or 0)
+    return minutos if 5 <= minutos <= 24 * 60 else DURACAO_PADRAO
+
+
+def _normalizar_data_hora(valor, agora: datetime):
+    """Devolve (datetime | None, tem_hora). Aceita ISO, 'dd/mm/aaaa HH:MM' e datas relativas."""
+    if valor is None:
+        return None, False
+    if isinstance(valor, datetime):
+        dt = valor
+    else:
+        texto = _texto(valor)
+        if not texto:
+            return None, False
+        dt = None
+        try:
+            dt = datetime.fromisoformat(texto.replace("Z", "+00:00"))
+        except ValueError:
+            for formato in _FORMATOS_DATA_HORA:
+                try:
+                    dt = datetime.strptime(texto, formato)
+                    break
+                except ValueError:
+                    continue
+        if dt is None:
+            # Texto livre ("amanhã às 15h", "sexta 10h"): resolve localmente
+            dia, hora = extrair_data(texto, agora), extrair_hora(texto)
+            if not dia and not hora:
+                return None, False
+            dia = dia or agora.date()
+            hh, mm = hora or (0, 0)
+            return datetime(dia.year, dia.month, dia.day, hh, mm), hora is not None
+        tem_hora = len(texto) > 10
+        if dt.tzinfo is not None:
+            dt = dt.astimezone(TZ).replace(tzinfo=None)
+        return dt, tem_hora
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(TZ).replace(tzinfo=None)
+    return dt, True
+
+
+def _normalizar_data(valor, agora: datetime):
+    """Data parcial de um pedido incompleto, como YYYY-MM-DD."""
+    dt, _ = _normalizar_data_hora(valor, agora)
+    return dt.date().isoformat() if dt else None
+
+
+def _normalizar_hora(valor):
+    """Hora parcial de um pedido incompleto, como HH:MM."""
+    hora = extrair_hora(_texto(valor) or "")
+    return f"{hora[0]:02d}:{hora[1]:02d}" if hora else None
+
+
+def parse_action(raw, agora: datetime = None) -> AgendaAction:
+    """Decodifica e valida a saída do LLM (str/bytes JSON ou dict) numa AgendaAction.
+
+    Campos inválidos são consertados localmente; quando falta um dado que não
+    dá para inferir, a ação vira "erro" com acao_pendente e uma pergunta
+    curta ao usuário, que o conversation_store completa na mensagem seguinte.
     """
+    dados = _loads(raw) if isinstance(raw, (str, bytes, bytearray)) else dict(raw or {})
+    if not isinstance(dados, dict):
+        raise ValueError("A saída da IA não é um objeto JSON.")
+    agora = agora or agora_local()
+
+    acao = _normalizar_acao(dados.get("action"))
+    data_hora, tem_hora = _normalizar_data_hora(dados.get("data_hora"), agora)
+    action = AgendaAction(
+        action=acao,
+        titulo=_texto(dados.get("titulo")),
+        data_hora=data_hora,
+        assunto=_texto(dados.get("assunto")),
+        duracao=_normalizar_duracao(dados.get("duracao")),
+        recorrencia=_texto(dados.get("recorrencia")),
+        id_compromisso=_normalizar_id(dados.get("id_compromisso")),
+        resposta_whatsapp=_texto(dados.get("resposta_whatsapp")) or "Processando sua solicitação...",
+        acao_pendente=_texto(dados.get("acao_pendente")),
+        data=_normalizar_data(dados.get("data"), agora),
+        hora=_normalizar_hora(dados.get("hora")),
+    )
+    if action.acao_pendente:
+        action.acao_pendente = _normalizar_acao(action.acao_pendente)
 
-    try:
-        response = client.chat.completions.create(
-            model="gpt-3.5-turbo", # Modelo rápido para extração de dados
-            messages=[
-                {"role": "system", "content": "Você é um assistente de agendamento que retorna estritamente um objeto JSON."},
-                {"role": "user", "content": prompt}
-            ],
-            response_format={"type": "json_object"}
-        )
-        
-        # O modelo retorna uma string JSON
-        json_string = response.choices[0].message.content
-        
-        # Converte a string JSON para o objeto AgendaAction
-        data = json.loads(json_string)
-        
-        # Valida e retorna o objeto Pydantic
-        return AgendaAction(**data)
-
-    except Exception as e:
-        # Em caso de falha na IA ou no parsing, retorna uma ação padrão de erro
-        print(f"Erro na chamada da OpenAI: {e}")
-        return AgendaAction(action="erro", titulo=f"Erro de IA: {e}")
+    if acao in ("agendar", "reagendar"):
+        if acao == "agendar" and not action.titulo:
+            action.titulo = "Compromisso"
+        if acao == "reagendar" and not action.id_compromisso:
+            return _pedir(action, "reagendar", "Qual o ID do compromisso que devo remarcar?")
+        if data_hora is None:
+            return _pedir(action, acao, f"Para quando devo marcar {action.titulo or 'o compromisso'}?")
+        if not tem_hora:
+            # Só a data: guarda o que já se sabe e pergunta o horário
+            action.data = data_hora.date().isoformat()
+            action.data_hora = None
+            return _pedir(action, acao, f"Anotado, {data_hora.strftime('%d/%m')}. E qual o horário?")
+    elif acao == "cancelar" and not action.id_compromisso:
+        return _pedir(action, "cancelar", "Qual o ID do compromisso que devo cancelar?")
+    return action
+
+
+def _pedir(action: AgendaAction, acao_pendente: str, pergunta: str) -> AgendaAction:
+    if action.data_hora is not None:
+        # O que já foi resolvido segue no pedido pendente
+        action.data = action.data_hora.date().isoformat()
+        action.hora = action.data_hora.strftime("%H:%M")
+        action.data_hora = None
+    action.action = "erro"
+    action.acao_pendente = acao_pendente
+    action.resposta_whatsapp = pergunta
+    return action
+
+
+def process_message_with_ai(message: str) -> AgendaAction:
+    """Envia a mensagem para a IA e devolve a ação já validada."""
+    import ai_service
+    return ai_service.get_ai_response(message)
 
 # --- Fim do nlp_processor.py ---
@@ -0,0 +1,142 @@
+# profiler.py - Profiler estatístico opcional para mensagens em produção
+#
+# Controlado por variáveis de ambiente; desligado por padrão.
+#   PROFILE_SAMPLE_RATE  fração das mensagens perfiladas (ex: 0.01 = 1%)
+#   PROFILE_INTERVAL_MS  intervalo entre amostras da pilha (padrão 5 ms)
+#   PROFILE_DIR          diretório dos perfis (padrão /tmp/alfred-profiles)
+#   PROFILE_MAX_FILES    quantidade máxima de perfis mantidos em disco (anel)
+#
+# Os perfis são gravados no formato "folded" (uma pilha por linha seguida da
+# contagem), compatível com flamegraph.pl, speedscope e inferno.
+
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL_MS", "5")) / 1000
+PROFILE_DIR = os.getenv("PROFILE_DIR", "/tmp/alfred-profiles")
+PROFILE_MAX_FILES = int(os.getenv("PROFILE_MAX_FILES", "50"))
+
+_NOME_VALIDO = re.compile(r"^[\w.-]+\.folded$")
+
+_lock = threading.Lock()
+_ativos = {}  # ident da thread perfilada -> Counter de pilhas
+_sampler = None
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _collapse(frame) -> str:
+    """Pilha da raiz até a folha, separada por ';' (formato folded)."""
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    return ";".join(reversed(labels))
+
+
+def _sample_loop():
+    """Uma única thread amostra todas as threads com perfil ativo."""
+    global _sampler
+    while True:
+        time.sleep(PROFILE_INTERVAL)
+        with _lock:
+            if not _ativos:
+                _sampler = None
+                return
+            frames = sys._current_frames()
+            for ident, stacks in _ativos.items():
+                frame = frames.get(ident)
+                if frame is not None:
+                    stacks[_collapse(frame)] += 1
+
+
+def _start(ident: int) -> Counter:
+    global _sampler
+    stacks = Counter()
+    with _lock:
+        _ativos[ident] = stacks
+        if _sampler is None:
+            _sampler = threading.Thread(target=_sample_loop, name="profiler-sampler", daemon=True)
+            _sampler.start()
+    return stacks
+
+
+def _stop(ident: int):
+    with _lock:
+        _ativos.pop(ident, None)
+
+
+def _write(label: str, stacks: Counter, duration: float):
+    """Grava o perfil de forma atômica e apaga os mais antigos além do limite."""
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    safe_label = re.sub(r"[^\w-]", "_", label)[:40]
+    name = f"{time.strftime('%Y%m%dT%H%M%S')}-{int(time.time() * 1000) % 1000:03d}-{safe_label}-{int(duration * 1000)}ms.folded"
+    path = os.path.join(PROFILE_DIR, name)
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        for stack, count in stacks.most_common():
+            f.write(f"{stack} {count}\n")
+    os.replace(tmp, path)
+
+    perfis = sorted(list_profiles(), key=lambda p: p["mtime"])
+    for antigo in perfis[:-PROFILE_MAX_FILES] if PROFILE_MAX_FILES > 0 else perfis:
+        try:
+            os.remove(os.path.join(PROFILE_DIR, antigo["name"]))
+        except OSError:
+            pass
+
+
+@contextmanager
+def maybe_profile(label: str):
+    """Perfila o bloco com probabilidade PROFILE_SAMPLE_RATE; custo zero quando não sorteado."""
+    if PROFILE_SAMPLE_RATE <= 0 or random.random() >= PROFILE_SAMPLE_RATE:
+        yield
+        return
+
+    ident = threading.get_ident()
+    stacks = _start(ident)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _stop(ident)
+        duration = time.perf_counter() - start
+        if stacks:
+            try:
+                _write(label, stacks, duration)
+            except OSError as e:
+                print(f"LOG (Profiler): Falha ao gravar perfil: {e}", flush=True)
+
+
+def list_profiles():
+    """Perfis em disco, do mais recente para o mais antigo."""
+    try:
+        names = [n for n in os.listdir(PROFILE_DIR) if _NOME_VALIDO.match(n)]
+    except FileNotFoundError:
+        return []
+    perfis = []
+    for name in names:
+        try:
+            st = os.stat(os.path.join(PROFILE_DIR, name))
+        except OSError:
+            continue
+        perfis.append({"name": name, "size": st.st_size, "mtime": st.st_mtime})
+    return sorted(perfis, key=lambda p: p["mtime"], reverse=True)
+
+
+def profile_path(name: str):
+    """Caminho do perfil pelo nome, ou None se o nome for inválido/inexistente."""
+    if not _NOME_VALIDO.match(name):
+        return None
+    path = os.path.join(PROFILE_DIR, name)
+    return path if os.path.isfile(path) else None
@@ -0,0 +1,106 @@
+# static_pages.py - Páginas estáticas (landing, privacidade, termos)
+#
+# Os HTMLs em static/ são lidos uma única vez, na importação, e guardados já
+# comprimidos (gzip e, se o pacote brotli estiver instalado, br). Cada página
+# tem um ETag forte derivado do conteúdo; um If-None-Match que bate devolve
+# 304 sem corpo. Os crawlers da Meta pedem essas páginas com frequência, então
+# nenhuma requisição monta string, comprime ou lê disco.
+
+import gzip
+import hashlib
+import os
+
+from fastapi import Request
+from fastapi.responses import Response
+
+import metrics
+
+try:
+    import brotli
+except ImportError:  # brotli é opcional; sem ele as páginas saem só em gzip/identity
+    brotli = None
+
+STATIC_DIR = os.getenv("STATIC_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "static"))
+STATIC_MAX_AGE = int(os.getenv("STATIC_MAX_AGE", "3600"))
+
+_CACHE_CONTROL = f"public, max-age={STATIC_MAX_AGE}"
+_MEDIA_TYPE = "text/html; charset=utf-8"
+
+
+def _carregar(nome: str) -> dict:
+    """Representações de uma página: {encoding: (corpo, etag)}; "identity" é o original."""
+    with open(os.path.join(STATIC_DIR, nome), "rb") as f:
+        corpo = f.read()
+    base = hashlib.sha256(corpo).hexdigest()[:32]
+    variantes = {"identity": corpo, "gzip": gzip.compress(corpo, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        variantes["br"] = brotli.compress(corpo, quality=11)
+    # ETag forte por representação: bytes diferentes, validadores diferentes
+    return {
+        enc: (dados, f'"{base}"' if enc == "identity" else f'"{base}-{enc}"')
+        for enc, dados in variantes.items()
+    }
+
+
+_paginas = {
+    nome: _carregar(nome)
+    for nome in sorted(os.listdir(STATIC_DIR)) if nome.endswith(".html")
+}
+
+
+def _aceitos(accept_encoding: str) -> set:
+    """Encodings aceitos pelo cliente (q > 0)."""
+    aceitos = set()
+    for parte in accept_encoding.lower().split(","):
+        enc, _, params = parte.strip().partition(";")
+        q = params.strip()
+        if q.startswith("q="):
+            try:
+                if float(q[2:]) == 0:
+                    continue
+            except ValueError:
+                continue
+        if enc:
+            aceitos.add(enc.strip())
+    return aceitos
+
+
+def _escolher(pagina: dict, accept_encoding: str) -> str:
+    aceitos = _aceitos(accept_encoding)
+    for enc in ("br", "gzip"):
+        if enc in pagina and (enc in aceitos or "*" in aceitos):
+            return enc
+    return "identity"
+
+
+def _bate(if_none_match: str, etag: str) -> bool:
+    """If-None-Match (comparação fraca) contra o ETag da representação escolhida nesta requisição."""
+    if if_none_match.strip() == "*":
+        return True
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if (tag[2:] if tag.startswith("W/") else tag) == etag:
+            return True
+    return False
+
+
+def responder(request: Request, nome: str) -> Response:
+    """Resposta da página `nome` (ex.: "index.html"), comprimida e com validadores de cache."""
+    pagina = _paginas[nome]
+    enc = _escolher(pagina, request.headers.get("accept-encoding", ""))
+    corpo, etag = pagina[enc]
+    headers = {"ETag": etag, "Cache-Control": _CACHE_CONTROL, "Vary": "Accept-Encoding"}
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and _bate(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    if enc != "identity":
+        headers["Content-Encoding"] = enc
+    return Response(content=corpo, media_type=_MEDIA_TYPE, headers=headers)
+
+
+def stats() -> dict:
+    return {nome: {enc: len(dados) for enc, (dados, _) in pagina.items()} for nome, pagina in _paginas.items()}
+
+
+metrics.register_gauge("static_pages", stats)
@@ -0,0 +1,28 @@
+# conftest.py - Ambiente dos testes: SQLite temporário e a raiz do repo no sys.path
+#
+# Roda antes de qualquer import dos módulos do app: database.py lê DATABASE_URL
+# e SQLITE_PATH na importação, então os testes nunca tocam o banco de verdade.
+
+import os
+import sys
+import tempfile
+
+import pytest
+
+os.environ.pop("DATABASE_URL", None)
+os.environ["SQLITE_PATH"] = os.path.join(tempfile.mkdtemp(prefix="alfred-testes-"), "testes.db")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def db():
+    """Sessão num banco SQLite temporário já migrado (as tabelas são esvaziadas ao fim)."""
+    import database
+    import migrate
+
+    migrate.run_migrations()
+    with database.session_scope() as sessao:
+        yield sessao
+    with database.engine.begin() as conn:
+        for tabela in reversed(database.Base.metadata.sorted_tables):
+            conn.execute(tabela.delete())
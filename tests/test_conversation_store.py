@@ -0,0 +1,70 @@
+from datetime import datetime
+
+import pytest
+
+from conversation_store import Conversa, preencher_pendente
+
+AGORA = datetime(2026, 10, 19, 10, 0)  # segunda-feira
+
+
+def _conversa(**pendente):
+    return Conversa("5562999999999", pendente=dict({"action": "agendar", "titulo": "Dentista", "duracao": 30},
+                                                    **pendente))
+
+
+@pytest.mark.parametrize("texto, esperado", [
+    ("às 15h", datetime(2026, 10, 19, 15, 0)),
+    ("9h", datetime(2026, 10, 20, 9, 0)),           # já passou hoje: amanhã
+    ("amanhã às 9h30", datetime(2026, 10, 20, 9, 30)),
+    ("pode ser sexta às 14 horas", datetime(2026, 10, 23, 14, 0)),
+])
+def test_completa_o_horario_sem_ia(texto, esperado):
+    acao = preencher_pendente(_conversa(), texto, AGORA)
+    assert acao.action == "agendar"
+    assert acao.data_hora == esperado
+    assert (acao.titulo, acao.duracao) == ("Dentista", 30)
+
+
+def test_usa_a_data_ja_conhecida():
+    acao = preencher_pendente(_conversa(data="2026-10-23"), "às 11h", AGORA)
+    assert acao.data_hora == datetime(2026, 10, 23, 11, 0)
+
+
+def test_usa_a_hora_ja_conhecida():
+    acao = preencher_pendente(_conversa(hora="16:00"), "quarta", AGORA)
+    assert acao.data_hora == datetime(2026, 10, 21, 16, 0)
+
+
+def test_so_a_data_pergunta_o_horario():
+    acao = preencher_pendente(_conversa(), "sexta", AGORA)
+    assert acao.action == "erro"
+    assert acao.acao_pendente == "agendar"
+    assert acao.data == "2026-10-23"
+    assert "horário" in acao.resposta_whatsapp
+
+
+def test_reagendar_completa_com_o_id_pendente():
+    conversa = Conversa("5562999999999", pendente={"action": "reagendar", "id_compromisso": 7})
+    acao = preencher_pendente(conversa, "amanhã 8h", AGORA)
+    assert (acao.action, acao.id_compromisso) == ("reagendar", 7)
+    assert acao.data_hora == datetime(2026, 10, 20, 8, 0)
+
+
+@pytest.mark.parametrize("texto", [
+    "qual minha agenda amanhã?",
+    "esquece, marca almoço às 13h",
+    "obrigado",
+])
+def test_outros_pedidos_vao_para_a_ia(texto):
+    assert preencher_pendente(_conversa(), texto, AGORA) is None
+
+
+def test_sem_pendente_ou_reagendar_sem_id():
+    assert preencher_pendente(Conversa("1"), "às 15h", AGORA) is None
+    assert preencher_pendente(Conversa("1", pendente={"action": "reagendar"}), "às 15h", AGORA) is None
+
+
+def test_nao_altera_o_pendente_da_conversa():
+    conversa = _conversa()
+    preencher_pendente(conversa, "sexta", AGORA)
+    assert "data" not in conversa.pendente
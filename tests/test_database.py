@@ -0,0 +1,39 @@
+from datetime import datetime
+
+import pytest
+
+import database
+
+
+def _criar(db):
+    return database.create_compromisso(db, "Dentista", datetime(2026, 10, 20, 15, 0), None, 30)
+
+
+def test_update_incrementa_a_versao(db):
+    compromisso = _criar(db)
+    assert compromisso.version == 1
+    atualizado = database.update_compromisso(db, compromisso.id, {"titulo": "Ortodontista"}, versao_esperada=1)
+    assert (atualizado.titulo, atualizado.version) == ("Ortodontista", 2)
+
+
+def test_versao_desatualizada_levanta_conflito(db):
+    compromisso = _criar(db)
+    versao_lida = compromisso.version
+    # Outro processo altera entre a leitura e a escrita
+    database.update_compromisso(db, compromisso.id, {"data_hora": datetime(2026, 10, 21, 9, 0)})
+
+    with pytest.raises(database.ConflitoVersao):
+        database.update_compromisso(db, compromisso.id, {"data_hora": datetime(2026, 10, 22, 9, 0)},
+                                    versao_esperada=versao_lida)
+    atual = database.get_compromisso_por_id(db, compromisso.id)
+    assert (atual.data_hora, atual.version) == (datetime(2026, 10, 21, 9, 0), 2)
+
+
+def test_sem_versao_esperada_a_ultima_escrita_vence(db):
+    compromisso = _criar(db)
+    database.update_compromisso(db, compromisso.id, {"titulo": "A"})
+    assert database.update_compromisso(db, compromisso.id, {"titulo": "B"}).version == 3
+
+
+def test_compromisso_inexistente(db):
+    assert database.update_compromisso(db, 999, {"titulo": "X"}, versao_esperada=1) is None
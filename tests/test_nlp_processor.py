@@ -0,0 +1,93 @@
+from datetime import datetime
+
+import pytest
+
+from nlp_processor import DURACAO_PADRAO, parse_action
+
+AGORA = datetime(2026, 10, 19, 10, 0)  # segunda-feira
+
+
+def test_data_relativa_resolvida_localmente():
+    acao = parse_action({"action": "marcar", "titulo": "Dentista", "data_hora": "amanhã às 15h"}, AGORA)
+    assert acao.action == "agendar"
+    assert acao.data_hora == datetime(2026, 10, 20, 15, 0)
+
+
+@pytest.mark.parametrize("texto, esperado", [
+    ("sexta 9h30", datetime(2026, 10, 23, 9, 30)),
+    ("27/10 às 15 horas", datetime(2026, 10, 27, 15, 0)),
+    ("hoje 18hrs", datetime(2026, 10, 19, 18, 0)),
+    ("2026-10-21T14:00:00-03:00", datetime(2026, 10, 21, 14, 0)),
+    ("2026-10-21T17:00:00Z", datetime(2026, 10, 21, 14, 0)),
+])
+def test_formatos_de_data_hora(texto, esperado):
+    assert parse_action({"action": "agendar", "titulo": "X", "data_hora": texto}, AGORA).data_hora == esperado
+
+
+@pytest.mark.parametrize("valor, esperado", [
+    (45, 45),
+    ("90", 90),
+    ("1h30", 90),
+    ("2 horas", 120),
+    ("45 min", 45),
+    ("meia hora", 30),
+    ("1 hora e meia", 90),
+    (None, DURACAO_PADRAO),
+    ("uns minutinhos", DURACAO_PADRAO),
+    (2, DURACAO_PADRAO),       # abaixo do mínimo
+    (5000, DURACAO_PADRAO),    # acima de um dia
+])
+def test_duracao_consertada(valor, esperado):
+    acao = parse_action({"action": "agendar", "titulo": "X", "data_hora": "2026-10-20 15:00", "duracao": valor}, AGORA)
+    assert acao.duracao == esperado
+
+
+@pytest.mark.parametrize("valor, esperado", [(7, 7), ("7", 7), ("ID 42", 42), ("#13", 13), (0, None), (True, None)])
+def test_id_consertado(valor, esperado):
+    acao = parse_action({"action": "agendar", "titulo": "X", "data_hora": "2026-10-20 15:00",
+                         "id_compromisso": valor}, AGORA)
+    assert acao.id_compromisso == esperado
+
+
+def test_json_em_texto_e_bytes():
+    bruto = '{"action": "consultar", "data_hora": "2026-10-20"}'
+    for entrada in (bruto, bruto.encode()):
+        acao = parse_action(entrada, AGORA)
+        assert acao.action == "consultar"
+        assert acao.data_hora == datetime(2026, 10, 20)
+
+
+def test_saida_que_nao_e_objeto():
+    with pytest.raises(ValueError):
+        parse_action("[1, 2]", AGORA)
+
+
+def test_agendar_sem_data_pede_a_data():
+    acao = parse_action({"action": "agendar", "titulo": "Reunião"}, AGORA)
+    assert acao.action == "erro"
+    assert acao.acao_pendente == "agendar"
+    assert "Reunião" in acao.resposta_whatsapp
+
+
+def test_agendar_so_com_data_guarda_a_data_e_pede_o_horario():
+    acao = parse_action({"action": "agendar", "titulo": "Reunião", "data_hora": "sexta", "duracao": 30}, AGORA)
+    assert acao.action == "erro"
+    assert acao.acao_pendente == "agendar"
+    assert acao.data == "2026-10-23"
+    assert acao.hora is None and acao.data_hora is None
+    assert acao.duracao == 30
+    assert "horário" in acao.resposta_whatsapp
+
+
+def test_reagendar_sem_id_guarda_data_e_hora():
+    acao = parse_action({"action": "reagendar", "data_hora": "amanhã 16h"}, AGORA)
+    assert acao.action == "erro"
+    assert acao.acao_pendente == "reagendar"
+    assert (acao.data, acao.hora) == ("2026-10-20", "16:00")
+    assert acao.data_hora is None
+
+
+def test_cancelar_sem_id_pede_o_id():
+    acao = parse_action({"action": "cancelar"}, AGORA)
+    assert (acao.action, acao.acao_pendente) == ("erro", "cancelar")
+    assert "ID" in acao.resposta_whatsapp
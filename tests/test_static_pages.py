@@ -0,0 +1,49 @@
+import pytest
+from starlette.requests import Request
+
+import static_pages
+
+
+def _request(**headers):
+    return Request({
+        "type": "http", "method": "GET", "path": "/",
+        "headers": [(nome.replace("_", "-").encode(), valor.encode()) for nome, valor in headers.items()],
+    })
+
+
+ENCODINGS = [("br", "br"), ("gzip", "gzip"), ("identity", "")]
+
+
+@pytest.mark.parametrize("encoding, accept", ENCODINGS)
+def test_if_none_match_devolve_304_por_encoding(encoding, accept):
+    if encoding not in static_pages._paginas["index.html"]:
+        pytest.skip(f"{encoding} indisponível (pacote brotli não instalado)")
+    primeira = static_pages.responder(_request(accept_encoding=accept), "index.html")
+    assert primeira.status_code == 200
+    assert primeira.headers.get("content-encoding", "identity") == encoding
+    etag = primeira.headers["etag"]
+
+    segunda = static_pages.responder(_request(accept_encoding=accept, if_none_match=etag), "index.html")
+    assert segunda.status_code == 304
+    assert segunda.body == b""
+    assert segunda.headers["etag"] == etag
+
+    fraca = static_pages.responder(_request(accept_encoding=accept, if_none_match=f"W/{etag}"), "index.html")
+    assert fraca.status_code == 304
+
+
+def test_etag_de_outra_representacao_nao_bate():
+    gzip_etag = static_pages._paginas["index.html"]["gzip"][1]
+    resposta = static_pages.responder(_request(accept_encoding="", if_none_match=gzip_etag), "index.html")
+    assert resposta.status_code == 200
+    assert resposta.headers["etag"] != gzip_etag
+
+
+def test_representacoes_tem_etags_distintos():
+    etags = [etag for _, etag in static_pages._paginas["index.html"].values()]
+    assert len(set(etags)) == len(etags)
+
+
+def test_q_zero_recusa_o_encoding():
+    resposta = static_pages.responder(_request(accept_encoding="gzip;q=0, br;q=0"), "index.html")
+    assert "content-encoding" not in resposta.headers
@@ -0,0 +1,103 @@
+# warmup.py - Aquecimento em segundo plano após a inicialização do app
+#
+# O processo começa a aceitar conexões imediatamente; em paralelo, esta
+# thread aplica o schema (se AUTO_MIGRATE=1), abre conexões do pool do banco
+# e prepara os clientes HTTP (OpenAI, Graph API, Calendar). Falhas do banco
+# são tentadas de novo com backoff em vez de derrubar o processo; enquanto o
+# banco não for alcançado a instância não fica pronta (/readyz responde 503).
+
+import os
+import threading
+import time
+
+AUTO_MIGRATE = os.getenv("AUTO_MIGRATE", "1") == "1"
+# Quantas conexões do pool abrir antecipadamente
+WARMUP_DB_CONNECTIONS = int(os.getenv("WARMUP_DB_CONNECTIONS", "2"))
+# Tempo máximo (s) de cada rodada de tentativas de alcançar o banco; depois
+# dele o warm-up segue para as outras etapas e o banco é tentado de novo
+WARMUP_DB_TIMEOUT = float(os.getenv("WARMUP_DB_TIMEOUT", "120"))
+
+_pronto = threading.Event()
+_thread = None
+_status = {"iniciado_em": None, "concluido_em": None, "etapas": {}}
+
+
+def _etapa(nome: str, fn):
+    """Executa uma etapa registrando duração e erro (sem propagar)."""
+    start = time.perf_counter()
+    try:
+        fn()
+        _status["etapas"][nome] = {"ok": True, "segundos": round(time.perf_counter() - start, 3)}
+        return True
+    except Exception as e:
+        _status["etapas"][nome] = {"ok": False, "erro": str(e),
+                                   "segundos": round(time.perf_counter() - start, 3)}
+        print(f"LOG (Warm-up): Falha na etapa {nome}: {e}", flush=True)
+        return False
+
+
+def _preparar_banco():
+    import database
+    import migrate
+
+    deadline = time.monotonic() + WARMUP_DB_TIMEOUT
+    espera = 0.5
+    while True:
+        try:
+            if AUTO_MIGRATE:
+                migrate.run_migrations()
+            conexoes = [database.engine.connect() for _ in range(WARMUP_DB_CONNECTIONS)]
+            for conexao in conexoes:
+                conexao.close()  # Devolve ao pool já estabelecidas
+            return
+        except Exception as e:
+            if time.monotonic() + espera > deadline:
+                raise
+            print(f"LOG (Warm-up): Banco indisponível ({e}); nova tentativa em {espera:.1f}s", flush=True)
+            time.sleep(espera)
+            espera = min(espera * 2, 10)
+
+
+def _iniciar_cache_bus():
+    import cache_bus
+    cache_bus.start()
+
+
+def _preparar_clientes():
+    import ai_service
+    import google_calendar_service
+    import whatsapp_api
+
+    ai_service.get_client()
+    whatsapp_api.warm_up()
+    google_calendar_service.warm_up()
+
+
+def _run():
+    _status["iniciado_em"] = time.time()
+    _etapa("banco", _preparar_banco)
+    _etapa("cache_bus", _iniciar_cache_bus)
+    _etapa("clientes_http", _preparar_clientes)
+    _status["concluido_em"] = time.time()
+    _pronto.set()
+    print(f"LOG (Warm-up): Concluído em {_status['concluido_em'] - _status['iniciado_em']:.2f}s", flush=True)
+    # Sem banco a instância não fica pronta: continua tentando em segundo plano
+    while not _status["etapas"]["banco"]["ok"]:
+        _etapa("banco", _preparar_banco)
+
+
+def start():
+    """Dispara o warm-up em uma thread daemon (uma única vez por processo)."""
+    global _thread
+    if _thread is None:
+        _thread = threading.Thread(target=_run, name="warmup", daemon=True)
+        _thread.start()
+
+
+def is_ready() -> bool:
+    """Warm-up concluído e banco alcançado."""
+    return _pronto.is_set() and _status["etapas"].get("banco", {}).get("ok", False)
+
+
+def status() -> dict:
+    return dict(_status, pronto=is_ready())
@@ -1,12 +1,38 @@
 import os
+import threading
 import requests
 import json
+import metrics
 
 # --- Configurações via Variáveis de Ambiente ---
 # No Render, você configurará estas chaves
 WHATSAPP_TOKEN = os.getenv("WHATSAPP_TOKEN")
 PHONE_NUMBER_ID = os.getenv("PHONE_NUMBER_ID")
 VERSION = "v21.0" # Versão atual da API da Meta
+# Permite apontar para um servidor local (benchmarks/testes offline)
+GRAPH_API_BASE_URL = os.getenv("GRAPH_API_BASE_URL", "https://graph.facebook.com").rstrip("/")
+
+# Sessão HTTP compartilhada: reaproveita conexões TLS com a Graph API (keep-alive)
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session() -> requests.Session:
+    """Retorna a sessão HTTP compartilhada, criando-a no primeiro uso."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = requests.Session()
+    return _session
+
+
+def warm_up():
+    """Abre antecipadamente a conexão com a Graph API (chamado pelo warm-up)."""
+    try:
+        get_session().get(f"{GRAPH_API_BASE_URL}/{VERSION}/", timeout=5)
+    except requests.RequestException as e:
+        print(f"LOG (WhatsApp): Pré-conexão com a Graph API falhou: {e}", flush=True)
 
 def send_whatsapp_message(to_number: str, message_body: str):
     """
@@ -16,7 +42,7 @@ def send_whatsapp_message(to_number: str, message_body: str):
         print("ERRO: WHATSAPP_TOKEN ou PHONE_NUMBER_ID não configurados.", flush=True)
         return False
 
-    url = f"https://graph.facebook.com/{VERSION}/{PHONE_NUMBER_ID}/messages"
+    url = f"{GRAPH_API_BASE_URL}/{VERSION}/{PHONE_NUMBER_ID}/messages"
     
     headers = {
         "Authorization": f"Bearer {WHATSAPP_TOKEN}",
@@ -32,17 +58,20 @@ def send_whatsapp_message(to_number: str, message_body: str):
         }
     }
 
-    try:
-        response = requests.post(url, headers=headers, json=payload)
-        response_data = response.json()
-        
-        if response.status_code == 200:
-            print(f"LOG (WhatsApp): Mensagem enviada com sucesso para {to_number}", flush=True)
-            return True
-        else:
-            print(f"LOG (WhatsApp Erro): {json.dumps(response_data)}", flush=True)
+    with metrics.timed("graph_api") as timer:
+        try:
+            response = get_session().post(url, headers=headers, json=payload, timeout=30)
+            response_data = response.json()
+
+            if response.status_code == 200:
+                print(f"LOG (WhatsApp): Mensagem enviada com sucesso para {to_number}", flush=True)
+                return True
+            else:
+                timer.fail()
+                print(f"LOG (WhatsApp Erro): {json.dumps(response_data)}", flush=True)
+                return False
+
+        except Exception as e:
+            timer.fail()
+            print(f"LOG (WhatsApp Exception): {e}", flush=True)
             return False
-            
-    except Exception as e:
-        print(f"LOG (WhatsApp Exception): {e}", flush=True)
-        return False